@@ -7,20 +7,18 @@ Created on 23.10.2019
 
 import os
 import click
-import importer, processor
-from featurefinder import FeatureFinder
+import processor, runner, binary, inputs, server, writer, shards, fitting, resampling, benchmark as bench
+from cache import FeatureCache
+from segmenter import Segmenter
+from profiler import Profiler, NULL_PROFILER
+from featurefinder import FeatureFinder, read_scaling_profile, write_scaling_profile
 from corpus import Corpus
+from registry import importers, processors
 from ast import literal_eval
 
-##############
-
-importers = {"conlluplus" : importer.CoNLLUPlusImporter,
-             "conll2000" : importer.CoNLL2000Importer}
-
-processors = {"pronounlemmatizer" : processor.PronounLemmatizer, "bracketremover" : processor.BracketRemover,
-              "ellipsisremover" : processor.EllipsisRemover}
+__version__ = "1.0.0"
 
-#########################################
+##############
 
 def get_input_files(ctx, parameter, vals):
     """
@@ -32,8 +30,12 @@ def get_input_files(ctx, parameter, vals):
     for v in vals:
         v = os.path.normpath(v)
 
+        #Archive
+        if os.path.isfile(v) and inputs.is_archive(v):
+            files.extend(inputs.list_members(v))
+
         #File
-        if os.path.isfile(v):
+        elif os.path.isfile(v):
             files.append(v)
 
         #Folder
@@ -41,8 +43,12 @@ def get_input_files(ctx, parameter, vals):
             for f in os.listdir(v):
                 f = os.path.join(v, f)
 
+                #Archive
+                if os.path.isfile(f) and inputs.is_archive(f):
+                    files.extend(inputs.list_members(f))
+
                 #File
-                if os.path.isfile(f):
+                elif os.path.isfile(f):
                     files.append(f)
 
                 #Folder
@@ -194,23 +200,78 @@ def add_component(ctx, parameter, value):
 
 def set_output_mode(ctx, parameter, mode):
 
-    if isinstance(mode, str) and mode.lower() == "true":
+    #Click converts the value to bool because the default is False
+    if mode is True:
+        return True
+    elif isinstance(mode, str) and mode.lower() == "true":
         return True
     else:
         return False
 
 #########################################
 
-def file_exists(file):
+def get_shard(ctx, parameter, value):
+    """
+    Input: Shard as string i/N
+    Output: Tuple of shard number and number of shards or None
+    """
+    if value is None:
+        return None
     try:
-        if not os.path.isfile(file):
-            raise FileNotFoundError
+        shard, n_shards = [int(v) for v in value.split("/")]
+    except ValueError:
+        raise click.BadParameter("Shard must be given as i/N, e.g. 1/4.")
+    if not 1 <= shard <= n_shards:
+        raise click.BadParameter("Shard number must be between 1 and {0}.".format(n_shards))
+    return shard, n_shards
+
+#########################################
+
+def show_throughput(profiler):
+    """
+    Input: Profiler
+    Output: Function that shows the current throughput in the progress bar or None
+    """
+    if not profiler.enabled:
+        return None
+    return lambda item : "{0:.0f} tokens/s".format(profiler.get_throughput())
 
-    #If file does not exist, skip it.        
-    except FileNotFoundError:
-        print("ERROR: File %s not found." % (file))
+#########################################
+
+def write_raw_row(raw_output, finder, filename, stats_table):
+    """
+    Write the original values of a file.
+    With a scaling profile, the orality score of the file is added.
+    Input: Writer, FeatureFinder, filename and stats table of the file
+    """
+    row = {"file" : os.path.splitext(filename)[0]}
+    row.update(stats_table)
+    if finder.scaling is not None:
+        row["orality_score"] = finder.calculate_score(finder.scale_feature_values({filename : stats_table}))[filename]["orality_score"]
+    raw_output.write_row(row)
+
+#########################################
+
+def set_scaling(finder, file, processors=None):
+    """
+    Scale the results with the min and max values of a scaling profile.
+    Input: FeatureFinder, filename of the scaling profile
+           and list of processors (None = do not compare)
+    Output: True if the profile could be read, False otherwise.
+    """
+    ranges, settings = read_scaling_profile(file)
+    if ranges is None:
         return False
-    
+
+    for feat in finder.stats:
+        if not feat in ranges:
+            print("WARNING: Feature {0} is not in the scaling profile. Values are scaled across the input files.".format(feat))
+
+    if processors is not None and "processors" in settings \
+        and settings["processors"] != [type(p).__name__ for p in processors]:
+        print("WARNING: Scaling profile was created with other processors: {0}".format(", ".join(settings["processors"]) or "none"))
+
+    finder.scaling = ranges
     return True
 
 #########################################
@@ -224,8 +285,10 @@ def cli():
 @cli.command(context_settings={"ignore_unknown_options": True})
 @click.argument("f", nargs=-1, callback=get_input_files) #Input file or folder
 @click.argument("out", nargs=1, callback=get_output_dir) #Output folder
-@click.option("-i", "--importer", required=True, type=click.Choice(["conlluplus", "conll2000"], case_sensitive=False),
+@click.option("-i", "--importer", required=True, type=click.Choice(["conlluplus", "conll2000", "coast"], case_sensitive=False),
                                   help="Importer for input file format.", callback=add_component)
+@click.option("-r", "--reader", default="text", type=click.Choice(["text", "mmap"], case_sensitive=False),
+                                help="Read input files line by line or as memory-mapped blocks.")
 @click.option("-p", "--processors", help="Specify a list of processors in order of application. Processors must be surrounded by single quotes and the list by double quotes.", 
                                     callback=add_component)
 @click.option("-f", "--features", default="./../config/features.config", 
@@ -234,6 +297,54 @@ def cli():
                                  help="File specifying the weights for calculating the orality score.", callback=set_weights)
 @click.option("--reproduce-kajuk", default=False, 
                                    help="If True, reproduce the results of Ortmann & Dipper (2022).", callback=set_output_mode)
+@click.option("-e", "--engine", default="fused", type=click.Choice(["fused", "reference", "numpy"], case_sensitive=False),
+                                help="Implementation used to compute the features.")
+@click.option("--stream", default=False,
+                          help="If True, analyze sentences while reading and do not keep documents in memory.", callback=set_output_mode)
+@click.option("-j", "--jobs", default=1, type=int,
+                              help="Number of worker processes. Use 0 for all available CPUs.")
+@click.option("--batch-size", default=4194304, type=int,
+                              help="Number of bytes of input files that are sent to a worker process at once.")
+@click.option("--cache-dir", default=None,
+                             help="Folder to cache results, so that unchanged files are not analyzed again.")
+@click.option("--cache-size", default=1024, type=int,
+                              help="Maximum size of the cache in MB. Least recently used results are removed first.")
+@click.option("--window", default=0, type=int,
+                          help="Also score windows of this many sentences or words within each file.")
+@click.option("--stride", default=0, type=int,
+                          help="Number of sentences or words the window moves on. Default is the window size.")
+@click.option("--window-unit", default="sentences", type=click.Choice(["sentences", "words"], case_sensitive=False),
+                               help="Unit of window size and stride.")
+@click.option("--segment-column", default=None,
+                                  help="Also score the segments with the same value in this column, e.g. page.")
+@click.option("--pipelined", default=False,
+                             help="If True, read the next files while analyzing the current file.", callback=set_output_mode)
+@click.option("--prefetch", default=4, type=int,
+                            help="Maximum number of files that are read in advance in pipelined mode.")
+@click.option("--memo-size", default=10000, type=int,
+                             help="Number of processor results (e.g. normalized word forms) to keep in memory for repeated forms. Use 0 to switch off.")
+@click.option("--memo-file", default=None,
+                             help="File to load processor results from and save them to, so that they can be reused in the next run.")
+@click.option("--profile", default=False,
+                           help="If True, record the time of each stage and file and save it to profile.json.", callback=set_output_mode)
+@click.option("--output-format", default="tsv", type=click.Choice(["tsv", "jsonl", "parquet"], case_sensitive=False),
+                                 help="Format of the result files. Parquet requires pyarrow.")
+@click.option("--raw-output", default=False,
+                              help="If True, write the original values of each file to results_raw as soon as it is analyzed.", callback=set_output_mode)
+@click.option("--scaling-profile", default=None,
+                                   help="Scale and score with the min and max values saved by the calibrate command instead of the values of the input files.")
+@click.option("--shard", default=None, callback=get_shard,
+                         help="Only analyze shard i of N (e.g. 1/4) and save the original values for the merge command.")
+@click.option("--bootstrap", default=0, type=int,
+                             help="Number of bootstrap replicates (resampled sentences) per file for confidence intervals of the features and orality scores. Requires numpy.")
+@click.option("--confidence", default=0.95, type=float,
+                              help="Confidence level of the bootstrap intervals.")
+@click.option("--permutations", default=0, type=int,
+                                help="Number of permutations to test the differences of the features between two groups of files. Requires numpy.")
+@click.option("--group-column", default="oral",
+                                help="Column of the results with the two groups for permutation tests, e.g. oral with --reproduce-kajuk True.")
+@click.option("--seed", default=0, type=int,
+                        help="Random seed for bootstrap and permutation tests.")
 def analyze(f, out, **kwargs):
     """
     Analyze input files with respect to conceptual orality.
@@ -266,33 +377,756 @@ def analyze(f, out, **kwargs):
                                 "PTC" : 0.104, 
                                 "lexDens" : -0}
     
-    finder = FeatureFinder(kwargs.get("features", []), kwargs.get("weights", {}))
-    corpus = Corpus()
+    finder = FeatureFinder(kwargs.get("features", []), kwargs.get("weights", {}), kwargs.get("engine", "fused").lower())
+    finder.output_format = writer.get_format(kwargs.get("output_format", "tsv").lower())
     results = dict()
 
+    #Scale with the values of a reference corpus
+    if kwargs.get("scaling_profile", None):
+        if not set_scaling(finder, kwargs["scaling_profile"], kwargs["processors"]):
+            return None
+
+    #Only analyze the files of one shard and save their original values
+    shard_writer = None
+    if kwargs.get("shard", None):
+        files = [file for file in files if shards.in_shard(file, *kwargs["shard"])]
+        shard_writer = shards.ShardWriter(out, *kwargs["shard"])
+
+    #Write the original values of each file as soon as it is analyzed
+    raw_output = None
+    if kwargs.get("raw_output", False):
+        raw_columns = ["file"] + finder.stats
+        if finder.scaling is not None:
+            raw_columns.append("orality_score")
+        raw_output = writer.get_writer(finder.output_format, os.path.join(out, "results_raw"),
+                                       raw_columns, finder.stats + ["orality_score"], flush_rows=True)
+
+    #Score segments within files
+    segmenter = None
+    if kwargs.get("segment_column", None):
+        if kwargs.get("window", 0) > 0:
+            print("WARNING: Both window and segment column given. Using segment column.")
+        segmenter = Segmenter(finder, column=kwargs["segment_column"])
+    elif kwargs.get("window", 0) > 0:
+        segmenter = Segmenter(finder, kwargs["window"], kwargs.get("stride", 0), kwargs.get("window_unit", "sentences").lower())
+    segment_results = dict()
+
+    #Resample the sentences of each file
+    sampler = None
+    if kwargs.get("bootstrap", 0) > 0:
+        if resampling.np is None:
+            print("WARNING: NumPy is not installed. Bootstrap is skipped.")
+        elif shard_writer is not None:
+            print("WARNING: Bootstrap is not available for shards and is skipped.")
+        else:
+            sampler = resampling.Resampler(finder, kwargs["bootstrap"], kwargs.get("confidence", 0.95), kwargs.get("seed", 0))
+    bootstrap_results = dict()
+
+    columns = list(finder.columns)
+    if segmenter is not None and segmenter.column:
+        columns.append(segmenter.column)
+    memo_processors = runner.setup_importer(kwargs["importer"], kwargs["processors"], columns, kwargs.get("memo_size", 0))
+    kwargs["importer"].reader = kwargs.get("reader", "text").lower()
+
+    if memo_processors and kwargs.get("memo_file", None) and os.path.isfile(kwargs["memo_file"]):
+        processor.read_memo_file(kwargs["memo_file"], memo_processors, __version__)
+
+    stream = kwargs.get("stream", False)
+
+    if kwargs.get("cache_dir", None):
+        cache = FeatureCache(kwargs["cache_dir"], kwargs["cache_size"] * 1024**2, __version__)
+    else:
+        cache = None
+
+    jobs = kwargs.get("jobs", 1)
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    if kwargs.get("profile", False):
+        profiler = Profiler()
+    else:
+        profiler = NULL_PROFILER
+
+    #Analyze files in parallel
+    if jobs > 1 and len(files) > 1:
+
+        #Make batches small enough to keep all processes busy
+        total_size = sum(inputs.get_size(file) for file in files if os.path.isfile(inputs.split_path(file)[0]))
+        batch_size = max(1, min(kwargs.get("batch_size"), total_size // (jobs * 4)))
+        batches = runner.get_batches(files, batch_size)
+
+        with click.progressbar(length=len(files), label="Analyzing texts:", item_show_func=show_throughput(profiler)) as bar:
+            for batch, batch_results in runner.analyze_parallel(batches, kwargs["importer"], kwargs["processors"], finder, jobs,
+                                                                stream, cache, segmenter, profiler,
+                                                                bool(kwargs.get("memo_file", None)), sampler):
+                for filename, stats_table, segments, bootstrap in batch_results:
+                    results[filename] = stats_table
+                    if bootstrap is not None:
+                        bootstrap_results[filename] = bootstrap
+                    if raw_output is not None:
+                        write_raw_row(raw_output, finder, filename, stats_table)
+                    if shard_writer is not None:
+                        shard_writer.write(filename, stats_table)
+                    if segments:
+                        segment_results.update(segments)
+                        if shard_writer is not None:
+                            shard_writer.write_segments(segments)
+                bar.update(len(batch), batch[-1])
+
+            #Shards are scaled and scored by the merge command
+            if shard_writer is None:
+                profiler.start("output_stats")
+                finder.output_stats(results, out, kwargs.get("reproduce_kajuk", False))
+                profiler.stop()
+
     #For all files
-    with click.progressbar(files, label="Analyzing texts:") as files:
+    else:
+        corpus = Corpus()
+        profiler.attach(finder, kwargs["importer"])
+
+        args = (kwargs["importer"], kwargs["processors"], finder, stream, cache, segmenter, profiler)
+
+        #Read, analyze and output files at the same time
+        if kwargs.get("pipelined", False):
+            analyzed = runner.analyze_pipelined(files, *args, prefetch=kwargs.get("prefetch", 4), sampler=sampler)
+        else:
+            analyzed = ((file, runner.analyze_file(file, *args, sampler=sampler)) for file in files)
+
+        with click.progressbar(analyzed, length=len(files), label="Analyzing texts:", item_show_func=show_throughput(profiler)) as analyzed:
+            for file, doc in analyzed:
+
+                #Skip non-existing or invalid files
+                if doc is None:
+                    continue
+
+                #Only keep documents if they are not streamed
+                if not stream:
+                    corpus.add_file(doc)
+
+                results[doc.filename] = doc.stats_table
+                if sampler is not None and doc.bootstrap is not None:
+                    bootstrap_results[doc.filename] = doc.bootstrap
+                if raw_output is not None:
+                    write_raw_row(raw_output, finder, doc.filename, doc.stats_table)
+                if shard_writer is not None:
+                    shard_writer.write(doc.filename, doc.stats_table)
+                if segmenter is not None:
+                    segment_results.update(doc.segment_results)
+                    if shard_writer is not None:
+                        shard_writer.write_segments(doc.segment_results)
+
+            #Shards are scaled and scored by the merge command
+            if shard_writer is None:
+                profiler.start("output_stats")
+                finder.output_stats(results, out, kwargs.get("reproduce_kajuk", False))
+                profiler.stop()
+
+    if raw_output is not None:
+        raw_output.close()
+
+    if shard_writer is not None:
+        shard_writer.close(finder, results, segment_results, version=__version__,
+                           reproduce_kajuk=kwargs.get("reproduce_kajuk", False),
+                           processors=[type(p).__name__ for p in kwargs["processors"]],
+                           segment_columns=segmenter.columns if segmenter is not None else None)
+        print("Shard {0} of {1} saved to {2}".format(shard_writer.shard, shard_writer.n_shards, shard_writer.file + ".jsonl"))
+
+    #Output results of segments
+    elif segmenter is not None and segment_results:
+        profiler.start("output_segments")
+        finder.write_results(segment_results, segmenter.columns + finder.stats, out, "results_segments")
+        profiler.stop()
+
+    #Output bootstrap intervals and permutation tests
+    if bootstrap_results:
+        profiler.start("output_bootstrap")
+        sampler.output_results(results, bootstrap_results, out)
+        profiler.stop()
+
+    if kwargs.get("permutations", 0) > 0 and shard_writer is not None:
+        print("WARNING: Permutation tests are not available for shards. Run them with merge --permutations.")
+    elif kwargs.get("permutations", 0) > 0 and results:
+        if resampling.np is None:
+            print("WARNING: NumPy is not installed. Permutation tests are skipped.")
+        else:
+            profiler.start("permutation_test")
+            resampling.output_permutation_test(finder, results, kwargs.get("group_column", "oral"), out,
+                                               kwargs["permutations"], kwargs.get("seed", 0))
+            profiler.stop()
+
+    if profiler.enabled:
+        profiler.write(os.path.join(out, "profile.json"), version=__version__, engine=finder.engine, jobs=jobs, stream=stream,
+                       processors=[type(p).__name__ for p in kwargs["processors"]])
+        print("Profile saved to", os.path.join(out, "profile.json"))
+
+    if cache is not None:
+        print("Cache: {0} files analyzed, {1} files from cache.".format(cache.misses, cache.hits))
+        cache.evict()
+
+    for p in memo_processors:
+        print("Memo {0}: {1} hits, {2} misses.".format(type(p).__name__, p.memo.hits, p.memo.misses))
+    if memo_processors and kwargs.get("memo_file", None):
+        processor.write_memo_file(kwargs["memo_file"], memo_processors, __version__)
+
+##############################
+
+@cli.command(context_settings={"ignore_unknown_options": True})
+@click.argument("f", nargs=-1, callback=get_input_files) #Input file or folder
+@click.argument("out", nargs=1, callback=get_output_dir) #Output folder
+@click.option("-i", "--importer", required=True, type=click.Choice(["conlluplus", "conll2000"], case_sensitive=False),
+                                  help="Importer for input file format.", callback=add_component)
+@click.option("-r", "--reader", default="text", type=click.Choice(["text", "mmap"], case_sensitive=False),
+                                help="Read input files line by line or as memory-mapped blocks.")
+@click.option("-p", "--processors", help="Specify a list of processors in order of application. Processors must be surrounded by single quotes and the list by double quotes.", 
+                                    callback=add_component)
+@click.option("-c", "--columns", help="List of additional columns to store, e.g. \"['page']\". The columns needed by the features are always stored.")
+def convert(f, out, **kwargs):
+    """
+    Import and process input files once and store them in a binary format
+    that can be analyzed with the importer coast.
+    """
+    #Get input file(s)
+    files = f
+    if not files:
+        return None
+
+    #Get output directory
+    if not out:
+        return None
+
+    #Store the columns of all processors, so that they can also be applied to the converted files
+    columns = list(FeatureFinder.columns)
+    for p in processors.values():
+        columns.extend(col for col in p.columns if not col in columns)
+    for col in read_list(kwargs.get("columns", None)):
+        if not col in columns:
+            columns.append(col)
+
+    #Only import the columns that are stored or needed by the processors
+    runner.setup_importer(kwargs["importer"], kwargs["processors"], columns)
+    kwargs["importer"].reader = kwargs.get("reader", "text").lower()
+
+    with click.progressbar(files, label="Converting texts:") as files:
         for file in files:
-            
+
             #Skip non-existing files
-            if not file_exists(file):
+            if not runner.file_exists(file):
                 continue
 
             doc = kwargs["importer"].import_file(file)
-            
-            for p in kwargs["processors"]:
-                doc = p.process(doc)
 
-            corpus.add_file(doc)
+            #Skip invalid files
+            if doc is None:
+                continue
+
+            #Only store columns that exist in the input file
+            tok = next((sent.tokens[0] for sent in doc.sentences if sent.tokens), None)
+            doc_columns = [col for col in columns if tok is None or hasattr(tok, col)]
 
-            finder.find_features(doc)
+            binary.write_doc(doc, binary.get_output_file(file, out), doc_columns, kwargs["processors"])
 
-            doc = finder.compute_stats(doc)
-            
-            results[doc.filename] = doc.stats_table
-        
-        finder.output_stats(results, out, kwargs.get("reproduce_kajuk", False))
+##############################
 
+@cli.command(context_settings={"ignore_unknown_options": True})
+@click.argument("f", nargs=-1, callback=get_input_files) #Input file or folder
+@click.option("-i", "--importer", default="conlluplus", type=click.Choice(["conlluplus", "conll2000", "coast"], case_sensitive=False),
+                                  help="Importer for input file format.", callback=add_component)
+@click.option("-p", "--processors", default="['ellipsisremover', 'bracketremover', 'pronounlemmatizer']",
+                                    help="Specify a list of processors in order of application. Processors must be surrounded by single quotes and the list by double quotes.", 
+                                    callback=add_component)
+@click.option("-e", "--engine", default="fused", type=click.Choice(["fused", "reference", "numpy"], case_sensitive=False),
+                                help="Implementation used to compute the features.")
+@click.option("-s", "--scale", default=[1], multiple=True, type=int,
+                               help="Analyze each input file this many times. Can be given several times, e.g. -s 1 -s 10 -s 100.")
+@click.option("-n", "--repeat", default=1, type=int,
+                                help="Number of runs per scale. The fastest run is reported.")
+@click.option("--feature-functions", default=True,
+                                     help="If True, also time each feature function of the reference implementation in a separate pass.", callback=set_output_mode)
+@click.option("--memo-size", default=10000, type=int,
+                             help="Number of processor results (e.g. normalized word forms) to keep in memory for repeated forms. Use 0 to switch off.")
+@click.option("-o", "--output", default="benchmark.json",
+                                help="File to save the benchmark results (JSON).")
+@click.option("--compare", default=None,
+                           help="Benchmark results (JSON) of an earlier run to compare with.")
+@click.option("--threshold", default=0.1, type=float,
+                             help="Relative slowdown of a stage that is reported as regression.")
+def benchmark(f, **kwargs):
+    """
+    Measure the run time of each stage of the analysis.
+    By default, the KaJuK files in the data folder are used.
+    """
+    files = f
+    if not files:
+        files = [file for file in get_input_files(None, None, ["./../data"]) if file.endswith(".conllup")]
+    if not files:
+        return None
+
+    finder = FeatureFinder(engine=kwargs.get("engine", "fused").lower())
+
+    #Same importer, pipeline and memos as in analyze
+    runner.setup_importer(kwargs["importer"], kwargs["processors"], finder.columns, kwargs.get("memo_size", 0))
+
+    report = bench.get_environment()
+    report.update({"version" : __version__,
+                   "importer" : type(kwargs["importer"]).__name__,
+                   "processors" : [type(p).__name__ for p in kwargs["processors"]],
+                   "engine" : finder.engine,
+                   "input_files" : len(files),
+                   "scales" : dict()})
+
+    for scale, results in bench.run_scales(files, kwargs["importer"], kwargs["processors"], finder,
+                                           kwargs["scale"], max(1, kwargs["repeat"]), kwargs["feature_functions"]):
+        bench.print_results(scale, results)
+        report["scales"][str(scale)] = results
+
+    bench.write_report(report, kwargs["output"])
+    print("Benchmark results saved to", kwargs["output"])
+
+    if kwargs.get("compare", None):
+        if not runner.file_exists(kwargs["compare"]):
+            return None
+        print()
+        print("Comparison with", kwargs["compare"])
+        bench.print_comparison(bench.compare(bench.read_report(kwargs["compare"]), report, kwargs["threshold"]))
+
+##############################
+
+@cli.command()
+@click.option("-i", "--importer", default="conlluplus", type=click.Choice(["conlluplus", "conll2000"], case_sensitive=False),
+                                  help="Importer for the format of the documents.", callback=add_component)
+@click.option("-p", "--processors", help="Specify a list of processors in order of application. Processors must be surrounded by single quotes and the list by double quotes.", 
+                                    callback=add_component)
+@click.option("-f", "--features", default="./../config/features.config", 
+                                  help="File specifying the list of features to analyze.", callback=get_features)
+@click.option("-w", "--weights", default="./../config/weights.config", 
+                                 help="File specifying the weights for calculating the orality score.", callback=set_weights)
+@click.option("-e", "--engine", default="fused", type=click.Choice(["fused", "reference", "numpy"], case_sensitive=False),
+                                help="Implementation used to compute the features.")
+@click.option("--host", default="127.0.0.1",
+                        help="Address to listen on.")
+@click.option("--port", default=8080, type=int,
+                        help="Port to listen on.")
+@click.option("--socket", "socket_file", default=None,
+                                         help="Listen on this Unix socket instead of a port.")
+@click.option("--memo-size", default=10000, type=int,
+                             help="Number of processor results (e.g. normalized word forms) to keep in memory for repeated forms. Use 0 to switch off.")
+@click.option("--scaling-profile", default=None,
+                                   help="Scale and score with the min and max values saved by the calibrate command instead of the values of each request.")
+@click.option("--max-request-size", default=64, type=int,
+                                    help="Maximum size of a request in MB. Larger requests are rejected.")
+@click.option("--timeout", default=30, type=int,
+                           help="Seconds to wait for a client before the connection is closed. Use 0 to wait without limit.")
+def serve(**kwargs):
+    """
+    Keep COAST loaded and score documents sent over HTTP.
+    """
+    finder = FeatureFinder(kwargs.get("features", []), kwargs.get("weights", {}), kwargs.get("engine", "fused").lower())
+
+    #Scale with the values of a reference corpus
+    if kwargs.get("scaling_profile", None):
+        if not set_scaling(finder, kwargs["scaling_profile"], kwargs["processors"]):
+            return None
+
+    runner.setup_importer(kwargs["importer"], kwargs["processors"], finder.columns, kwargs.get("memo_size", 0))
+
+    scorer = server.Scorer(kwargs["importer"], kwargs["processors"], finder)
+
+    try:
+        httpd = server.make_server(scorer, kwargs["host"], kwargs["port"], kwargs["socket_file"],
+                                   kwargs["max_request_size"] * 1024**2, kwargs["timeout"])
+    except OSError as e:
+        print("ERROR: Cannot start server: {0}".format(e))
+        return None
+
+    if kwargs["socket_file"]:
+        print("Listening on", kwargs["socket_file"])
+    else:
+        print("Listening on http://{0}:{1}".format(kwargs["host"], httpd.server_address[1]))
+    print("Send documents to /score. Stop with Ctrl+C.")
+
+    server.serve(httpd)
+
+##############################
+
+@cli.command(context_settings={"ignore_unknown_options": True})
+@click.argument("f", nargs=-1, callback=get_input_files) #Input file or folder of the reference corpus
+@click.argument("profile", nargs=1) #Output file
+@click.option("-i", "--importer", required=True, type=click.Choice(["conlluplus", "conll2000", "coast"], case_sensitive=False),
+                                  help="Importer for input file format.", callback=add_component)
+@click.option("-p", "--processors", help="Specify a list of processors in order of application. Processors must be surrounded by single quotes and the list by double quotes.", 
+                                    callback=add_component)
+@click.option("-f", "--features", default="./../config/features.config", 
+                                  help="File specifying the list of features to analyze.", callback=get_features)
+@click.option("--reproduce-kajuk", default=False, 
+                                   help="If True, use the processors and features of Ortmann & Dipper (2022).", callback=set_output_mode)
+@click.option("-e", "--engine", default="fused", type=click.Choice(["fused", "reference", "numpy"], case_sensitive=False),
+                                help="Implementation used to compute the features.")
+@click.option("-j", "--jobs", default=1, type=int,
+                              help="Number of worker processes. Use 0 for all available CPUs.")
+def calibrate(f, profile, **kwargs):
+    """
+    Save the min and max value of each feature in a reference corpus
+    to scale and score other files independently of each other.
+    """
+    files = f
+    if not files:
+        return None
+
+    if kwargs.get("reproduce_kajuk", False) == True:
+        print("WARNING: Overwriting settings to reproduce results of Ortmann & Dipper (2022).")
+        kwargs["processors"] = [processors.get("ellipsisremover")(), 
+                                processors.get("bracketremover")(), 
+                                processors.get("pronounlemmatizer")()]
+        kwargs["features"] = FeatureFinder.available_stats
+
+    finder = FeatureFinder(kwargs.get("features", []), engine=kwargs.get("engine", "fused").lower())
+    runner.setup_importer(kwargs["importer"], kwargs["processors"], finder.columns)
+
+    jobs = kwargs.get("jobs", 1)
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    results = dict()
+    with click.progressbar(length=len(files), label="Analyzing texts:") as bar:
+        if jobs > 1 and len(files) > 1:
+            batches = runner.get_batches(files, max(1, sum(inputs.get_size(file) for file in files
+                                                            if os.path.isfile(inputs.split_path(file)[0])) // (jobs * 4)))
+            for batch, batch_results in runner.analyze_parallel(batches, kwargs["importer"], kwargs["processors"], finder, jobs):
+                for filename, stats_table, _, _ in batch_results:
+                    results[filename] = stats_table
+                bar.update(len(batch))
+        else:
+            for file in files:
+                doc = runner.analyze_file(file, kwargs["importer"], kwargs["processors"], finder)
+                if doc is not None:
+                    results[doc.filename] = doc.stats_table
+                bar.update(1)
+
+    if not results:
+        print("ERROR: No files could be analyzed.")
+        return None
+
+    ranges = finder.get_ranges(results)
+    write_scaling_profile(profile, ranges, __version__,
+                          importer=type(kwargs["importer"]).__name__,
+                          processors=[type(p).__name__ for p in kwargs["processors"]],
+                          files=len(results))
+
+    print()
+    for feat, (min_val, max_val) in ranges.items():
+        print("{0:<10} {1:>12.6f} {2:>12.6f}".format(feat, min_val, max_val))
+    print("Scaling profile of {0} files saved to {1}".format(len(results), profile))
+
+##############################
+
+@cli.command()
+@click.argument("shard_dirs", nargs=-1) #Output folders of the shards
+@click.argument("out", nargs=1, callback=get_output_dir) #Output folder
+@click.option("--output-format", default="tsv", type=click.Choice(["tsv", "jsonl", "parquet"], case_sensitive=False),
+                                 help="Format of the result files. Parquet requires pyarrow.")
+@click.option("--permutations", default=0, type=int,
+                                help="Number of permutations to test the differences of the features between two groups of files. Requires numpy.")
+@click.option("--group-column", default="oral",
+                                help="Column of the results with the two groups for permutation tests.")
+@click.option("--seed", default=0, type=int,
+                        help="Random seed for the permutations.")
+def merge(shard_dirs, out, **kwargs):
+    """
+    Combine the shards of an analysis (analyze --shard i/N),
+    scale and score all results and write the result files.
+    """
+    if not out:
+        return None
+
+    shard_data = shards.read_shards(shard_dirs)
+    if shard_data is None:
+        return None
+    settings, results, segment_results, ranges, segment_ranges = shard_data
+
+    finder = FeatureFinder(settings["features"], settings["weights"])
+    finder.output_format = writer.get_format(kwargs.get("output_format", "tsv").lower())
+
+    #Scale with the scaling profile of the analysis or the min and max values of all shards
+    if settings["scaling"] is not None:
+        finder.scaling = {feat : tuple(val) for feat, val in settings["scaling"].items()}
+    else:
+        finder.scaling = shards.merge_ranges(ranges, finder.stats)
+    finder.output_stats(results, out, settings["reproduce_kajuk"])
+
+    #Permutation tests on the combined results, scaled like the results of the files
+    if kwargs.get("permutations", 0) > 0 and results:
+        if resampling.np is None:
+            print("WARNING: NumPy is not installed. Permutation tests are skipped.")
+        elif resampling.output_permutation_test(finder, results, kwargs.get("group_column", "oral"), out,
+                                                kwargs["permutations"], kwargs.get("seed", 0)):
+            print("Permutation tests saved to", os.path.join(out, "results_permutation"))
+
+    if segment_results:
+        if settings["scaling"] is None:
+            finder.scaling = shards.merge_ranges(segment_ranges, finder.stats)
+        finder.write_results(segment_results, settings["segment_columns"] + finder.stats, out, "results_segments")
+
+    print("Merged {0} shards with {1} files.".format(settings["shards"], len(results)))
+
+##############################
+
+@cli.command()
+@click.argument("results", nargs=1) #results.csv or folder containing it
+@click.argument("out", nargs=1, callback=get_output_dir) #Output folder
+@click.option("-f", "--features", default="./../config/features.config", 
+                                  help="File specifying the list of features to analyze.", callback=get_features)
+@click.option("-w", "--weights", default="./../config/weights.config", 
+                                 help="File specifying the weights for calculating the orality score.", callback=set_weights)
+@click.option("--output-format", default="tsv", type=click.Choice(["tsv", "jsonl", "parquet"], case_sensitive=False),
+                                 help="Format of the result files. Parquet requires pyarrow.")
+@click.option("--scaling-profile", default=None,
+                                   help="Scale and score with the min and max values saved by the calibrate command instead of the values of the results file.")
+def rescore(results, out, **kwargs):
+    """
+    Scale and score the values of an existing results file again,
+    e.g. with different weights or a subset of features.
+    """
+    if os.path.isdir(results):
+        results = os.path.join(results, "results.csv")
+
+    if not runner.file_exists(results):
+        return None
+
+    #Get output directory
+    if not out:
+        return None
+
+    finder = FeatureFinder(kwargs.get("features", []), kwargs.get("weights", {}))
+    finder.output_format = writer.get_format(kwargs.get("output_format", "tsv").lower())
+
+    #Scale with the values of a reference corpus
+    if kwargs.get("scaling_profile", None):
+        if not set_scaling(finder, kwargs["scaling_profile"]):
+            return None
+
+    columns, results = finder.read_results(results)
+
+    #Only use features that are contained in the results file
+    for feat in finder.stats[:]:
+        if not feat in columns:
+            print("WARNING: Feature {0} is not in the results file and will not be considered.".format(feat))
+            finder.stats = [f for f in finder.stats if f != feat]
+    for feat in list(finder.weights):
+        if not feat in columns:
+            print("WARNING: Feature {0} is not in the results file. Weight will not be used.".format(feat))
+            finder.weights = {f : w for f, w in finder.weights.items() if f != feat}
+
+    #Keep all columns that are not features
+    columns = [col for col in columns if not col in finder.available_stats] + finder.stats
+
+    finder.write_results(results, columns, out)
+
+##############################
+
+@cli.command()
+@click.argument("results", nargs=1) #results.csv or folder containing it
+@click.argument("weights_file", nargs=1) #Output file
+@click.option("-f", "--features", default="./../config/features.config", 
+                                  help="File specifying the list of features to weight.", callback=get_features)
+@click.option("--target", default="KaJuK_score",
+                          help="Column of the results file with the ratings to fit, e.g. KaJuK_score.")
+@click.option("--cv", default="loto", type=click.Choice(["loto", "kfold"], case_sensitive=False),
+                      help="Cross-validation: leave one text out (loto) or k folds of documents (kfold).")
+@click.option("--group", default="file",
+                         help="Column of the results file that identifies the texts for leave-one-text-out cross-validation.")
+@click.option("-k", "--folds", default=5, type=int,
+                               help="Number of folds for k-fold cross-validation.")
+@click.option("-n", "--repeat", default=1, type=int,
+                                help="Number of repetitions of k-fold cross-validation with different folds.")
+@click.option("--seed", default=0, type=int,
+                        help="Random seed for the k folds.")
+@click.option("-m", "--method", default="all", type=click.Choice(["all", "correlation", "ridge"], case_sensitive=False),
+                                help="Fit weights by correlation with the ratings, by ridge regression or choose the best of both.")
+@click.option("-a", "--alpha", default=[0.01, 0.1, 1.0, 10.0], multiple=True, type=float,
+                               help="Regularization strength of ridge regression. Can be given multiple times to compare candidates.")
+@click.option("--scaling-profile", default=None,
+                                   help="Scale with the min and max values saved by the calibrate command instead of the values of the results file.")
+def fit_weights(results, weights_file, **kwargs):
+    """
+    Fit the weights of the orality score to ratings in a results file,
+    compare methods with cross-validation and save the best weights.
+    """
+    if fitting.np is None:
+        print("ERROR: Fitting weights requires numpy.")
+        return None
+
+    if os.path.isdir(results):
+        results = os.path.join(results, "results.csv")
+
+    if not runner.file_exists(results):
+        return None
+
+    finder = FeatureFinder(kwargs.get("features", []), verbose=False)
+
+    if kwargs.get("scaling_profile", None):
+        if not set_scaling(finder, kwargs["scaling_profile"]):
+            return None
+
+    columns, results = finder.read_results(results)
+
+    target = kwargs.get("target", "KaJuK_score")
+    if not target in columns:
+        print("ERROR: Column {0} is not in the results file.".format(target))
+        return None
+
+    #Only use features that are contained in the results file
+    for feat in finder.stats[:]:
+        if not feat in columns:
+            print("WARNING: Feature {0} is not in the results file and will not be considered.".format(feat))
+            finder.stats = [f for f in finder.stats if f != feat]
+
+    group = None
+    if kwargs.get("cv", "loto").lower() == "loto":
+        group = kwargs.get("group", "file")
+        if not group in columns:
+            print("ERROR: Column {0} is not in the results file.".format(group))
+            return None
+
+    #Build the document x feature matrix once for all folds and candidates
+    X, y, groups = fitting.get_matrix(finder, results, target, group)
+    if len(y) < 3 or not finder.stats:
+        print("ERROR: Not enough documents with {0} to fit weights.".format(target))
+        return None
+
+    folds, n_folds = fitting.get_folds(len(y), groups, kwargs.get("folds", 5), kwargs.get("repeat", 1), kwargs.get("seed", 0))
+    if n_folds < 2:
+        print("ERROR: Cross-validation requires at least two different values in column {0}.".format(group))
+        return None
+
+    method = kwargs.get("method", "all").lower()
+    methods = ["correlation", "ridge"] if method == "all" else [method]
+    alphas = sorted(set(kwargs.get("alpha", [])))
+    if "ridge" in methods and not alphas:
+        print("ERROR: Ridge regression requires at least one alpha.")
+        return None
+
+    candidates = fitting.cross_validate(finder, X, y, folds, n_folds, methods, alphas)
+
+    print("{0} documents, {1} features, {2} folds".format(len(y), len(finder.stats), n_folds))
+    print()
+    print("{0:<12} {1:>8} {2:>10} {3:>10}".format("method", "alpha", "mean r", "sd r"))
+    for name, alpha, mean_r, sd_r in candidates:
+        #Standard deviation across repetitions of k-fold cross-validation
+        sd_r = "-" if folds.shape[0] == 1 else "{0:.4f}".format(sd_r)
+        print("{0:<12} {1:>8} {2:>10.4f} {3:>10}".format(name, "-" if alpha is None else alpha, mean_r, sd_r))
+
+    #Refit the best candidate on all documents
+    name, alpha, mean_r, _ = max(candidates, key=lambda c : c[2])
+    weights = {feat : round(float(weight), 3) for feat, weight in zip(finder.stats, fitting.fit(finder, X, y, name, alpha))}
+
+    setting = name if alpha is None else "{0} (alpha={1})".format(name, alpha)
+    fitting.write_weights_file(weights_file, weights,
+                               ["Fitted to {0} of {1} documents with {2}.".format(target, len(y), setting),
+                                "Cross-validated correlation ({0}, {1} folds): {2:.4f}".format(kwargs.get("cv", "loto").lower(), n_folds, mean_r)])
+
+    print()
+    print("Best: {0} with r = {1:.4f}".format(setting, mean_r))
+    print("Weights saved to", weights_file)
+
+##############################
+
+@cli.command()
+@click.argument("results", nargs=1) #results.csv or folder containing it
+@click.argument("out", nargs=1, callback=get_output_dir) #Output folder
+@click.option("-f", "--features", default="./../config/features.config", 
+                                  help="File specifying the list of features to test.", callback=get_features)
+@click.option("-w", "--weights", default="./../config/weights.config", 
+                                 help="File specifying the weights for calculating the orality score.", callback=set_weights)
+@click.option("--group-column", default="oral",
+                                help="Column of the results file with the two groups, e.g. oral.")
+@click.option("-n", "--permutations", default=10000, type=int,
+                                      help="Number of permutations.")
+@click.option("--seed", default=0, type=int,
+                        help="Random seed for the permutations.")
+@click.option("--output-format", default="tsv", type=click.Choice(["tsv", "jsonl", "parquet"], case_sensitive=False),
+                                 help="Format of the result file. Parquet requires pyarrow.")
+@click.option("--scaling-profile", default=None,
+                                   help="Score with the min and max values saved by the calibrate command instead of the values of the results file.")
+def permutation_test(results, out, **kwargs):
+    """
+    Test the differences of the features and orality scores
+    between two groups of files in an existing results file.
+    """
+    if resampling.np is None:
+        print("ERROR: Permutation tests require numpy.")
+        return None
+
+    if os.path.isdir(results):
+        results = os.path.join(results, "results.csv")
+
+    if not runner.file_exists(results):
+        return None
+
+    #Get output directory
+    if not out:
+        return None
+
+    finder = FeatureFinder(kwargs.get("features", []), kwargs.get("weights", {}))
+    finder.output_format = writer.get_format(kwargs.get("output_format", "tsv").lower())
+
+    if kwargs.get("scaling_profile", None):
+        if not set_scaling(finder, kwargs["scaling_profile"]):
+            return None
+
+    columns, results = finder.read_results(results)
+
+    #Only use features that are contained in the results file
+    for feat in finder.stats[:]:
+        if not feat in columns:
+            print("WARNING: Feature {0} is not in the results file and will not be considered.".format(feat))
+            finder.stats = [f for f in finder.stats if f != feat]
+    for feat in list(finder.weights):
+        if not feat in columns:
+            print("WARNING: Feature {0} is not in the results file. Weight will not be used.".format(feat))
+            finder.weights = {f : w for f, w in finder.weights.items() if f != feat}
+
+    if resampling.output_permutation_test(finder, results, kwargs.get("group_column", "oral"), out,
+                                          kwargs.get("permutations", 10000), kwargs.get("seed", 0)):
+        print("Permutation tests saved to", os.path.join(out, "results_permutation"))
+
+##############################
+
+@cli.group()
+def cache():
+    """
+    Show or clear the cache of analysis results.
+    """
+    pass
+
+##############################
+
+@cache.command()
+@click.argument("cache_dir", nargs=1)
+def stats(cache_dir):
+    """
+    Show the number of cached results and the size of the cache.
+    """
+    if not os.path.isdir(cache_dir):
+        print("ERROR: Cache folder {0} does not exist.".format(os.path.normpath(cache_dir)))
+        return
+    n_entries, size = FeatureCache(cache_dir).stats()
+    print("Cache folder:", os.path.normpath(cache_dir))
+    print("Entries:", n_entries)
+    print("Size: {0:.1f} MB".format(size / 1024**2))
+
+##############################
+
+@cache.command()
+@click.argument("cache_dir", nargs=1)
+def clear(cache_dir):
+    """
+    Remove all cached results.
+    """
+    if not os.path.isdir(cache_dir):
+        print("ERROR: Cache folder {0} does not exist.".format(os.path.normpath(cache_dir)))
+        return
+    removed = FeatureCache(cache_dir).clear()
+    print("Removed {0} cached results from {1}.".format(removed, os.path.normpath(cache_dir)))
 
 ################################
 if __name__ == '__main__':
@@ -0,0 +1,323 @@
+'''
+Module to use COAST from Python without printing anything or writing files.
+Documents (files or Doc objects) are analyzed in batch and the results
+are returned column by column with one row per document.
+
+Example:
+    from api import Analyzer
+    analyzer = Analyzer("conlluplus", ["ellipsisremover", "bracketremover", "pronounlemmatizer"])
+    results = analyzer.analyze(["letter_1.conllup", "letter_2.conllup.gz"])
+    results.scores          #Orality score of each document
+    results.to_pandas()     #DataFrame (requires pandas)
+'''
+
+import runner
+import inputs
+from corpus import Doc
+from tagarrays import np
+from featurefinder import FeatureFinder, read_scaling_profile
+from registry import importers, processors as available_processors
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+############################
+
+class Results(object):
+
+    def __init__(self, names, features, values, scaled, scores):
+        """
+        Columnar results of a batch of documents.
+        With NumPy, values and scaled are arrays of shape (documents, features)
+        and missing values are NaN. Without NumPy, they are lists of rows
+        and missing values are None.
+        Input: List of document names, list of feature names,
+               original values, scaled values and orality scores
+        """
+        self.names = names
+        self.features = features
+        self.values = values
+        self.scaled = scaled
+        self.scores = scores
+
+    #####################
+
+    def __len__(self):
+        return len(self.names)
+
+    #####################
+
+    def column(self, feature, scaled=False):
+        """
+        Input: Name of a feature and whether to return the scaled values
+        Output: Values of the feature for all documents
+        """
+        j = self.features.index(feature)
+        values = self.scaled if scaled else self.values
+        if np is not None:
+            return values[:, j]
+        return [row[j] for row in values]
+
+    #####################
+
+    def to_dict(self, scaled=False):
+        """
+        Output: Dictionary of column name : values with the columns
+                file, the features and orality_score
+        """
+        columns = {"file" : self.names}
+        for feat in self.features:
+            columns[feat] = self.column(feat, scaled)
+        columns["orality_score"] = self.scores
+        return columns
+
+    #####################
+
+    def to_pandas(self, scaled=False):
+        """
+        Output: pandas DataFrame with one row per document
+        """
+        if pandas is None:
+            raise ImportError("pandas is not installed.")
+        return pandas.DataFrame(self.to_dict(scaled))
+
+############################
+
+class Analyzer(object):
+
+    def __init__(self, importer="conlluplus", processors=[], features=[], weights={}, engine="fused", memo_size=10000,
+                 scaling_profile=None):
+        """
+        Load importer, processors and FeatureFinder once for all batches.
+        Nothing is printed.
+        With a scaling profile (written by the calibrate command), each document
+        is scaled and scored independently of the other documents in the batch.
+        Input: Name of the importer (or Importer object), list of processor names
+               (or Processor objects) in order of application, list of features,
+               dictionary of weights, feature engine, size of the processor memos
+               and filename of a scaling profile
+        """
+        if isinstance(importer, str):
+            if not importer.lower() in importers:
+                raise ValueError("{0} is not a valid importer.".format(importer))
+            importer = importers[importer.lower()]()
+        self.importer = importer
+        self.importer.verbose = False
+
+        self.processors = list()
+        for p in processors:
+            if isinstance(p, str):
+                if not p.lower() in available_processors:
+                    raise ValueError("{0} is not a valid processor.".format(p))
+                p = available_processors[p.lower()]()
+            self.processors.append(p)
+
+        self.finder = FeatureFinder(features, weights, engine, verbose=False)
+
+        if scaling_profile is not None:
+            self.finder.scaling, _ = read_scaling_profile(scaling_profile, verbose=False)
+            if self.finder.scaling is None:
+                raise ValueError("Cannot read scaling profile {0}.".format(scaling_profile))
+
+        runner.setup_importer(self.importer, self.processors, self.finder.columns, memo_size)
+
+    #####################
+
+    def get_files(self, paths):
+        """
+        Input: Iterable of filenames
+        Output: List of filenames with the members of archives
+        """
+        files = list()
+        for path in paths:
+            if inputs.is_archive(path):
+                files.extend(inputs.list_members(path, verbose=False))
+            else:
+                files.append(path)
+        return files
+
+    #####################
+
+    def analyze_doc(self, doc):
+        """
+        Apply the processors to a Doc object and compute its features.
+        The doc is changed by the processors.
+        Input: Doc object with sentences
+        Output: Doc object with feature and stats table
+                (raises a ValueError if the doc does not contain any words)
+        """
+        for p in self.processors:
+            doc = p.process(doc)
+        doc = self.finder.find_features(doc)
+        return self.finder.compute_stats(doc)
+
+    #####################
+
+    def iter_files(self, files, stream=False, jobs=1, batch_size=4194304):
+        """
+        Input: List of filenames, stream mode, number of processes and batch size in bytes
+        Output: Generator of (name, stats table) pairs in input order
+        """
+        files = self.get_files(files)
+
+        if jobs > 1 and len(files) > 1:
+            for _, results in runner.analyze_parallel(runner.get_batches(files, batch_size), self.importer,
+                                                      self.processors, self.finder, jobs, stream):
+                for filename, stats_table, _, _ in results:
+                    yield filename, stats_table
+            return
+
+        for file in files:
+            doc = runner.analyze_file(file, self.importer, self.processors, self.finder, stream)
+            if doc is not None:
+                yield doc.filename, doc.stats_table
+
+    #####################
+
+    def iter_stats(self, items, stream=False, jobs=1, batch_size=4194304):
+        """
+        Analyze the documents one by one (or in worker processes if jobs > 1).
+        Documents that cannot be imported or contain no words are skipped.
+        Input: Iterable of filenames and Doc objects, stream mode,
+               number of processes and batch size in bytes
+        Output: Generator of (name, stats table) pairs in input order
+        """
+        files = list()
+        for item in items:
+            if isinstance(item, Doc):
+                #Files before the doc are analyzed first to keep the input order
+                if files:
+                    yield from self.iter_files(files, stream, jobs, batch_size)
+                    files = list()
+                try:
+                    doc = self.analyze_doc(item)
+                except ValueError:
+                    continue
+                yield doc.filename, doc.stats_table
+            else:
+                files.append(item)
+
+        if files:
+            yield from self.iter_files(files, stream, jobs, batch_size)
+
+    #####################
+
+    def analyze(self, items, stream=False, jobs=1, batch_size=4194304):
+        """
+        Analyze a batch of documents. Feature values are scaled across the batch
+        (as in the results of the analyze command) or with the scaling profile
+        and the orality scores are calculated.
+        Input: Iterable of filenames (files, archive members or archives)
+               and Doc objects, stream mode, number of processes and batch size in bytes
+        Output: Results object with one row per analyzed document
+        """
+        names, rows = list(), list()
+        for name, stats_table in self.iter_stats(items, stream, jobs, batch_size):
+            names.append(name)
+            rows.append([stats_table[feat] for feat in self.finder.stats])
+
+        if np is not None:
+            values, scaled, scores = self.scale_arrays(rows)
+        else:
+            values, scaled, scores = self.scale_lists(rows)
+
+        return Results(names, list(self.finder.stats), values, scaled, scores)
+
+    #####################
+
+    def get_range(self, j, vals):
+        """
+        Input: Index of a feature and its values (without missing values)
+        Output: Min and max value from the scaling profile or of the values
+        """
+        feat = self.finder.stats[j]
+        if self.finder.scaling is not None and feat in self.finder.scaling:
+            return self.finder.scaling[feat]
+        return min(vals), max(vals)
+
+    #####################
+
+    def get_weights(self):
+        """
+        Output: List of (feature index, weight) pairs in the order of the weights
+        """
+        return [(self.finder.stats.index(feat), weight) for feat, weight in self.finder.weights.items()
+                if feat in self.finder.stats]
+
+    #####################
+
+    def scale_arrays(self, rows):
+        """
+        Scale the feature values to [0, 1] and calculate the scores with NumPy.
+        The values are the same as with FeatureFinder.scale_feature_values and calculate_score.
+        Input: List of rows of feature values
+        Output: Array of values, array of scaled values and array of scores
+        """
+        values = np.array([[np.nan if val is None else val for val in row] for row in rows],
+                          dtype=np.float64).reshape(len(rows), len(self.finder.stats))
+        scaled = np.zeros(values.shape)
+
+        for j in range(values.shape[1]):
+            column = values[:, j]
+            valid = ~np.isnan(column)
+            if not valid.any():
+                continue
+            min_val, max_val = self.get_range(j, column[valid])
+            if max_val != min_val:
+                scaled[valid, j] = (column[valid] - min_val) / (max_val - min_val)
+
+        #Add the weighted values in the same order as calculate_score
+        scores = np.zeros(len(rows))
+        for j, weight in self.get_weights():
+            scores = scores + scaled[:, j] * weight
+
+        return values, scaled, scores
+
+    #####################
+
+    def scale_lists(self, rows):
+        """
+        Scale the feature values to [0, 1] and calculate the scores without NumPy.
+        Input: List of rows of feature values
+        Output: List of rows of values, list of rows of scaled values and list of scores
+        """
+        scaled = [[0.0] * len(self.finder.stats) for _ in rows]
+
+        for j in range(len(self.finder.stats)):
+            vals = [row[j] for row in rows if row[j] is not None]
+            if not vals:
+                continue
+            min_val, max_val = self.get_range(j, vals)
+            if max_val == min_val:
+                continue
+            for i, row in enumerate(rows):
+                if row[j] is not None:
+                    scaled[i][j] = (row[j] - min_val) / (max_val - min_val)
+
+        weights = self.get_weights()
+        scores = list()
+        for row in scaled:
+            score = 0
+            for j, weight in weights:
+                score += row[j] * weight
+            scores.append(score)
+
+        return rows, scaled, scores
+
+############################
+
+def analyze(items, importer="conlluplus", processors=[], features=[], weights={}, engine="fused",
+            stream=False, jobs=1, scaling_profile=None):
+    """
+    Analyze a batch of documents with new components.
+    To analyze several batches, create an Analyzer once instead.
+    Input: Iterable of filenames and Doc objects, importer, list of processors,
+           list of features, dictionary of weights, feature engine, stream mode,
+           number of processes and filename of a scaling profile
+    Output: Results object
+    """
+    return Analyzer(importer, processors, features, weights, engine, scaling_profile=scaling_profile).analyze(items, stream, jobs)
+
+############################
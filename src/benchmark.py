@@ -0,0 +1,265 @@
+'''
+Module to measure the throughput of COAST.
+The stages of the analysis (import, processors, features, statistics and output)
+are timed separately on the input files and on corpora scaled up by
+analyzing each input file several times.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import runner
+from profiler import Profiler
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+############################
+
+class StageTimer(object):
+
+    def __init__(self):
+        #Stage : [wall time, cpu time, calls]
+        self.stages = dict()
+
+    #####################
+
+    def add(self, stage, wall, cpu):
+        times = self.stages.get(stage)
+        if times is None:
+            self.stages[stage] = [wall, cpu, 1]
+        else:
+            times[0] += wall
+            times[1] += cpu
+            times[2] += 1
+
+    #####################
+
+    def time(self, stage, func, *args):
+        """
+        Call func with the given arguments and add its run time to the stage.
+        Input: Name of the stage, function and arguments
+        Output: Return value of the function
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func(*args)
+        self.add(stage, time.perf_counter() - wall, time.process_time() - cpu)
+        return result
+
+    #####################
+
+    def report(self):
+        """
+        Output: Dictionary of stage : {"wall" : seconds, "cpu" : seconds, "calls" : n}
+        """
+        return {stage : {"wall" : round(wall, 6), "cpu" : round(cpu, 6), "calls" : calls}
+                for stage, (wall, cpu, calls) in self.stages.items()}
+
+############################
+
+def get_peak_memory():
+    """
+    Output: Peak memory (resident set size) of the current process in MB or None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports KB, macOS bytes
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+############################
+
+def time_features(files, importer, finder, scale=1):
+    """
+    Time each feature function of the reference implementation
+    on all sentences of the files. This is a separate pass,
+    so it is not included in the total time and throughput of the benchmark.
+    Input: List of filenames, importer, FeatureFinder and scale factor
+    Output: Dictionary of stage : {"wall" : seconds, "cpu" : seconds, "calls" : n}
+    """
+    timer = StageTimer()
+    functions = list(finder.get_feature_functions().values())
+    perf_counter, process_time = time.perf_counter, time.process_time
+
+    for copy in range(scale):
+        for file in files:
+            doc = importer.import_file(file)
+            if doc is None:
+                continue
+            for func in functions:
+                wall, cpu = perf_counter(), process_time()
+                for sent in doc.sentences:
+                    func(sent)
+                timer.add("feature:" + func.__name__, perf_counter() - wall, process_time() - cpu)
+
+    return timer.report()
+
+############################
+
+def run_benchmark(files, importer, processors, finder, scale=1, feature_functions=True):
+    """
+    Analyze the files scale times like the analyze command and time each stage.
+    The importer should be prepared with runner.setup_importer, so the processors
+    are applied while reading and use their memos as in analyze.
+    Documents are not kept in memory, so memory usage does not grow with the scale.
+    Input: List of filenames, importer, list of processors, FeatureFinder, scale factor
+           and whether to time the feature functions of the reference implementation
+    Output: Dictionary with counts, stage times, throughput and peak memory
+    """
+    #Time each processor, also when it is applied by the importer
+    profiler = Profiler()
+    profiler.attach(None, importer)
+
+    results = dict()
+    n_files, n_sents, n_toks = 0, 0, 0
+
+    start = time.perf_counter()
+
+    for copy in range(scale):
+        for file in files:
+            doc = runner.analyze_file(file, importer, processors, finder, profiler=profiler)
+
+            #Skip invalid files and files without words
+            if doc is None:
+                continue
+
+            n_files += 1
+            n_sents += doc.n_sents
+            n_toks += doc.n_toks
+
+            #Copies get unique names
+            results["{0}_{1}".format(copy, doc.filename)] = doc.stats_table
+
+    if results:
+        with tempfile.TemporaryDirectory() as outdir:
+            profiler.start("output_stats")
+            finder.output_stats(results, outdir)
+            profiler.stop()
+
+    total = time.perf_counter() - start
+
+    report = {"files" : n_files,
+              "sentences" : n_sents,
+              "tokens" : n_toks,
+              "total" : round(total, 6),
+              "tokens_per_second" : round(n_toks / total, 1) if total else None,
+              "peak_memory_mb" : get_peak_memory(),
+              "stages" : profiler.get_stages()}
+
+    if feature_functions:
+        report["feature_functions"] = time_features(files, importer, finder, scale)
+
+    return report
+
+############################
+
+def run_scales(files, importer, processors, finder, scales, repeat=1, feature_functions=True):
+    """
+    Run the benchmark for each scale factor in a separate process,
+    so that the peak memory of each run is measured separately.
+    With repetitions, the fastest run of each scale is reported.
+    Input: List of filenames, importer, list of processors, FeatureFinder,
+           list of scale factors, number of repetitions
+           and whether to time the feature functions
+    Output: Generator of (scale, results) pairs
+    """
+    for scale in scales:
+        runs = list()
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(run_benchmark, files, importer, processors,
+                                            finder, scale, feature_functions).result())
+        yield scale, min(runs, key=lambda run : run["total"])
+
+############################
+
+def get_commit():
+    """
+    Output: Hash of the current git commit or None
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+############################
+
+def get_environment():
+    return {"commit" : get_commit(),
+            "date" : time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "cpus" : os.cpu_count()}
+
+############################
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare the stage times of two benchmark reports.
+    Input: Old and new report and relative slowdown that counts as regression
+    Output: List of lines (scale, stage, old time, new time, ratio, regression)
+    """
+    lines = list()
+    for scale, results in new["scales"].items():
+        if not scale in old["scales"]:
+            continue
+        old_stages = old["scales"][scale]["stages"]
+        stages = dict(results["stages"])
+        stages["total"] = {"wall" : results["total"]}
+        old_stages = dict(old_stages)
+        old_stages["total"] = {"wall" : old["scales"][scale]["total"]}
+
+        for stage, times in stages.items():
+            if not stage in old_stages:
+                continue
+            old_time, new_time = old_stages[stage]["wall"], times["wall"]
+            ratio = new_time / old_time if old_time else None
+            regression = ratio is not None and ratio > 1 + threshold
+            lines.append((scale, stage, old_time, new_time, ratio, regression))
+    return lines
+
+############################
+
+def print_results(scale, results):
+    print("Scale {0}x: {1} files, {2} sentences, {3} tokens".format(scale, results["files"], results["sentences"], results["tokens"]))
+    print("Total: {0:.3f} s, {1:.0f} tokens/s, peak memory: {2} MB".format(results["total"], results["tokens_per_second"] or 0, results["peak_memory_mb"]))
+    for stage, times in results["stages"].items():
+        print("  {0:<45} {1:>10.3f} s wall {2:>10.3f} s cpu".format(stage, times["wall"], times["cpu"]))
+    if results.get("feature_functions"):
+        print("Feature functions (separate pass, not included in total):")
+        for stage, times in results["feature_functions"].items():
+            print("  {0:<45} {1:>10.3f} s wall {2:>10.3f} s cpu".format(stage, times["wall"], times["cpu"]))
+    print()
+
+############################
+
+def print_comparison(lines):
+    print("{0:<8} {1:<45} {2:>10} {3:>10} {4:>8}".format("scale", "stage", "old (s)", "new (s)", "ratio"))
+    for scale, stage, old_time, new_time, ratio, regression in lines:
+        print("{0:<8} {1:<45} {2:>10.3f} {3:>10.3f} {4:>8}{5}".format(scale, stage, old_time, new_time,
+              "-" if ratio is None else "{0:.2f}".format(ratio), "  REGRESSION" if regression else ""))
+    print()
+
+############################
+
+def write_report(report, file):
+    with open(file, mode="w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+############################
+
+def read_report(file):
+    with open(file, mode="r", encoding="utf-8") as f:
+        return json.load(f)
+
+############################
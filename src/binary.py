@@ -0,0 +1,255 @@
+'''
+Module to store imported and processed documents in a binary columnar format.
+Each column is stored as an array of integer codes plus a table of its strings,
+sentences are stored as offsets into the token arrays.
+Files are memory-mapped when they are loaded, so no text has to be parsed.
+'''
+
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from corpus import Sentence, Token
+from tagarrays import np, DocArrays
+import inputs
+
+############################
+
+#File layout: MAGIC, length of the JSON header (uint32), header, data blocks.
+#Data blocks start at multiples of 8 bytes, offsets in the header are relative to the file start.
+MAGIC = b"COASTBIN"
+FORMAT = 1
+EXTENSION = ".coast"
+
+#Array type of codes and sentence offsets (4 bytes)
+CODE_TYPE = "I" if array("I").itemsize == 4 else "L"
+
+############################
+
+def write_doc(doc, file, columns, processors=[]):
+    """
+    Write a (processed) document to a binary file.
+    Tokens without a value for a column get the value "_".
+    Sentence meta information is not stored.
+    Input: Doc object with sentences, output filename, list of columns to store
+           and list of processors that were applied to the document
+    """
+    offsets = array(CODE_TYPE, [0])
+    n_toks = 0
+    for sent in doc.sentences:
+        n_toks += len(sent.tokens)
+        offsets.append(n_toks)
+
+    #Encode each column
+    blocks = list()
+    column_info = list()
+    for col in columns:
+        codes = array(CODE_TYPE)
+        strings = dict()
+        for sent in doc.sentences:
+            for tok in sent.tokens:
+                val = getattr(tok, col, "_")
+                code = strings.get(val)
+                if code is None:
+                    code = len(strings)
+                    strings[val] = code
+                codes.append(code)
+        column_info.append({"name" : col, "n_strings" : len(strings)})
+        blocks.append(codes.tobytes())
+        blocks.append("\n".join(strings).encode("utf-8"))
+
+    header = {"format" : FORMAT,
+              "filename" : doc.filename,
+              "byteorder" : sys.byteorder,
+              "processors" : [type(p).__name__ for p in processors],
+              "n_toks" : n_toks,
+              "n_sents" : len(offsets) - 1,
+              "columns" : column_info,
+              "blocks" : list()}
+
+    #The header contains the positions of the blocks,
+    #so the positions are computed for a header with placeholders first
+    blocks.insert(0, offsets.tobytes())
+    header["blocks"] = [[0, 0] for _ in blocks]
+    while True:
+        pos = align(len(MAGIC) + 4 + len(json.dumps(header).encode("utf-8")))
+        positions = list()
+        for block in blocks:
+            positions.append([pos, len(block)])
+            pos = align(pos + len(block))
+        if positions == header["blocks"]:
+            break
+        header["blocks"] = positions
+
+    header = json.dumps(header).encode("utf-8")
+
+    with open(file, mode="wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(b"\0" * (align(f.tell()) - f.tell()))
+            f.write(block)
+
+############################
+
+def align(pos):
+    return (pos + 7) // 8 * 8
+
+############################
+
+class BinaryDoc(object):
+
+    def __init__(self, file, data=None):
+        """
+        Memory-map a binary file and read its header.
+        If the content of the file has been read already, it is used instead.
+        Input: Filename (including path) and file content as bytes (optional)
+        """
+        if data is not None:
+            self.data = data
+        #Compressed files and archive members cannot be memory-mapped
+        elif not inputs.is_plain(file):
+            self.data = inputs.read_bytes(file)
+        else:
+            with open(file, mode="rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a binary COAST file.".format(file))
+
+        length, = struct.unpack_from("<I", self.data, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self.data[start:start+length].decode("utf-8"))
+
+        if self.header["format"] != FORMAT:
+            raise ValueError("{0} has an unsupported format version.".format(file))
+
+        self.filename = self.header["filename"]
+        self.n_toks = self.header["n_toks"]
+        self.n_sents = self.header["n_sents"]
+        self.columns = [col["name"] for col in self.header["columns"]]
+
+    ###############################
+
+    def close(self):
+        """
+        Close the memory-mapped file.
+        If arrays of the file are still in use, it is closed when they are deleted.
+        """
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                pass
+
+    ###############################
+
+    def get_block(self, i):
+        start, length = self.header["blocks"][i]
+        return start, length
+
+    ###############################
+
+    def get_codes(self, i):
+        """
+        Input: Index of an array block
+        Output: Sequence of integer codes
+        """
+        start, length = self.get_block(i)
+        if self.header["byteorder"] == sys.byteorder:
+            return memoryview(self.data)[start:start+length].cast(CODE_TYPE)
+        codes = array(CODE_TYPE, self.data[start:start+length])
+        codes.byteswap()
+        return codes
+
+    ###############################
+
+    def get_offsets(self):
+        return self.get_codes(0)
+
+    ###############################
+
+    def get_column(self, col):
+        """
+        Input: Column name
+        Output: Sequence of codes and list of strings of the column
+        """
+        i = self.columns.index(col)
+        start, length = self.get_block(2*i + 2)
+        if self.header["columns"][i]["n_strings"]:
+            strings = self.data[start:start+length].decode("utf-8").split("\n")
+        else:
+            strings = list()
+        return self.get_codes(2*i + 1), strings
+
+    ###############################
+
+    def get_values(self, col):
+        """
+        Input: Column name
+        Output: List with the value of each token
+        """
+        codes, strings = self.get_column(col)
+        return list(map(strings.__getitem__, codes))
+
+    ###############################
+
+    def get_sentences(self, columns=None):
+        """
+        Create the sentences of the document with the given columns.
+        Tokens are only created for one sentence at a time.
+        The file is closed when all sentences have been read.
+        Input: List of column names (None for all stored columns)
+        Output: Generator of Sentence objects
+        """
+        if columns is None:
+            columns = self.columns
+        columns = [col for col in self.columns if col in columns]
+
+        token_class = Token.with_columns(columns)
+        tables = [self.get_column(col) for col in columns]
+        offsets = self.get_offsets().tolist()
+
+        try:
+            for i in range(self.n_sents):
+                start, end = offsets[i], offsets[i+1]
+                sentence = Sentence()
+                for vals in zip(*[[strings[code] for code in codes[start:end]] for codes, strings in tables]):
+                    sentence.add_token(token_class(vals))
+                yield sentence
+        finally:
+            #Release the views of the file before closing it
+            del tables
+            self.close()
+
+    ###############################
+
+    def get_arrays(self, vocab):
+        """
+        Create the tag arrays of the document from the stored codes.
+        Input: TagVocabulary for XPOS tags
+        Output: DocArrays object
+        """
+        def column(col):
+            if not col in self.columns:
+                return None
+            codes, strings = self.get_column(col)
+            return np.frombuffer(codes, dtype=np.uint32), strings
+
+        return DocArrays.from_columns(column("XPOS"), column("LEMMA"), column("FORM"), column("UPOS"),
+                                      np.frombuffer(self.get_offsets(), dtype=np.uint32).astype(np.int64),
+                                      vocab)
+
+############################
+
+def get_output_file(file, outdir):
+    """
+    Input: Filename of the input file (including path) and output folder
+    Output: Filename of the binary file (including path)
+    """
+    return os.path.join(outdir, inputs.get_filename(file) + EXTENSION)
+
+############################
@@ -0,0 +1,249 @@
+'''
+Module to cache the results of analyzed files on disk.
+Results are stored under a hash of the file content and the analysis settings,
+so unchanged files do not have to be analyzed again.
+'''
+
+import os
+import json
+import hashlib
+from collections import Counter
+import inputs
+
+############################
+
+class FeatureCache(object):
+
+    #Increase if the format of cached results changes
+    FORMAT = 3
+
+    #Extensions of cache entries (.pkl for entries of older versions)
+    extensions = (".json", ".pkl")
+
+    #When the cache grows too large during a run, it is reduced to this share of max_size,
+    #so that the entries are not listed again after every new entry
+    low_water = 0.9
+
+    ###############################
+
+    def __init__(self, directory, max_size=1024**3, version=""):
+        self.directory = os.path.normpath(directory)
+        self.max_size = max_size
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        #Size of the cache is counted once and then kept up to date by put.
+        #Only the process that opened the cache removes entries.
+        self.size = sum(entry[1] for entry in self.get_entries())
+        self.pid = os.getpid()
+
+    ###############################
+
+    def get_key(self, file, importer, processors, data=None):
+        """
+        Compute the cache key of a file from its content,
+        the importer, the processors (in order of application)
+        and the version of COAST.
+        Input: Filename (including path), importer, list of processors
+               and file content as bytes (optional)
+        Output: Key as hex string
+        """
+        key = hashlib.sha256()
+
+        if data is not None:
+            key.update(data)
+        else:
+            with inputs.open_binary(file) as f:
+                for block in iter(lambda: f.read(1024*1024), b""):
+                    key.update(block)
+
+        settings = [self.version, str(self.FORMAT), type(importer).__name__] \
+                 + [type(p).__name__ for p in processors]
+        key.update("\n".join(settings).encode("utf-8"))
+
+        return key.hexdigest()
+
+    ###############################
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    ###############################
+
+    def get(self, key):
+        """
+        Load the cached results for the key.
+        Input: Cache key
+        Output: Dictionary with feat_table, n_sents and stats_table or None
+        """
+        path = self.get_path(key)
+
+        try:
+            with open(path, mode="r", encoding="utf-8") as f:
+                entry = decode_entry(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.misses += 1
+            return None
+
+        #Mark entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return entry
+
+    ###############################
+
+    def put(self, key, doc):
+        """
+        Store the results of an analyzed doc.
+        Input: Cache key and Doc object with feature and stats table
+        """
+        path = self.get_path(key)
+        entry = encode_entry(doc)
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        #Write to temporary file first, so that parallel
+        #processes never read incomplete entries
+        tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+
+        #Keep the cache within its limit during long or interrupted runs.
+        #Worker processes leave this to the main process.
+        self.size += size
+        if self.size > self.max_size and os.getpid() == self.pid:
+            self.evict(int(self.max_size * self.low_water))
+
+    ###############################
+
+    def get_entries(self):
+        """
+        Output: List of (path, size, last use) of all cache entries
+        """
+        entries = []
+        for folder in os.listdir(self.directory):
+            folder = os.path.join(self.directory, folder)
+            if not os.path.isdir(folder):
+                continue
+            for f in os.listdir(folder):
+                if not f.endswith(self.extensions):
+                    continue
+                path = os.path.join(folder, f)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    ###############################
+
+    def evict(self, max_size=None):
+        """
+        Remove the least recently used entries
+        until the cache is not larger than max_size.
+        Input: Maximum size in bytes (default: max_size of the cache)
+        Output: Number of removed entries
+        """
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = self.get_entries()
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+
+        for path, entry_size, _ in sorted(entries, key=lambda e : e[2]):
+            if size <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            removed += 1
+
+        self.size = size
+        return removed
+
+    ###############################
+
+    def stats(self):
+        """
+        Output: Number of entries and total size in bytes
+        """
+        entries = self.get_entries()
+        return len(entries), sum(entry[1] for entry in entries)
+
+    ###############################
+
+    def clear(self):
+        """
+        Remove all entries.
+        Output: Number of removed entries
+        """
+        removed = 0
+        for path, _, _ in self.get_entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        self.size = 0
+        return removed
+
+############################
+
+def encode_entry(doc):
+    """
+    Convert the results of a doc to JSON types.
+    Histograms are saved as lists of [value, count] pairs, because JSON keys are strings.
+    Input: Doc object with feature and stats table
+    Output: Dictionary with feat_table, n_sents and stats_table
+    """
+    feat_table = dict()
+    for feat, val in doc.feat_table.items():
+        if isinstance(val, Counter):
+            feat_table[feat] = {"histogram" : list(val.items())}
+        else:
+            feat_table[feat] = val
+    return {"feat_table" : feat_table,
+            "n_sents" : doc.n_sents,
+            "stats_table" : doc.stats_table}
+
+############################
+
+def decode_entry(entry):
+    """
+    Convert a cache entry back to the types of the feature table.
+    Input: Dictionary from encode_entry
+    Output: Dictionary with feat_table, n_sents and stats_table
+    """
+    feat_table = dict()
+    for feat, val in entry["feat_table"].items():
+        if isinstance(val, dict):
+            feat_table[feat] = Counter(dict((value, count) for value, count in val["histogram"]))
+        #Tuples are saved as lists
+        elif isinstance(val, list):
+            feat_table[feat] = tuple(val)
+        else:
+            feat_table[feat] = val
+    return {"feat_table" : feat_table,
+            "n_sents" : entry["n_sents"],
+            "stats_table" : entry["stats_table"]}
+
+############################
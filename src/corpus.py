@@ -8,12 +8,61 @@ Created on 14.10.2019
 
 class Token:
 
+    #Tokens of imported files get one slot per column (see with_columns).
+    #Other values are stored in __dict__ as before.
+    __slots__ = ("INDEX", "ID", "__dict__")
+
+    COLUMNS = ()
+
+    _classes = dict()
+
     def __init__(self, **kwargs):
         for key in kwargs:
             self.add_value(key, kwargs.get(key, "_"))
 
     ####################
 
+    @classmethod
+    def with_columns(cls, columns):
+        """
+        Return a token class with one slot per column.
+        The class is created only once for each list of columns.
+        Tokens of the class are created from a list of column values
+        in the same order as the columns, e.g. Token.with_columns(["FORM", "XPOS"])(["Haus", "NN"]).
+        Input: List of column names
+        Output: Token class
+        """
+        columns = tuple(columns)
+        if columns in cls._classes:
+            return cls._classes[columns]
+
+        #Columns that are no valid slot names are stored in __dict__
+        slots = tuple(col for col in columns
+                      if col.isidentifier() and not col in cls.__slots__ and not col.startswith("__"))
+
+        def __init__(self, values):
+            for key, val in zip(self.COLUMNS, values):
+                setattr(self, key, val)
+
+        token_class = type(cls.__name__, (cls,), {"__slots__" : slots,
+                                                  "COLUMNS" : columns,
+                                                  "__init__" : __init__})
+        cls._classes[columns] = token_class
+        return token_class
+
+    ####################
+
+    def __reduce__(self):
+        """
+        Make tokens with column slots picklable.
+        """
+        state = {key : getattr(self, key) for key in ("INDEX", "ID") if hasattr(self, key)}
+        state.update(self.__dict__)
+        values = [getattr(self, key, "_") for key in self.COLUMNS]
+        return (_rebuild_token, (self.COLUMNS, values, state))
+
+    ####################
+
     def __str__(self):
         try:
             return self.FORM
@@ -23,7 +72,7 @@ class Token:
     ####################
 
     def add_value(self, key, val):
-        self.__dict__[key] = val
+        setattr(self, key, val)
     
     #############################
     
@@ -56,17 +105,30 @@ class Token:
         If word is tagged as XPOS = $. or $, or $( or if UPOS is PUNCT return True.
         Return False otherwise.
         """
-        if self.__dict__.get("XPOS") in ["$.", "$,", "$("]:
+        if getattr(self, "XPOS", None) in ["$.", "$,", "$("]:
             return True
-        elif self.__dict__.get("UPOS") == "PUNCT":
+        elif getattr(self, "UPOS", None) == "PUNCT":
             return True
         else:
             return False
 
 ############################
 
+def _rebuild_token(columns, values, state):
+    """
+    Recreate a pickled token.
+    """
+    tok = Token.with_columns(columns)(values)
+    for key, val in state.items():
+        setattr(tok, key, val)
+    return tok
+
+############################
+
 class Sentence:
 
+    __slots__ = ("n_toks", "tokens", "__dict__")
+
     def __init__(self, tokens=[], **kwargs):
         self.n_toks = 0
         self.tokens = list()
@@ -78,6 +140,23 @@ class Sentence:
 
     #######################
 
+    @property
+    def text(self):
+        """
+        Return the text from the meta information.
+        If there is none, join the word forms.
+        """
+        text = self.__dict__.get("text", None)
+        if text is None:
+            return " ".join([tok.FORM for tok in self.tokens])
+        return text
+
+    @text.setter
+    def text(self, text):
+        self.__dict__["text"] = text
+
+    #######################
+
     def __len__(self):
         """
         Return the number of tokens.
@@ -111,7 +190,7 @@ class Sentence:
     def add_token(self, token):
         self.n_toks += 1
         token.INDEX = self.n_toks-1
-        if token.__dict__.get("ID", None) in ("_", None):
+        if getattr(token, "ID", None) in ("_", None):
             token.ID = str(self.n_toks)
 
         self.tokens.append(token)
@@ -8,7 +8,11 @@ The feature computation is based on Sentence objects.
 '''
 
 import re, os
+import json
 import statistics
+from collections import Counter
+from tagarrays import np, TagVocabulary, DocArrays, QUESTION, EXCLAMATION
+import writer
 
 #############################
 
@@ -30,17 +34,55 @@ class FeatureFinder(object):
 
     ###################
 
-    def __init__(self, features=[], weights={}):
+    #Columns needed to compute the features
+    columns = ["FORM", "XPOS", "UPOS", "LEMMA"]
+
+    engines = ["fused", "reference", "numpy"]
+
+    #Number of sentences converted to arrays at once when streaming with the numpy engine
+    chunk_size = 10000
+
+    #Format of the result files (tsv, jsonl or parquet)
+    output_format = "tsv"
+
+    #Minimum and maximum of each feature from a scaling profile.
+    #If None, values are scaled across the analyzed files.
+    scaling = None
+
+    ###################
+
+    def __init__(self, features=[], weights={}, engine="fused", verbose=True):
+        #If verbose is False, settings and warnings are not printed
+        self.verbose = verbose
+
+        if engine == "numpy" and np is None:
+            self.log("WARNING: NumPy is not installed. Using fused engine instead.")
+            self.engine = "fused"
+        elif engine in self.engines:
+            self.engine = engine
+        else:
+            self.log("WARNING: Feature engine {0} is not available. Using fused engine instead.".format(engine))
+            self.engine = "fused"
+
+        #Classification of XPOS tags for the fused and numpy engine
+        self.tag_classes = dict()
+        self.tag_table = None
+
+        #Feature functions of the reference engine, e.g. replaced by timed functions when profiling
+        self.feature_functions = None
+        if self.engine == "numpy":
+            self.vocab = TagVocabulary()
+
         if features:
             self.stats = []
             for feat in features:
                 if feat in self.available_stats:
                     self.stats.append(feat)
                 else:
-                    print("WARNING: Feature {0} is not available and will not be considered.".format(feat))
+                    self.log("WARNING: Feature {0} is not available and will not be considered.".format(feat))
         else:
             self.stats = self.available_stats
-            print("Analyzing default features.")
+            self.log("Analyzing default features.")
         
         if weights:
             self.weights = {}
@@ -48,21 +90,27 @@ class FeatureFinder(object):
                 if feat in self.available_stats:
                     self.weights[feat] = w
                 else:
-                    print("WARNING: Feature {0} is not available. Weight will not be used.".format(feat))
+                    self.log("WARNING: Feature {0} is not available. Weight will not be used.".format(feat))
         else:
             self.weights = self.default_weights
-            print("Using default weights.")
+            self.log("Using default weights.")
 
-        print()
-        print("### Settings ###")
-        print("Features:")
-        print(", ".join(self.stats))
+        self.log()
+        self.log("### Settings ###")
+        self.log("Features:")
+        self.log(", ".join(self.stats))
         
-        print()
-        print("Weights:")
+        self.log()
+        self.log("Weights:")
         for feat, weight in sorted(self.weights.items(), key=lambda l : abs(l[1]), reverse=True):
-            print(feat, ":", weight)
-        print()
+            self.log(feat, ":", weight)
+        self.log()
+
+    ###################
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
 
     ###################
 
@@ -76,9 +124,9 @@ class FeatureFinder(object):
         Return the number of tokens in the given sentence
         that are not punctuation marks.
         Input: Sentence object.
-        Output: List containing number of tokens without punctuation.
+        Output: Histogram {number of tokens without punctuation : 1}.
         """
-        return [len([1 for tok in sentence if not tok.is_punctuation()])]
+        return Counter([len([1 for tok in sentence if not tok.is_punctuation()])])
 
     ############
 
@@ -87,9 +135,9 @@ class FeatureFinder(object):
         Return the number of characters of each token
         in a given sentence. Ignore punctuation marks.
         Input: Sentence object.
-        Output: List of character counts [charsTok1, charsTok2, ...].
+        Output: Histogram of character counts {chars : number of tokens, ...}.
         """
-        return [len(tok) for tok in sentence if not tok.is_punctuation()]
+        return Counter([len(tok) for tok in sentence if not tok.is_punctuation()])
 
     ############
 
@@ -273,16 +321,11 @@ class FeatureFinder(object):
 
     ####################################
 
-    def get_features_sentence(self, sentence, feature_dict=None):
+    def get_feature_functions(self):
         """
-        Calculate the features for a given sentence by calling the corresponding functions.
-        The resulting feature table is stored in the sentence object.
-        Input: Sentence object and feature dictionary
-        Output: Sentence
+        Output: Dictionary of feature : function that computes the feature for a sentence
         """
-        if not feature_dict:
-            feature_dict = {
-                "sent_len_no_punct" : self.sentence_length_without_punctuation,
+        return {"sent_len_no_punct" : self.sentence_length_without_punctuation,
                 "word_len" : self.word_length,
                 "coordInit" : self.sentence_initial_KON,
                 "subord" : self.subordinating_conj,
@@ -293,6 +336,18 @@ class FeatureFinder(object):
                 "sent_type" : self.sentence_type,
                 "INTERJ" : self.n_interjections,
                 "PTC" : self.antwortpartikeln}
+
+    ####################################
+
+    def get_features_sentence(self, sentence, feature_dict=None):
+        """
+        Calculate the features for a given sentence by calling the corresponding functions.
+        The resulting feature table is stored in the sentence object.
+        Input: Sentence object and feature dictionary
+        Output: Sentence
+        """
+        if not feature_dict:
+            feature_dict = self.feature_functions or self.get_feature_functions()
         feat_table = dict()
         for feature in feature_dict: 
             feat_table[feature] = feature_dict[feature](sentence)
@@ -301,6 +356,245 @@ class FeatureFinder(object):
 
     ####################################
 
+    def add_feat_table(self, feat_table, other):
+        """
+        Add up the results/counts of each feature in other to feat_table.
+        Input: Feature table to update and feature table to add
+        Output: Updated feature table
+        """
+        for feat,val in other.items():
+            if feat in feat_table:
+                if isinstance(val, Counter):
+                    feat_table[feat].update(val)
+                elif type(val) == tuple:
+                    new_tup = list()
+                    for o,n in zip(feat_table[feat], val):
+                        new_tup.append(o+n)
+                    feat_table[feat] = tuple(new_tup)
+                else:
+                    feat_table[feat] += val
+            #Copy histograms, so that other is not changed later
+            elif isinstance(val, Counter):
+                feat_table[feat] = Counter(val)
+            else:
+                feat_table[feat] = val
+        return feat_table
+
+    ####################################
+
+    def subtract_feat_table(self, feat_table, other):
+        """
+        Subtract the results/counts of each feature in other from feat_table.
+        Histogram values with a count of zero are removed.
+        Input: Feature table to update and feature table to subtract
+        Output: Updated feature table
+        """
+        for feat,val in other.items():
+            if isinstance(val, Counter):
+                histogram = feat_table[feat]
+                histogram.subtract(val)
+                for value in val:
+                    if histogram[value] <= 0:
+                        del histogram[value]
+            elif type(val) == tuple:
+                feat_table[feat] = tuple(o-n for o,n in zip(feat_table[feat], val))
+            else:
+                feat_table[feat] -= val
+        return feat_table
+
+    ####################################
+    #Fused engine
+    ############
+
+    def classify_tag(self, xpos):
+        """
+        Classify an XPOS tag for the fused engine.
+        The result is cached for each tag.
+        Input: XPOS tag
+        Output: Tuple of flags (punct, dollar, KON, subord, noun, verb, lexical, PDS, ITJ, PTKANT)
+        """
+        tag_class = self.tag_classes.get(xpos)
+        if tag_class is None:
+            tag_class = (xpos in ["$.", "$,", "$("],
+                         xpos[:1] == "$",
+                         xpos == "KON",
+                         xpos in ["KOUS", "KOUI"],
+                         xpos == "NN",
+                         xpos.startswith("VV"),
+                         re.match(r"(ADJ|ADV|NN|NE|VV)\w*", xpos) != None,
+                         xpos == "PDS",
+                         xpos == "ITJ",
+                         xpos == "PTKANT")
+            self.tag_classes[xpos] = tag_class
+        return tag_class
+
+    ####################################
+
+    def get_features_sentence_fused(self, sentence):
+        """
+        Calculate the same feature table as get_features_sentence
+        with the default feature dictionary, but collect all counts
+        in a single pass over the tokens.
+        The resulting feature table is stored in the sentence object.
+        Input: Sentence object
+        Output: Sentence
+        """
+        n_words = 0
+        word_len = Counter()
+        coordInit = 0
+        only_punct = True
+        subord = 0
+        nouns, verbs = 0, 0
+        pron1st = 0
+        DEM, DEMlong, DEMshort = 0, 0, 0
+        n_lex_items = 0
+        sent_type = None
+        interj = 0
+        ptkant = 0
+
+        for tok in sentence.tokens:
+            xpos = tok.XPOS
+            punct, dollar, kon, sub, noun, verb, lex, pds, itj, ant = self.classify_tag(xpos)
+
+            #Sentence length and word length without punctuation
+            if punct or getattr(tok, "UPOS", None) == "PUNCT":
+                #Last sentence-final punctuation determines the sentence type
+                if xpos == "$.":
+                    if "?" in tok.FORM:
+                        sent_type = 0
+                    elif "!" in tok.FORM:
+                        sent_type = 1
+                    elif "." in tok.FORM or ":" in tok.FORM:
+                        sent_type = 2
+            else:
+                n_words += 1
+                word_len[len(tok)] += 1
+
+            #Coordinating conjunction only preceded by punctuation
+            if only_punct:
+                if kon:
+                    coordInit = 1
+                    only_punct = False
+                elif not dollar:
+                    only_punct = False
+
+            if sub:
+                subord += 1
+            if noun:
+                nouns += 1
+            elif verb:
+                verbs += 1
+            if lex:
+                n_lex_items += 1
+            if itj:
+                interj += 1
+            elif ant:
+                ptkant += 1
+
+            lemma = tok.LEMMA
+            if lemma == "ich" or lemma == "wir":
+                pron1st += 1
+
+            if pds:
+                DEM += 1
+                if lemma in ["dies", "diese"]:
+                    DEMlong += 1
+                elif lemma in ["der", "die"]:
+                    DEMshort += 1
+
+        if sent_type == 0:
+            sent_type = (1, 0, 0)
+        elif sent_type == 1:
+            sent_type = (0, 1, 0)
+        else:
+            sent_type = (0, 0, 1)
+
+        sentence.feat_table = {
+            "sent_len_no_punct" : Counter([n_words]),
+            "word_len" : word_len,
+            "coordInit" : coordInit,
+            "subord" : subord,
+            "nominal_verbal_style" : (nouns, verbs),
+            "PRON1st" : pron1st,
+            "DEM" : (DEM, DEMlong, DEMshort),
+            "lexical_items" : n_lex_items,
+            "sent_type" : sent_type,
+            "INTERJ" : interj,
+            "PTC" : ptkant}
+        return sentence
+
+    ####################################
+    #NumPy engine
+    ############
+
+    def get_tag_table(self):
+        """
+        Return the tag classification for all tags of the vocabulary
+        as a boolean array with one row per tag code.
+        The table is updated when new tags were added to the vocabulary.
+        Output: Boolean array (tags x flags)
+        """
+        if self.tag_table is None or len(self.tag_table) < len(self.vocab):
+            self.tag_table = np.array([self.classify_tag(tag) for tag in self.vocab.tags], dtype=bool)
+        return self.tag_table
+
+    ####################################
+
+    def get_features_arrays(self, arrays):
+        """
+        Calculate the feature table of a document (or part of a document)
+        from its tag arrays. Each count is a masked reduction over all tokens,
+        sentence-level counts are computed with the sentence offsets.
+        The result is the same as adding up the feature tables of all sentences.
+        Input: DocArrays object
+        Output: Feature table
+        """
+        table = self.get_tag_table()[arrays.xpos]
+        punct, dollar, kon, sub, noun, verb, lex, pds, itj, ant = table.T
+        lemma = arrays.lemma
+
+        #Sentence length and word length without punctuation
+        words = ~(punct | arrays.upos_punct)
+        sent_len = arrays.sentence_sums(words)
+
+        #Coordinating conjunction only preceded by punctuation
+        first = arrays.sentence_first(~dollar)
+        coordInit = np.count_nonzero(kon[first[first >= 0]])
+
+        #Sentence type from the last sentence-final punctuation
+        last = arrays.sentence_last(arrays.sent_type > 0)
+        types = arrays.sent_type[last[last >= 0]]
+        question = np.count_nonzero(types == QUESTION)
+        exclamation = np.count_nonzero(types == EXCLAMATION)
+
+        #Lemmas: 1 = ich, 2 = wir, 3/4 = dies/diese, 5/6 = der/die
+        DEMlong = pds & ((lemma == 3) | (lemma == 4))
+        DEMshort = pds & ((lemma == 5) | (lemma == 6))
+
+        return {"sent_len_no_punct" : self.get_histogram(sent_len),
+                "word_len" : self.get_histogram(arrays.length[words]),
+                "coordInit" : int(coordInit),
+                "subord" : int(np.count_nonzero(sub)),
+                "nominal_verbal_style" : (int(np.count_nonzero(noun)), int(np.count_nonzero(verb))),
+                "PRON1st" : int(np.count_nonzero((lemma == 1) | (lemma == 2))),
+                "DEM" : (int(np.count_nonzero(pds)), int(np.count_nonzero(DEMlong)), int(np.count_nonzero(DEMshort))),
+                "lexical_items" : int(np.count_nonzero(lex)),
+                "sent_type" : (int(question), int(exclamation), int(arrays.n_sents - question - exclamation)),
+                "INTERJ" : int(np.count_nonzero(itj)),
+                "PTC" : int(np.count_nonzero(ant))}
+
+    ####################################
+
+    def get_histogram(self, values):
+        """
+        Input: Array of non-negative integers
+        Output: Histogram {value : count, ...}
+        """
+        counts = np.bincount(values)
+        return Counter({value : int(count) for value, count in enumerate(counts.tolist()) if count})
+
+    ####################################
+
     def get_features_text(self, doc):
         """
         Add up the results/counts of each feature for all sentences.
@@ -310,17 +604,7 @@ class FeatureFinder(object):
         """
         feat_table = dict()
         for sent in doc.sentences:
-            for feat,val in sent.feat_table.items():
-                if feat in feat_table:
-                    if type(val) == tuple:
-                        new_tup = list()
-                        for o,n in zip(feat_table[feat], sent.feat_table[feat]):
-                            new_tup.append(o+n)
-                        feat_table[feat] = tuple(new_tup)
-                    else:
-                        feat_table[feat] += val
-                else:
-                    feat_table[feat] = val
+            self.add_feat_table(feat_table, sent.feat_table)
         doc.feat_table = feat_table
         return doc
 
@@ -337,17 +621,7 @@ class FeatureFinder(object):
         n_sents = 0
         for doc in corpus.files:
             n_sents += doc.n_sents
-            for feat,val in doc.feat_table.items():
-                if feat in feat_table:
-                    if type(val) == tuple:
-                        new_tup = list()
-                        for o,n in zip(feat_table[feat], doc.feat_table[feat]):
-                            new_tup.append(o+n)
-                        feat_table[feat] = tuple(new_tup)
-                    else:
-                        feat_table[feat] += val
-                else:
-                    feat_table[feat] = val
+            self.add_feat_table(feat_table, doc.feat_table)
         corpus.feat_table = feat_table
         corpus.n_sents = n_sents
         return corpus
@@ -361,8 +635,16 @@ class FeatureFinder(object):
         Input: Doc object
         Output: Doc object
         """
-        for sent in doc.sentences:
-            sent = self.get_features_sentence(sent)
+        if self.engine == "numpy":
+            doc.feat_table = self.get_features_arrays(DocArrays.from_sentences(doc.sentences, self.vocab))
+            return doc
+
+        elif self.engine == "fused":
+            for sent in doc.sentences:
+                sent = self.get_features_sentence_fused(sent)
+        else:
+            for sent in doc.sentences:
+                sent = self.get_features_sentence(sent)
     
         doc = self.get_features_text(doc)
 
@@ -370,20 +652,139 @@ class FeatureFinder(object):
 
     ###################################
 
+    def find_features_stream(self, doc, sentences):
+        """
+        Get values for all features from a stream of sentences.
+        The counts are added up sentence by sentence and
+        the sentences are not kept in the doc object.
+        Input: Doc object and iterable of Sentence objects
+        Output: Doc object
+        """
+        feat_table = dict()
+        n_sents = 0
+
+        #Convert chunks of sentences to arrays
+        if self.engine == "numpy":
+            chunk = []
+            for sent in sentences:
+                chunk.append(sent)
+                n_sents += 1
+                if len(chunk) == self.chunk_size:
+                    self.add_feat_table(feat_table, self.get_features_arrays(DocArrays.from_sentences(chunk, self.vocab)))
+                    chunk = []
+            if chunk or not n_sents:
+                self.add_feat_table(feat_table, self.get_features_arrays(DocArrays.from_sentences(chunk, self.vocab)))
+
+            doc.feat_table = feat_table
+            doc.n_sents = n_sents
+            return doc
+
+        if self.engine == "fused":
+            get_features_sentence = self.get_features_sentence_fused
+        else:
+            get_features_sentence = self.get_features_sentence
+
+        for sent in sentences:
+            sent = get_features_sentence(sent)
+            self.add_feat_table(feat_table, sent.feat_table)
+            n_sents += 1
+
+        doc.feat_table = feat_table
+        doc.n_sents = n_sents
+
+        return doc
+
+    ###################################
+
+    def iter_features(self, sentences):
+        """
+        Compute the feature table of each sentence in a stream of sentences.
+        The numpy engine works on whole documents, so the fused engine is used instead.
+        Input: Iterable of Sentence objects
+        Output: Generator of Sentence objects with feature table
+        """
+        if self.engine == "reference":
+            get_features_sentence = self.get_features_sentence
+        else:
+            get_features_sentence = self.get_features_sentence_fused
+
+        for sent in sentences:
+            yield get_features_sentence(sent)
+
+    ###################################
+
     def sum_features(self, corpus):
         corpus = self.get_features_corpus(corpus)
         return corpus
     
     ###################################
+
+    def histogram_mean(self, histogram):
+        """
+        Compute the exact mean of the values in a histogram.
+        Like statistics.mean, the result is an int if the mean of the int values is integral.
+        Input: Histogram {value : count, ...}
+        Output: Mean
+        """
+        n = sum(histogram.values())
+        if n < 1:
+            raise statistics.StatisticsError("mean requires at least one data point")
+        total = sum(value * count for value, count in histogram.items())
+        if total % n == 0:
+            return total // n
+        return total / n
+
+    ###################################
+
+    def histogram_median(self, histogram):
+        """
+        Compute the median of the values in a histogram.
+        Like statistics.median, the mean of the two middle values
+        is returned if the number of values is even.
+        Input: Histogram {value : count, ...}
+        Output: Median
+        """
+        n = sum(histogram.values())
+        if n == 0:
+            raise statistics.StatisticsError("no median for empty data")
+
+        #Positions of the middle value(s) in the sorted values
+        lower, upper = (n - 1) // 2, n // 2
+        lower_val = None
+        seen = 0
+        for value, count in sorted(histogram.items()):
+            seen += count
+            if lower_val is None and seen > lower:
+                lower_val = value
+            if seen > upper:
+                if n % 2 == 1:
+                    return value
+                return (lower_val + value) / 2
+
+    ###################################
     
+    def has_words(self, obj):
+        """
+        Input: Doc, segment or corpus with feature table
+        Output: True if it contains at least one word (without punctuation), False otherwise.
+        """
+        feat_table = getattr(obj, "feat_table", None) or dict()
+        return any(length > 0 and count > 0 for length, count in feat_table.get("sent_len_no_punct", dict()).items())
+
+    ###################################
+
     def compute_stats(self, obj):
         
+        #Documents without words have no sentence or word lengths
+        if not self.has_words(obj):
+            raise ValueError("{0} does not contain any words.".format(getattr(obj, "filename", "The text")))
+
         stats_table = dict()
 
-        stats_table["mean_sent"] = statistics.mean(obj.feat_table["sent_len_no_punct"])
-        stats_table["med_sent"] = statistics.median(obj.feat_table["sent_len_no_punct"])
-        stats_table["mean_word"] = statistics.mean(obj.feat_table["word_len"])
-        stats_table["med_word"] = statistics.median(obj.feat_table["word_len"])
+        stats_table["mean_sent"] = self.histogram_mean(obj.feat_table["sent_len_no_punct"])
+        stats_table["med_sent"] = self.histogram_median(obj.feat_table["sent_len_no_punct"])
+        stats_table["mean_word"] = self.histogram_mean(obj.feat_table["word_len"])
+        stats_table["med_word"] = self.histogram_median(obj.feat_table["word_len"])
         
         try:
             stats_table["subord"] = round(obj.feat_table["subord"] / obj.feat_table["nominal_verbal_style"][1], 10)
@@ -399,7 +800,7 @@ class FeatureFinder(object):
         except ZeroDivisionError:
             stats_table["V:N"] = None
 
-        n_words = sum(obj.feat_table["sent_len_no_punct"])
+        n_words = sum(length * count for length, count in obj.feat_table["sent_len_no_punct"].items())
         stats_table["lexDens"] = round(obj.feat_table["lexical_items"] / n_words, 10)
         stats_table["PRON1st"] = round(obj.feat_table["PRON1st"] / n_words, 10)
 
@@ -419,32 +820,53 @@ class FeatureFinder(object):
 
     ###################################
 
-    def scale_feature_values(self, results):
+    def get_ranges(self, results):
+        """
+        Input: Dictionary of stats tables
+        Output: Dictionary of feature : (min value, max value)
+        """
+        ranges = dict()
+        for feat in self.stats:
+            vals = [stats_table[feat] for stats_table in results.values() if not stats_table[feat] == None]
+            if vals:
+                ranges[feat] = (min(vals), max(vals))
+            else:
+                ranges[feat] = (0, 0)
+        return ranges
+
+    ###################################
+
+    def scale_feature_values(self, results, ranges=None):
+        """
+        Scale the feature values to [0, 1] with the min and max value of each feature.
+        If no ranges are given, the ranges of the scaling profile are used.
+        Features without a range are scaled across the results.
+        Input: Dictionary of stats tables and dictionary of feature : (min value, max value)
+        Output: Dictionary of scaled stats tables
+        """
+        if ranges is None:
+            ranges = self.scaling or dict()
+        if any(not feat in ranges for feat in self.stats):
+            ranges = dict(self.get_ranges(results), **ranges)
+
         scaled_results = dict()
 
-        for filename in results:
-            scaled_results[filename] = dict()
-            for key in results[filename]:
-                if not key in self.stats:
-                    scaled_results[filename][key] = results[filename][key]
+        stats = set(self.stats)
+        for filename, stats_table in results.items():
+            scaled_results[filename] = {key : val for key, val in stats_table.items() if not key in stats}
 
         for feat in self.stats:
             #Get min and max val for each feature
-            vals = [results[f][feat] for f in results if not results[f][feat] == None]
-            if vals:
-                min_val = min(vals)
-                max_val = max(vals)
-            else:
-                min_val = 0
-                max_val = 0
+            min_val, max_val = ranges[feat]
             
             #Transform feature values
-            for filename in results:
-                if results[filename][feat] == None:
+            for filename, stats_table in results.items():
+                val = stats_table[feat]
+                if val == None:
                     scaled_results[filename][feat] = 0.0
                 else:
                     try:
-                        scaled_results[filename][feat] = (results[filename][feat] - min_val) / (max_val - min_val)
+                        scaled_results[filename][feat] = (val - min_val) / (max_val - min_val)
                     except ZeroDivisionError:
                         scaled_results[filename][feat] = 0.0
         
@@ -521,25 +943,119 @@ class FeatureFinder(object):
                 results[filename]["file"] = os.path.splitext(filename)[0] 
         columns += self.stats
 
+        self.write_results(results, columns, outdir)
+
+    #######################################
+
+    def write_results(self, results, columns, outdir, name="results"):
+        """
+        Scale the results, calculate the orality score and
+        write original and scaled results to the output folder.
+        The format of the files is given by output_format.
+        Input: Dictionary of stats tables, list of output columns, output folder
+               and name of the output files
+        """
         #Scale results
         scaled_results = self.scale_feature_values(results)
         #Calculate score based on scaled results
         scaled_results = self.calculate_score(scaled_results)
 
-        outfile_orig = open(outdir + "/results.csv", mode="w", encoding="utf-8")
-        outfile_scaled = open(outdir + "/results_scaled.csv", mode="w", encoding="utf-8")
+        numeric = self.get_numeric_columns(results, columns) + ["orality_score"]
+
+        #Output original values
+        with writer.get_writer(self.output_format, outdir + "/" + name, columns, numeric) as outfile:
+            outfile.write_rows(stats_table for _, stats_table in sorted(results.items()))
+
+        #Output scaled results plus score
+        with writer.get_writer(self.output_format, outdir + "/" + name + "_scaled", columns + ["orality_score"], numeric) as outfile:
+            outfile.write_rows(stats_table for _, stats_table in sorted(scaled_results.items()))
+
+    #######################################
+
+    def get_numeric_columns(self, results, columns):
+        """
+        Input: Dictionary of stats tables and list of columns
+        Output: List of columns that only contain numbers (or None)
+        """
+        return [col for col in columns
+                if all(isinstance(stats_table[col], (int, float)) for stats_table in results.values()
+                       if stats_table[col] is not None)]
+
+    #######################################
+
+    def read_results(self, file):
+        """
+        Read the original values from a results file written by output_stats.
+        Feature values are converted back to numbers, other columns are kept as strings.
+        The results are numbered in the order of the file.
+        Input: Filename of results.csv
+        Output: List of columns and dictionary of stats tables
+        """
+        infile = open(file, mode="r", encoding="utf-8")
+        columns = infile.readline().rstrip("\n").split("\t")
+        rows = [line.rstrip("\n").split("\t") for line in infile if line.strip()]
+        infile.close()
+
+        #Convert feature values column by column
+        values = list()
+        for i, col in enumerate(columns):
+            column = [row[i] for row in rows]
+            if col in self.available_stats:
+                column = [self.read_value(val) for val in column]
+            values.append(column)
+
+        results = {i : dict(zip(columns, row)) for i, row in enumerate(zip(*values))}
+
+        return columns, results
 
-        #Output header
-        print("\t".join(columns), file=outfile_orig)
-        print("\t".join(columns), "orality_score", sep="\t", file=outfile_scaled)
+    #######################################
+
+    def read_value(self, val):
+        """
+        Convert a feature value from the results file
+        back to the same type as computed by compute_stats.
+        Input: String
+        Output: None, int or float
+        """
+        if val == "None":
+            return None
+        elif "." in val or "e" in val or "n" in val:
+            return float(val)
+        else:
+            return int(val)
 
-        #Print original values
-        for _, stats_table in sorted(results.items()):
-            print("\t".join([str(stats_table[val]) for val in columns]), file=outfile_orig)
 
-        #Print scaled results plus score
-        for _, stats_table in sorted(scaled_results.items()):
-            print("\t".join([str(stats_table[val]) for val in columns+["orality_score"]]), file=outfile_scaled)
+#############################
 
-        outfile_orig.close()
-        outfile_scaled.close()
+def write_scaling_profile(file, ranges, version="", **settings):
+    """
+    Save the min and max value of each feature.
+    Input: Filename, dictionary of feature : (min value, max value),
+           version of COAST and settings of the calibration
+    """
+    profile = {"version" : version}
+    profile.update(settings)
+    profile["features"] = {feat : {"min" : min_val, "max" : max_val} for feat, (min_val, max_val) in ranges.items()}
+    with open(file, mode="w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+
+#############################
+
+def read_scaling_profile(file, verbose=True):
+    """
+    Input: Filename of a scaling profile and whether to print an error message
+    Output: Dictionary of feature : (min value, max value)
+            and dictionary of settings (or None, None)
+    """
+    try:
+        with open(file, mode="r", encoding="utf-8") as f:
+            profile = json.load(f)
+        ranges = {feat : (val["min"], val["max"]) for feat, val in profile.pop("features").items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        if verbose:
+            print("ERROR: Cannot read scaling profile {0}.".format(file))
+        return None, None
+
+    return ranges, profile
+
+#############################
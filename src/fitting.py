@@ -0,0 +1,264 @@
+'''
+Module to fit the weights of the orality score to expert ratings
+(e.g. the KaJuK scores) with cross-validation.
+The document x feature matrix is built once from a results file
+and scaled with the ranges of the training documents of each fold.
+All folds and candidate settings are computed at once with NumPy.
+
+Methods:
+    correlation: the weight of each feature is its correlation with the ratings
+                 (like the default weights)
+    ridge:       the weights are fitted by ridge regression on the standardized ratings
+'''
+
+from tagarrays import np
+
+############################
+
+def get_matrix(finder, results, target, group=None):
+    """
+    Collect the feature values, ratings and groups of the documents.
+    Documents without rating are skipped.
+    The values are scaled later with the ranges of the training documents of each fold.
+    Input: FeatureFinder, dictionary of stats tables (e.g. from read_results),
+           name of the rating column and name of the group column (optional)
+    Output: Matrix of values (documents x features, NaN for missing values),
+            vector of ratings and array of groups (or None)
+    """
+    rows, ratings, groups = list(), list(), list()
+    for key, stats_table in sorted(results.items()):
+        try:
+            rating = float(stats_table[target])
+        except (TypeError, ValueError):
+            continue
+        if rating != rating:
+            continue
+        rows.append([np.nan if stats_table[feat] is None else stats_table[feat] for feat in finder.stats])
+        ratings.append(rating)
+        if group is not None:
+            groups.append(stats_table[group])
+
+    X = np.array(rows, dtype=np.float64).reshape(len(rows), len(finder.stats))
+    y = np.array(ratings, dtype=np.float64)
+
+    return X, y, np.array(groups) if group is not None else None
+
+############################
+
+def get_ranges(finder, X, train):
+    """
+    Min and max value of each feature in the training documents of each fold.
+    Features of the scaling profile keep the saved values in all folds.
+    Input: FeatureFinder, matrix of values and training matrix (folds x documents)
+    Output: Arrays of min and max values (folds x features)
+    """
+    valid = (train[:, :, None] > 0) & ~np.isnan(X)[None, :, :]
+    values = np.broadcast_to(X, valid.shape)
+    min_val = np.min(values, axis=1, where=valid, initial=np.inf)
+    max_val = np.max(values, axis=1, where=valid, initial=-np.inf)
+
+    #Features without values have the range (0, 0) as in FeatureFinder.get_ranges
+    empty = ~valid.any(axis=1)
+    min_val[empty] = 0
+    max_val[empty] = 0
+
+    for j, feat in enumerate(finder.stats):
+        if finder.scaling is not None and feat in finder.scaling:
+            min_val[:, j], max_val[:, j] = finder.scaling[feat]
+
+    return min_val, max_val
+
+############################
+
+def scale(X, min_val, max_val):
+    """
+    Scale the values with the ranges of each fold as in FeatureFinder.scale_feature_values.
+    Missing values and features with the same min and max value are scaled to 0.
+    Input: Matrix of values (documents x features) and arrays of min and max values (folds x features)
+    Output: Array of scaled values (folds x documents x features)
+    """
+    span = (max_val - min_val)[:, None, :]
+    shape = (min_val.shape[0],) + X.shape
+    return np.divide(X[None, :, :] - min_val[:, None, :], span, out=np.zeros(shape),
+                     where=(span != 0) & ~np.isnan(X)[None, :, :])
+
+############################
+
+def get_folds(n_docs, groups=None, k=5, repeat=1, seed=0):
+    """
+    Assign each document to a test fold.
+    With groups, each group (e.g. text) is one fold (leave one group out).
+    Otherwise, the documents are shuffled and split into k folds,
+    repeat times with different shuffles.
+    Input: Number of documents, array of groups (optional),
+           number of folds, number of repetitions and random seed
+    Output: Array of fold numbers (repetitions x documents) and number of folds
+    """
+    if groups is not None:
+        _, folds = np.unique(groups, return_inverse=True)
+        return folds.reshape(1, n_docs), int(folds.max()) + 1
+
+    rng = np.random.default_rng(seed)
+    k = max(2, min(k, n_docs))
+    folds = np.empty((repeat, n_docs), dtype=np.int64)
+    for r in range(repeat):
+        folds[r, rng.permutation(n_docs)] = np.arange(n_docs) % k
+    #Fold numbers are unique across repetitions
+    folds += (np.arange(repeat) * k)[:, None]
+    return folds, k * repeat
+
+############################
+
+def get_train_weights(folds, n_folds):
+    """
+    Input: Array of fold numbers (repetitions x documents) and number of folds
+    Output: Matrix (folds x documents) with 1 for training and 0 for test documents
+    """
+    train = np.ones((n_folds, folds.shape[1]))
+    for r in range(folds.shape[0]):
+        train[folds[r], np.arange(folds.shape[1])] = 0
+    return train
+
+############################
+
+def get_moments(X, y, train):
+    """
+    Means, covariances and variances of features and ratings
+    of the training documents of all folds.
+    Input: Array of scaled values (folds x documents x features), vector of ratings
+           and training matrix (folds x documents)
+    Output: Dictionary of arrays with one row per fold
+    """
+    n = train.sum(axis=1)
+    mean_x = np.einsum("fd,fdj->fj", train, X) / n[:, None]
+    mean_y = train @ y / n
+    cov_xy = np.einsum("fd,fdj,d->fj", train, X, y) / n[:, None] - mean_x * mean_y[:, None]
+    var_x = np.einsum("fd,fdj,fdj->fj", train, X, X) / n[:, None] - mean_x**2
+    var_y = train @ (y * y) / n - mean_y**2
+    return {"n" : n, "mean_x" : mean_x, "mean_y" : mean_y,
+            "cov_xy" : cov_xy, "var_x" : np.maximum(var_x, 0), "var_y" : np.maximum(var_y, 0)}
+
+############################
+
+def correlation_weights(moments):
+    """
+    Input: Moments of the training documents of all folds
+    Output: Array of weights (folds x 1 x features)
+    """
+    denominator = np.sqrt(moments["var_x"] * moments["var_y"][:, None])
+    weights = np.divide(moments["cov_xy"], denominator, out=np.zeros_like(denominator), where=denominator > 0)
+    return weights[:, None, :]
+
+############################
+
+def ridge_weights(X, train, moments, alphas):
+    """
+    Ridge regression of the standardized ratings on the scaled features
+    for all folds and regularization strengths at once.
+    Input: Array of scaled values (folds x documents x features), training matrix (folds x documents),
+           moments of the training documents and list of regularization strengths
+    Output: Array of weights (folds x alphas x features)
+    """
+    n, mean_x = moments["n"], moments["mean_x"]
+    #Covariance matrices of the features per fold
+    cov_x = np.einsum("fd,fdi,fdj->fij", train, X, X) / n[:, None, None] - mean_x[:, :, None] * mean_x[:, None, :]
+
+    std_y = np.sqrt(moments["var_y"])
+    std_y[std_y == 0] = 1
+    cov_xy = moments["cov_xy"] / std_y[:, None]
+
+    p = X.shape[2]
+    A = cov_x[:, None, :, :] + np.asarray(alphas, dtype=np.float64)[None, :, None, None] * np.eye(p)
+    b = np.broadcast_to(cov_xy[:, None, :], A.shape[:3])
+    return np.linalg.solve(A, b[..., None])[..., 0]
+
+############################
+
+def pearson(predictions, y):
+    """
+    Input: Array of predictions (... x documents) and vector of ratings
+    Output: Array of correlations (0 if a prediction is constant)
+    """
+    p = predictions - predictions.mean(axis=-1, keepdims=True)
+    t = y - y.mean()
+    denominator = np.sqrt((p * p).sum(axis=-1) * (t * t).sum())
+    return np.divide((p * t).sum(axis=-1), denominator, out=np.zeros(p.shape[:-1]), where=denominator > 0)
+
+############################
+
+def evaluate(X, y, folds, weights):
+    """
+    Score each document with the weights of the fold in which it is a test document
+    and correlate the scores with the ratings.
+    Input: Array of scaled values (folds x documents x features), vector of ratings,
+           array of fold numbers (repetitions x documents)
+           and array of weights (folds x candidates x features)
+    Output: Array of correlations (repetitions x candidates)
+    """
+    #Values scaled with the ranges of the test fold of each document: repetitions x documents x features
+    test_values = X[folds, np.arange(X.shape[1])]
+    #Weights of the test fold of each document: repetitions x documents x candidates x features
+    test_weights = weights[folds]
+    predictions = np.einsum("rdj,rdcj->rcd", test_values, test_weights)
+    return pearson(predictions, y)
+
+############################
+
+def cross_validate(finder, X, y, folds, n_folds, methods=["correlation", "ridge"], alphas=[0.01, 0.1, 1.0]):
+    """
+    The values of each fold are scaled with the ranges of its training documents,
+    so the test documents do not influence the scaling.
+    Input: FeatureFinder, matrix of values, vector of ratings, array of fold numbers,
+           number of folds, list of methods and list of regularization strengths
+    Output: List of (method, alpha, mean correlation, standard deviation) for each candidate
+    """
+    train = get_train_weights(folds, n_folds)
+    X = scale(X, *get_ranges(finder, X, train))
+    moments = get_moments(X, y, train)
+
+    candidates, weights = list(), list()
+    if "correlation" in methods:
+        candidates.append(("correlation", None))
+        weights.append(correlation_weights(moments))
+    if "ridge" in methods and alphas:
+        candidates.extend(("ridge", alpha) for alpha in alphas)
+        weights.append(ridge_weights(X, train, moments, alphas))
+
+    correlations = evaluate(X, y, folds, np.concatenate(weights, axis=1))
+
+    return [(method, alpha, float(correlations[:, i].mean()), float(correlations[:, i].std()))
+            for i, (method, alpha) in enumerate(candidates)]
+
+############################
+
+def fit(finder, X, y, method="correlation", alpha=None):
+    """
+    Fit the weights on all documents, scaled with the ranges of all documents.
+    Input: FeatureFinder, matrix of values, vector of ratings, method and regularization strength
+    Output: Vector of weights
+    """
+    train = np.ones((1, X.shape[0]))
+    X = scale(X, *get_ranges(finder, X, train))
+    moments = get_moments(X, y, train)
+    if method == "ridge":
+        return ridge_weights(X, train, moments, [alpha])[0, 0]
+    return correlation_weights(moments)[0, 0]
+
+############################
+
+def write_weights_file(file, weights, comments=[]):
+    """
+    Save the weights in the format of weights.config.
+    Input: Filename, dictionary of feature : weight and list of comment lines
+    """
+    with open(file, mode="w", encoding="utf-8") as f:
+        print("# Assign weights to each feature that should be used to calculate the orality score.", file=f)
+        print("# Positive values correspond to indicators of orality, negative values to indicators of literal language.", file=f)
+        print("# Features and weights are given as key-value pairs, separated by spaces and a colon.", file=f)
+        for line in comments:
+            print("#", line, file=f)
+        print(file=f)
+        for feat, weight in sorted(weights.items(), key=lambda l : abs(l[1]), reverse=True):
+            print(feat, ":", weight, file=f)
+
+############################
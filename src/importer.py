@@ -6,16 +6,200 @@ Created on 14.10.2019
 '''
 
 import os
+import io
+import mmap
+from sys import intern
+from operator import itemgetter
+from itertools import chain
 from corpus import Doc, Sentence, Token
+from binary import BinaryDoc
+from processor import Pipeline
+import inputs
 
 ############################
 
 class Importer(object):
 
+    #Names of the columns to import, None imports all columns
+    columns = None
+
+    #Read files line by line ("text") or as memory-mapped blocks ("mmap")
+    reader = "text"
+
+    #Number of bytes that are decoded at once by the mmap reader
+    blocksize = 1024*1024
+
+    #Processor pipeline that is applied while the sentences are read
+    pipeline = None
+
+    #Print error messages for files that cannot be imported
+    verbose = True
+
+    ###############################
+
     def __init__(self, **kwargs):
         for key,val in kwargs.items():
             self.__dict__[key] = val
 
+    ###############################
+
+    def import_file(self, file, data=None):
+        """
+        Read the whole file into a Doc object.
+        If the content of the file has been read already, it is parsed from data.
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: Doc object or None
+        """
+        doc, sentences = self.stream_file(file, data)
+        if doc is None:
+            return None
+
+        for sentence in sentences:
+            doc.add_sent(sentence)
+
+        return doc
+
+    ###############################
+
+    def open_file(self, file, data=None):
+        """
+        Open the file for reading with the selected reader.
+        If the content of the file has been read already, the lines are read from data.
+        Compressed files and archive members are decompressed while reading.
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: Iterator of lines
+        """
+        if data is not None:
+            return io.StringIO(data.decode("utf-8"))
+        elif not inputs.is_plain(file):
+            return inputs.open_text(file)
+        elif self.reader == "text":
+            return open(file, mode="r", encoding="utf-8")
+        return chain.from_iterable(self.read_mmap(file))
+
+    ###############################
+
+    def close_file(self, lines):
+        """
+        Close a file opened with open_file.
+        Memory-mapped files are closed when all lines have been read.
+        """
+        if hasattr(lines, "close"):
+            lines.close()
+
+    ###############################
+
+    def read_mmap(self, file):
+        """
+        Read the file as memory-mapped blocks of complete lines.
+        Each block is decoded at once and split into lines.
+        Input: Filename (including path)
+        Output: Generator of lists of lines (without line breaks)
+        """
+        with open(file, mode="rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            start = 0
+            while start < size:
+                #End block after the last line break
+                end = start + self.blocksize
+                if end < size:
+                    linebreak = data.rfind(b"\n", start, end)
+                    if linebreak < 0:
+                        linebreak = data.find(b"\n", end)
+                    end = linebreak + 1 if linebreak >= 0 else size
+                else:
+                    end = size
+
+                lines = data[start:end].decode("utf-8").split("\n")
+                #Drop the empty string after the last line break
+                if not lines[-1]:
+                    lines.pop()
+                yield lines
+
+                start = end
+        finally:
+            data.close()
+
+    ###############################
+
+    def project_columns(self, columns):
+        """
+        Only keep the columns that should be imported.
+        Input: Dictionary of column names and indices
+        Output: Dictionary of the selected column names and indices
+        """
+        if self.columns is None:
+            return columns
+        return {col : i for col, i in columns.items() if col in self.columns}
+
+    ###############################
+
+    def get_value_getter(self, indices):
+        """
+        Create a function that returns the values of the given columns
+        from a split token line. Missing values at the end of the line are set to "_".
+        Tags and forms repeat a lot, so the strings are shared.
+        Input: List of column indices
+        Output: Function that maps a list of values to a list of selected values
+        """
+        if not indices:
+            return lambda line : []
+
+        getter = itemgetter(*indices)
+        n_cols = max(indices) + 1
+
+        def get_values(line):
+            if len(line) < n_cols:
+                return [intern(line[i]) if i < len(line) else "_" for i in indices]
+            elif len(indices) == 1:
+                return [intern(getter(line))]
+            return list(map(intern, getter(line)))
+
+        return get_values
+
+    ###############################
+
+    def get_token_processor(self):
+        """
+        Output: Function that processes a single token if the pipeline
+                only consists of token-level processors, None otherwise
+        """
+        if self.pipeline and self.pipeline.is_token_level():
+            return self.pipeline.process_token
+        return None
+
+    ###############################
+
+    def apply_pipeline(self, sentences):
+        """
+        Apply the pipeline to each sentence if it was not applied
+        to the tokens already while they were created.
+        Input: Iterable of Sentence objects
+        Output: Iterable of Sentence objects
+        """
+        if self.pipeline and not self.pipeline.is_token_level():
+            return self.pipeline.process_sentences(sentences)
+        return sentences
+
+    ###############################
+
+    def make_sentence(self, tokens, metainfo):
+        """
+        Create a sentence from the collected tokens and meta information.
+        If there is no text in the meta information, it is created from the tokens when needed.
+        Input: List of tokens and dictionary of meta information
+        Output: Sentence object
+        """
+        sentence = Sentence(**metainfo)
+        for tok in tokens:
+            sentence.add_token(tok)
+        return sentence
+
 ############################
 
 class CoNLLUPlusImporter(Importer):
@@ -33,7 +217,10 @@ class CoNLLUPlusImporter(Importer):
 
         line = ""
         while not line.strip():
-            line = file.__next__()
+            line = next(file, None)
+            #Empty file
+            if line is None:
+                return columns
 
         if line.strip().startswith("#"):
         
@@ -45,70 +232,91 @@ class CoNLLUPlusImporter(Importer):
 
     ###############################
 
-    def import_file(self, file):
-        
-        _, filename = os.path.split(file)
+    def stream_file(self, file, data=None):
+        """
+        Open the file for reading sentence by sentence.
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: Empty Doc object (or None) and generator of Sentence objects
+        """
+        filename = inputs.get_filename(file)
     
         #Open file
-        conllfile = open(file, mode="r", encoding="utf-8")
+        conllfile = self.open_file(file, data)
         
         #Get columns
         columns = self.get_columns(conllfile)
         if not columns:
-            print("ERROR: Missing column information for {0}.".format(filename))
-            return None
+            if self.verbose:
+                print("ERROR: Missing column information for {0}.".format(filename))
+            self.close_file(conllfile)
+            return None, iter(())
 
         #Create doc object
         doc = Doc(filename)
 
-        tokens = list()
-        metainfo = dict()
+        return doc, self.apply_pipeline(self.read_sentences(conllfile, columns))
 
-        for line in conllfile:
+    ###############################
 
-            #Empty line = end of sentence
-            if not line.strip() and tokens:
-                if not "text" in metainfo:
-                    metainfo["text"] = " ".join([tok.FORM for tok in tokens])
-                sentence = Sentence(**metainfo)
-                for tok in tokens:
-                    sentence.add_token(tok)
+    def read_sentences(self, conllfile, columns):
+        """
+        Read the sentences from an open file.
+        Input: File object and dictionary of columns
+        Output: Generator of Sentence objects
+        """
+        tokens = list()
+        metainfo = dict()
+        #Sentence has token lines (tokens may be removed by processors)
+        in_sentence = False
+        process_token = self.get_token_processor()
+
+        #Tokens get one slot per column
+        columns = self.project_columns(columns)
+        token_class = Token.with_columns(columns)
+        indices = list(columns.values())
+        get_values = self.get_value_getter(indices)
+        #Only split the line up to the last needed column
+        maxsplit = max(indices, default=-1) + 1
+
+        try:
+            for line in conllfile:
+                stripped = line.strip()
+
+                #Empty line = end of sentence
+                if not stripped:
+                    if in_sentence:
+                        sentence = self.make_sentence(tokens, metainfo)
+                        tokens.clear()
+                        metainfo.clear()
+                        in_sentence = False
+                        yield sentence
+
+                #Comment line = meta data
+                elif stripped[0] == "#":
+                    line = line.lstrip("#").strip().split("=")
+                    metainfo[line[0].strip()] = "=".join(line[1:]).strip() 
+
+                #Token line
+                else:
+                    tok = token_class(get_values(stripped.split("\t", maxsplit)))
+                    in_sentence = True
+                    #Process tokens as they are created
+                    if process_token is not None:
+                        tok = process_token(tok)
+                        if tok is None:
+                            continue
+                    tokens.append(tok)
+
+            #If file does not end with empty line
+            #save remaining last sentence
+            if in_sentence:
+                sentence = self.make_sentence(tokens, metainfo)
                 tokens.clear()
                 metainfo.clear()
-                doc.add_sent(sentence)
-
-            #Comment line = meta data
-            elif line.strip().startswith("#"):
-                line = line.lstrip("#").strip().split("=")
-                metainfo[line[0].strip()] = "=".join(line[1:]).strip() 
-
-            #Token line
-            elif line.strip():
-                line = line.strip().split("\t")
-                values = dict()
-                for col in columns:
-                    try:
-                        values[col] = line[columns.get(col, None)]
-                    except IndexError:
-                        values[col] = "_"
-                tok = Token(**values)     
-                tokens.append(tok)
-
-        #If file does not end with empty line
-        #save remaining last sentence
-        if tokens:
-            if not "text" in metainfo:
-                metainfo["text"] = " ".join([tok.FORM for tok in tokens])
-            sentence = Sentence(**metainfo)
-            for tok in tokens:
-                sentence.add_token(tok)
-            tokens.clear()
-            metainfo.clear()
-            doc.add_sent(sentence)
-
-        conllfile.close()
+                yield sentence
 
-        return doc
+        finally:
+            self.close_file(conllfile)
 
 
 ############################
@@ -125,65 +333,200 @@ class CoNLL2000Importer(Importer):
 
     ###############################
 
-    def import_file(self, file):
-
-        _, filename = os.path.split(file)
+    def stream_file(self, file, data=None):
+        """
+        Open the file for reading sentence by sentence.
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: Empty Doc object and generator of Sentence objects
+        """
+        filename = inputs.get_filename(file)
 
         #Open file
-        conllfile = open(file, mode="r", encoding="utf-8")
+        conllfile = self.open_file(file, data)
 
         #Create doc object
         doc = Doc(filename)
 
-        tokens = list()
-        metainfo = dict()
+        return doc, self.apply_pipeline(self.read_sentences(conllfile))
 
-        for line in conllfile:
+    ###############################
 
-            #Empty line = end of sentence
-            if not line.strip() and tokens:
-                if not "text" in metainfo:
-                    metainfo["text"] = " ".join([tok.FORM for tok in tokens])
-                sentence = Sentence(**metainfo)
-                for tok in tokens:
-                    sentence.add_token(tok)
+    def read_sentences(self, conllfile):
+        """
+        Read the sentences from an open file.
+        Input: File object
+        Output: Generator of Sentence objects
+        """
+        tokens = list()
+        metainfo = dict()
+        #Sentence has token lines (tokens may be removed by processors)
+        in_sentence = False
+        process_token = self.get_token_processor()
+
+        #Tokens get one slot per column
+        columns = self.project_columns(self.COLUMNS)
+        token_class = Token.with_columns(columns)
+        get_values = self.get_value_getter(list(columns.values()))
+
+        try:
+            for line in conllfile:
+                stripped = line.strip()
+
+                #Empty line = end of sentence
+                if not stripped:
+                    if in_sentence:
+                        sentence = self.make_sentence(tokens, metainfo)
+                        tokens.clear()
+                        metainfo.clear()
+                        in_sentence = False
+                        yield sentence
+
+                #Skip comment lines
+                elif stripped[0] == "#":
+                    continue
+
+                #Token line
+                else:
+                    if "\t" in stripped:
+                        line = stripped.split("\t")
+                    else:
+                        line = stripped.split(" ")
+                    tok = token_class(get_values(line))
+                    in_sentence = True
+                    #Process tokens as they are created
+                    if process_token is not None:
+                        tok = process_token(tok)
+                        if tok is None:
+                            continue
+                    tokens.append(tok)
+
+            #If file does not end with empty line
+            #save remaining last sentence
+            if in_sentence:
+                sentence = self.make_sentence(tokens, metainfo)
                 tokens.clear()
                 metainfo.clear()
-                doc.add_sent(sentence)
+                yield sentence
+
+        finally:
+            self.close_file(conllfile)
+
+############################
+
+class BinaryImporter(Importer):
+
+    ###############################
+
+    def __init__(self, **kwargs):
+        for key,val in kwargs.items():
+            self.__dict__[key] = val
+
+    ###############################
+
+    def open_binary(self, file, data=None):
+        """
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: BinaryDoc object or None
+        """
+        try:
+            return BinaryDoc(file, data)
+        except (OSError, ValueError) as e:
+            if self.verbose:
+                print("ERROR: Cannot read {0}: {1}".format(file, e))
+            return None
+
+    ###############################
+
+    def stream_file(self, file, data=None):
+        """
+        Load a file written by the convert command sentence by sentence.
+        The doc gets the filename of the original input file.
+        Input: Filename (including path) and file content as bytes (optional)
+        Output: Empty Doc object (or None) and generator of Sentence objects
+        """
+        data = self.open_binary(file, data)
+        if data is None:
+            return None, iter(())
+
+        columns = data.columns if self.columns is None \
+                  else [col for col in data.columns if col in self.columns]
 
-            #Skip comment lines
-            elif line.strip().startswith("#"):
+        sentences = data.get_sentences(columns)
+        pipeline = self.get_pipeline(data, file)
+        if pipeline:
+            sentences = pipeline.process_sentences(sentences)
+
+        return Doc(data.filename), sentences
+
+    ###############################
+
+    def get_pipeline(self, data, file):
+        """
+        Check the processors of the pipeline against the header of a binary file.
+        Processors that were already applied by the convert command are not applied again.
+        A warning is printed (once) if a processor needs a column that is not stored.
+        Input: BinaryDoc object and filename (including path)
+        Output: Pipeline object or None
+        """
+        if self.pipeline is None:
+            return None
+
+        applied = data.header.get("processors", [])
+        processors = list()
+        for p in self.pipeline.processors:
+            name = type(p).__name__
+            if name in applied:
+                self.warn((name, None), "WARNING: {0} was already applied to {1} by the convert command and is skipped.".format(name, file))
                 continue
+            for col in p.columns:
+                if not col in data.columns:
+                    self.warn((name, col), "WARNING: Column {0} needed by {1} is not stored in {2}. Convert the files again to use {1}.".format(col, name, file))
+            processors.append(p)
+
+        if len(processors) == len(self.pipeline.processors):
+            return self.pipeline
+        elif not processors:
+            return None
 
-            #Token line
-            elif line.strip():
-                if "\t" in line.strip():
-                    line = line.strip().split("\t")
-                else:
-                    line = line.strip().split(" ")
-                values = dict()
-                for col in self.COLUMNS:
-                    try:
-                        values[col] = line[self.COLUMNS.get(col, None)]
-                    except IndexError:
-                        values[col] = "_"
-                tok = Token(**values)
-                tokens.append(tok)
-
-        #If file does not end with empty line
-        #save remaining last sentence
-        if tokens:
-            if not "text" in metainfo:
-                metainfo["text"] = " ".join([tok.FORM for tok in tokens])
-            sentence = Sentence(**metainfo)
-            for tok in tokens:
-                sentence.add_token(tok)
-            tokens.clear()
-            metainfo.clear()
-            doc.add_sent(sentence)
+        #Pipelines for files to which some processors were already applied
+        if not hasattr(self, "pipelines"):
+            self.pipelines = dict()
+        key = tuple(type(p).__name__ for p in processors)
+        if not key in self.pipelines or self.pipelines[key].profiler is not self.pipeline.profiler:
+            self.pipelines[key] = Pipeline(processors, self.pipeline.profiler)
+        return self.pipelines[key]
 
-        conllfile.close()
+    ###############################
 
-        return doc
+    def warn(self, key, message):
+        """
+        Print a warning only for the first file with the same problem.
+        Input: Key of the problem, e.g. (processor, column), and message
+        """
+        if not hasattr(self, "warnings"):
+            self.warnings = set()
+        if self.verbose and not key in self.warnings:
+            self.warnings.add(key)
+            print(message)
+
+    ###############################
+
+    def read_arrays(self, file, vocab, data=None):
+        """
+        Load the tag arrays of a file written by the convert command
+        without creating any tokens.
+        Input: Filename (including path), TagVocabulary for XPOS tags
+               and file content as bytes (optional)
+        Output: Empty Doc object and DocArrays object (or None, None)
+        """
+        data = self.open_binary(file, data)
+        if data is None:
+            return None, None
+
+        #The arrays are copies, so the file can be closed
+        arrays = data.get_arrays(vocab)
+        data.close()
+
+        return Doc(data.filename), arrays
 
 ############################
@@ -0,0 +1,322 @@
+'''
+Module to read input files that are compressed (gz, bz2, xz, zst)
+or contained in archives (tar, zip) without unpacking them to disk.
+Archive members are addressed as "archive::member", e.g. "corpus.tar.gz::texts/letter_1.conllup".
+'''
+
+import os
+import io
+import gzip
+import bz2
+import lzma
+import tarfile
+import zipfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+############################
+
+#Separates the archive and the member in an input path
+SEPARATOR = "::"
+
+COMPRESSIONS = [".gz", ".bz2", ".xz", ".zst"]
+
+TAR_EXTENSIONS = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar.zst"]
+ZIP_EXTENSIONS = [".zip"]
+
+#Last opened archive of each thread, so that members are read
+#one after another without opening the archive again.
+#Worker processes must not share the archive with the main process,
+#so the process id is stored as well.
+_archives = threading.local()
+
+#Member sizes of streamed archives, so that the archive is only read once to get them
+_sizes = dict()
+
+############################
+
+def split_path(path):
+    """
+    Input: Input path
+    Output: Archive and member or path and None
+    """
+    if SEPARATOR in path:
+        archive, member = path.split(SEPARATOR, 1)
+        return archive, member
+    return path, None
+
+############################
+
+def is_archive(path):
+    """
+    Input: Filename (including path)
+    Output: True if the file is a tar or zip archive, False otherwise.
+    """
+    name = path.lower()
+    return any(name.endswith(ext) for ext in TAR_EXTENSIONS + ZIP_EXTENSIONS)
+
+############################
+
+def get_compression(name):
+    """
+    Input: Filename
+    Output: Compression extension (e.g. ".gz") or None
+    """
+    _, ext = os.path.splitext(name.lower())
+    if ext in COMPRESSIONS:
+        return ext
+    return None
+
+############################
+
+def is_plain(path):
+    """
+    Input: Input path
+    Output: True if the path is an uncompressed file outside an archive, False otherwise.
+    """
+    return not SEPARATOR in path and get_compression(path) is None
+
+############################
+
+def get_filename(path):
+    """
+    Return the name of the input document without compression extension,
+    e.g. "letter_1.conllup" for "corpus.tar::texts/letter_1.conllup.gz".
+    Input: Input path
+    Output: Filename
+    """
+    archive, member = split_path(path)
+    name = os.path.basename(member if member is not None else archive)
+    if get_compression(name) is not None:
+        name = os.path.splitext(name)[0]
+    return name
+
+############################
+
+def list_members(path, verbose=True):
+    """
+    List the regular files of an archive as input paths.
+    Input: Filename of the archive (including path) and whether to print an error message
+    Output: List of input paths in archive order
+    """
+    try:
+        if any(path.lower().endswith(ext) for ext in ZIP_EXTENSIONS):
+            with zipfile.ZipFile(path) as archive:
+                members = [info.filename for info in archive.infolist() if not info.is_dir()]
+        else:
+            with open_tar(path) as archive:
+                infos = [info for info in archive if info.isfile()]
+            members = [info.name for info in infos]
+            if path.lower().endswith(".tar.zst"):
+                _sizes[path] = {info.name : info.size for info in infos}
+    except (OSError, tarfile.TarError, zipfile.BadZipFile, ImportError) as e:
+        if verbose:
+            print("ERROR: Cannot read archive {0}: {1}".format(path, e))
+        return []
+
+    return [path + SEPARATOR + member for member in members]
+
+############################
+
+def open_tar(path):
+    """
+    Open a tar archive. Archives compressed with zstandard are decompressed as a stream.
+    Input: Filename of the archive (including path)
+    Output: TarFile object
+    """
+    if path.lower().endswith(".tar.zst"):
+        return tarfile.open(fileobj=decompress(open(path, mode="rb"), ".zst"), mode="r|")
+    return tarfile.open(path, mode="r:*")
+
+############################
+
+def get_archive(path):
+    """
+    Return the open archive, reusing the last archive of this thread.
+    Input: Filename of the archive (including path)
+    Output: TarFile or ZipFile object
+    """
+    if getattr(_archives, "path", None) == path and _archives.pid == os.getpid():
+        return _archives.archive
+
+    if getattr(_archives, "archive", None) is not None and _archives.pid == os.getpid():
+        _archives.archive.close()
+
+    if any(path.lower().endswith(ext) for ext in ZIP_EXTENSIONS):
+        archive = zipfile.ZipFile(path)
+    else:
+        #Zstandard streams cannot go back, so the members are read in archive order
+        if path.lower().endswith(".tar.zst"):
+            archive = TarStream(path)
+        else:
+            archive = tarfile.open(path, mode="r:*")
+
+    _archives.path = path
+    _archives.pid = os.getpid()
+    _archives.archive = archive
+    return archive
+
+############################
+
+class TarStream:
+    """
+    Tar archive that is decompressed as a stream (e.g. .tar.zst).
+    Members are found by reading forward through the archive,
+    so they should be requested in archive order.
+    The archive is only opened again if an earlier member is requested.
+    """
+
+    def __init__(self, path):
+        """
+        Input: Filename of the archive (including path)
+        """
+        self.path = path
+        self.archive = None
+
+    def open(self):
+        if self.archive is not None:
+            self.archive.close()
+        self.archive = open_tar(self.path)
+
+    def extractfile(self, member):
+        """
+        Input: Name of the member
+        Output: Binary file object of the member
+                (only readable until the next member is requested)
+        """
+        restarted = self.archive is None
+        if restarted:
+            self.open()
+        while True:
+            info = self.archive.next()
+            if info is None:
+                if restarted:
+                    raise KeyError("{0} not found in {1}".format(member, self.path))
+                #The member comes before the current position
+                self.open()
+                restarted = True
+                continue
+            if info.name == member and info.isfile():
+                return self.archive.extractfile(info)
+
+    def get_size(self, member):
+        """
+        Input: Name of the member
+        Output: Size of the member in bytes
+        """
+        if not self.path in _sizes:
+            list_members(self.path, verbose=False)
+        return _sizes[self.path][member]
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+############################
+
+def decompress(stream, compression):
+    """
+    Input: Binary file object and compression extension
+    Output: Binary file object with the decompressed content
+    """
+    if compression == ".gz":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    elif compression == ".bz2":
+        return bz2.BZ2File(stream, mode="rb")
+    elif compression == ".xz":
+        return lzma.LZMAFile(stream, mode="rb")
+    elif compression == ".zst":
+        if zstandard is None:
+            raise ImportError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+    return stream
+
+############################
+
+def open_binary(path):
+    """
+    Open an input file or archive member for reading.
+    Compressed content is decompressed while reading.
+    Input: Input path
+    Output: Binary file object
+    """
+    archive, member = split_path(path)
+
+    if member is None:
+        stream = open(archive, mode="rb")
+        name = archive
+    else:
+        handle = get_archive(archive)
+        if isinstance(handle, zipfile.ZipFile):
+            stream = handle.open(member)
+        else:
+            stream = handle.extractfile(member)
+        name = member
+
+    return decompress(stream, get_compression(name))
+
+############################
+
+def open_text(path):
+    """
+    Input: Input path
+    Output: Text file object (UTF-8)
+    """
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8")
+
+############################
+
+def read_bytes(path):
+    """
+    Input: Input path
+    Output: Decompressed content as bytes
+    """
+    with open_binary(path) as f:
+        return f.read()
+
+############################
+
+def exists(path, verbose=True):
+    """
+    Input: Input path and whether to print an error message
+    Output: True if the file (or archive member) exists and can be read, False otherwise.
+    """
+    archive, member = split_path(path)
+
+    if not os.path.isfile(archive):
+        return False
+
+    if get_compression(member if member is not None else archive) == ".zst" and zstandard is None:
+        if verbose:
+            print("ERROR: Cannot read {0}. Please install zstandard to read .zst files.".format(path))
+        return False
+
+    return True
+
+############################
+
+def get_size(path):
+    """
+    Input: Input path
+    Output: Size in bytes (compressed size for compressed files, member size for archive members)
+    """
+    archive, member = split_path(path)
+    if member is None:
+        return os.path.getsize(archive)
+
+    try:
+        handle = get_archive(archive)
+        if isinstance(handle, zipfile.ZipFile):
+            return handle.getinfo(member).file_size
+        elif isinstance(handle, TarStream):
+            return handle.get_size(member)
+        return handle.getmember(member).size
+    except (KeyError, OSError, tarfile.TarError, zipfile.BadZipFile):
+        return 0
+
+############################
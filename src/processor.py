@@ -6,88 +6,380 @@ Created on 14.10.2019
 '''
 
 import re
+import json
+from collections import OrderedDict
+
+############################
+
+class Memo(object):
+
+    def __init__(self, max_size=10000):
+        """
+        Least recently used cache for the results of a processor,
+        e.g. the normalized value for a word form.
+        Input: Maximum number of entries
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        #New entries since the last call of pop_added (only if collected)
+        self.added = None
+
+    #####################
+
+    def get(self, key, func):
+        """
+        Return the cached value for the key.
+        If there is none, compute it with func(key) and store it.
+        Input: Key and function
+        Output: Value
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = func(key)
+            self.put(key, value)
+            if self.added is not None:
+                self.added[key] = value
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    #####################
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    #####################
+
+    def update(self, entries):
+        for key, value in entries.items():
+            self.put(key, value)
+
+    #####################
+
+    def pop_added(self):
+        """
+        Output: Dictionary of entries added since the last call
+        """
+        added = self.added
+        self.added = dict()
+        return added or dict()
 
 ############################
 
 class Processor(object):
 
+    #Columns that are read or changed by the processor
+    columns = []
+
+    #Memo for the results of normalize (None = no memoization)
+    memo = None
+
     def __init__(self):
         pass
 
+    #####################
+
+    def process(self, doc):
+        """
+        Process all sentences of the document.
+        Input: Doc object
+        Output: Doc object
+        """
+        for sent in doc.sentences:
+            self.process_sentence(sent)
+
+        return doc
+
+    #####################
+
+    def process_sentences(self, sentences):
+        """
+        Process sentences one by one as they are read.
+        Input: Iterable of Sentence objects
+        Output: Generator of Sentence objects
+        """
+        for sent in sentences:
+            yield self.process_sentence(sent)
+
+    #####################
+
+    def process_sentence(self, sent):
+        """
+        Process each token of the sentence with process_token.
+        Tokens for which process_token returns None are removed.
+        Input: Sentence object
+        Output: Sentence object
+        """
+        sent.tokens = [tok for tok in map(self.process_token, sent.tokens) if tok is not None]
+        return sent
+
+    #####################
+
+    def lookup(self, key):
+        """
+        Return normalize(key), from the memo if possible.
+        Input: Key, e.g. a word form
+        Output: Normalized value
+        """
+        if self.memo is None:
+            return self.normalize(key)
+        return self.memo.get(key, self.normalize)
+
+    #####################
+
+    def is_token_level(self):
+        """
+        Output: True if the processor handles each token on its own (with process_token),
+                False if it needs the whole sentence.
+        """
+        return hasattr(self, "process_token")
+
+############################
+
+class Pipeline(Processor):
+
+    def __init__(self, processors=[], profiler=None):
+        """
+        Compile the processors into as few passes as possible.
+        Consecutive processors that handle each token on its own are combined
+        into one function, so each token only passes through them once.
+        The processors are still applied in the given order to each token.
+        If a profiler is given, the time of each processor is recorded as its own stage.
+        Input: List of processors in order of application and Profiler (optional)
+        """
+        self.processors = list(processors)
+        self.profiler = profiler
+
+        self.columns = list()
+        for p in self.processors:
+            self.columns.extend(col for col in p.columns if not col in self.columns)
+
+        #List of token functions and sentence processors
+        self.steps = list()
+        token_funcs = list()
+        for p in self.processors:
+            if p.is_token_level():
+                if profiler is not None:
+                    token_funcs.append(profiler.wrap("processor:" + type(p).__name__, p.process_token))
+                else:
+                    token_funcs.append(p.process_token)
+            else:
+                if token_funcs:
+                    self.steps.append(self.compile(token_funcs))
+                    token_funcs = list()
+                self.steps.append(p)
+        if token_funcs:
+            self.steps.append(self.compile(token_funcs))
+
+        if len(self.steps) == 1 and not isinstance(self.steps[0], Processor):
+            self.process_token = self.steps[0]
+
+    #####################
+
+    def __bool__(self):
+        return bool(self.processors)
+
+    #####################
+
+    def compile(self, funcs):
+        """
+        Combine token functions into one function that applies them in order.
+        Input: List of functions that return the processed token or None
+        Output: Function
+        """
+        if len(funcs) == 1:
+            return funcs[0]
+
+        def process_token(tok):
+            for func in funcs:
+                tok = func(tok)
+                if tok is None:
+                    return None
+            return tok
+
+        return process_token
+
+    #####################
+
+    def __getstate__(self):
+        #Combined functions cannot be pickled, so they are compiled again.
+        #Worker processes attach their own profiler.
+        return {"processors" : self.processors}
+
+    def __setstate__(self, state):
+        self.__init__(state["processors"])
+
+    #####################
+
+    def process_sentence(self, sent):
+        """
+        Apply all steps of the pipeline to the sentence.
+        Input: Sentence object
+        Output: Sentence object
+        """
+        for step in self.steps:
+            if isinstance(step, Processor):
+                if self.profiler is not None:
+                    self.profiler.start("processor:" + type(step).__name__)
+                    sent = step.process_sentence(sent)
+                    self.profiler.stop()
+                else:
+                    sent = step.process_sentence(sent)
+            else:
+                sent.tokens = [tok for tok in map(step, sent.tokens) if tok is not None]
+        return sent
+
 ############################
 
 class PronounLemmatizer(Processor):
 
+    columns = ["FORM", "XPOS", "LEMMA"]
+
+    #ich, mich, mir, mier, mihr
+    ICH = re.compile(r"(m?ich|mie?h?r)", re.IGNORECASE)
+    #wir, wier, wihr, wiehr, uns, unß, unSchaft-s
+    WIR = re.compile(r"(wie?h?r|un[sßſ]+)", re.IGNORECASE)
+    #dieser, diese, dies, diesen, dieses (mit s/ß/Schaft-s, mit/ohne ie)
+    DIESE = re.compile(r"die?[sßſ]+(e|er|en|es)?", re.IGNORECASE)
+    #die, der, das, den, dem, dessen, denen, derer, deren, dero
+    DIE = re.compile(r"(der|die|das|den|dem|de[sßſ]+en|denen|dere[nr]|dero)", re.IGNORECASE)
+
     def __init__(self):
         pass
 
     #####################
 
-    def process(self, doc):
+    def normalize(self, key):
+        """
+        Input: Tuple of XPOS tag (PPER or PDS) and word form
+        Output: Lemma
+        """
+        xpos, form = key
+        if xpos == "PPER":
+            if self.ICH.match(form) != None:
+                return "ich"
+            elif self.WIR.match(form) != None:
+                return "wir"
+        elif xpos == "PDS":
+            if self.DIESE.match(form) != None:
+                return "diese"
+            elif self.DIE.match(form) != None:
+                return "die"
+        return "_"
 
-        for sent in doc.sentences:
-            for tok in sent.tokens:
-                if tok.__dict__.get("LEMMA", "_") in ["_", ""]:
-                    if tok.XPOS == "PPER":
-                        #ich, mich, mir, mier, mihr
-                        if re.match(r"(m?ich|mie?h?r)", tok.FORM, re.IGNORECASE) != None:
-                            tok.LEMMA = "ich"
-                        #wir, wier, wihr, wiehr, uns, unß, unSchaft-s
-                        elif re.match(r"(wie?h?r|un[sßſ]+)", tok.FORM, re.IGNORECASE) != None:
-                            tok.LEMMA = "wir"
-                        else:
-                            tok.LEMMA = "_"
-                    elif tok.XPOS == "PDS":
-                        #dieser, diese, dies, diesen, dieses (mit s/ß/Schaft-s, mit/ohne ie)
-                        if re.match(r"die?[sßſ]+(e|er|en|es)?", tok.FORM, re.IGNORECASE) != None:
-                            tok.LEMMA = "diese"
-                        #die, der, das, den, dem, dessen, denen, derer, deren, dero
-                        elif re.match(r"(der|die|das|den|dem|de[sßſ]+en|denen|dere[nr]|dero)", tok.FORM, re.IGNORECASE) != None:
-                            tok.LEMMA = "die"
-                        else:
-                            tok.LEMMA = "_"
-                    else:
-                        tok.LEMMA = "_"
-                        
-        return doc
+    #####################
+
+    def process_token(self, tok):
+
+        if getattr(tok, "LEMMA", "_") in ["_", ""]:
+            xpos = tok.XPOS
+            if xpos == "PPER" or xpos == "PDS":
+                tok.LEMMA = self.lookup((xpos, tok.FORM))
+            else:
+                tok.LEMMA = "_"
+
+        return tok
 
 ##########################
 
 class BracketRemover(Processor):
 
+    columns = ["FORM"]
+
+    brackets = ["(", ")", "{", "}", "[", "]", "<", ">"]
+
+    bracket_set = frozenset(brackets)
+
     def __init__(self):
         pass
 
     #####################
 
-    def process(self, doc):
+    def normalize(self, form):
+        """
+        Input: Word form that contains brackets
+        Output: Word form without brackets if it contains letters or digits
+        """
+        if any(c.isalnum() for c in form):
+            for b in self.brackets:
+                if b in form:
+                    form = form.replace(b, "")
+        return form
 
-        brackets = ["(", ")", "{", "}", "[", "]", "<", ">"]
+    #####################
 
-        for sent in doc.sentences:
-            for tok in sent.tokens:
+    def process_token(self, tok):
 
-                if any(c.isalnum() for c in tok.FORM) and any(b in tok.FORM for b in brackets):
-                    for b in brackets:
-                        if b in tok.FORM:
-                            tok.FORM = tok.FORM.replace(b, "")                   
+        #Most tokens do not contain any brackets
+        if not self.bracket_set.isdisjoint(tok.FORM):
+            tok.FORM = self.lookup(tok.FORM)
 
-        return doc
+        return tok
 
 ############################
 
 class EllipsisRemover(Processor):
 
+    columns = ["type"]
+
     def __init__(self):
         pass
 
     #####################
 
-    def process(self, doc):
+    def process_token(self, tok):
 
-        for sent in doc.sentences:
-            sent.tokens = [tok for tok in sent.tokens if not tok.__dict__.get("type", "_") == "E"]
+        if getattr(tok, "type", "_") == "E":
+            return None
 
-        return doc
+        return tok
+
+##############################
+
+def read_memo_file(file, processors, version=""):
+    """
+    Fill the memos of the processors with the entries saved in a memo file.
+    Entries of other versions are not used.
+    Input: Filename, list of processors and version of COAST
+    """
+    try:
+        with open(file, mode="r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        print("WARNING: Cannot read memo file {0}. Starting with empty memos.".format(file))
+        return
+
+    if saved.get("version") != version:
+        print("WARNING: Memo file {0} was created by another version and is not used.".format(file))
+        return
+
+    for p in processors:
+        if p.memo is None:
+            continue
+        for key, value in saved.get("memos", {}).get(type(p).__name__, []):
+            #Tuples are saved as lists
+            if isinstance(key, list):
+                key = tuple(key)
+            p.memo.put(key, value)
+
+##############################
+
+def write_memo_file(file, processors, version=""):
+    """
+    Save the memo entries of the processors.
+    Input: Filename, list of processors and version of COAST
+    """
+    memos = {type(p).__name__ : list(p.memo.entries.items())
+             for p in processors if p.memo is not None}
+    with open(file, mode="w", encoding="utf-8") as f:
+        json.dump({"version" : version, "memos" : memos}, f, ensure_ascii=False)
 
 ##############################
@@ -0,0 +1,240 @@
+'''
+Module to record where the time of an analysis goes.
+The Profiler measures wall and CPU time per stage and per file.
+Stages can be nested, e.g. a feature function within the feature stage,
+and the time of a stage does not include the time of nested stages.
+The NullProfiler is used when profiling is switched off and does nothing.
+'''
+
+import time
+import json
+from processor import Pipeline
+
+############################
+
+class NullProfiler(object):
+
+    enabled = False
+
+    def start(self, stage):
+        pass
+
+    def stop(self):
+        pass
+
+    def wrap_iter(self, stage, iterable):
+        return iterable
+
+    def attach(self, finder, importer=None):
+        pass
+
+    def count_tokens(self, doc, sentences):
+        return sentences
+
+    def add_file(self, filename, tokens, sentences, wall, cached=False):
+        pass
+
+############################
+
+class Profiler(NullProfiler):
+
+    enabled = True
+
+    def __init__(self):
+        #Stage : [wall time, cpu time, calls]
+        self.stages = dict()
+        #Filename : {tokens, sentences, wall time, cached}
+        self.files = dict()
+        #Active stages with the time they were (re)started
+        self.stack = list()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    #####################
+
+    def pause(self):
+        """
+        Add the time since the last (re)start to the active stage.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self.stack:
+            stage, start_wall, start_cpu = self.stack[-1]
+            times = self.stages[stage]
+            times[0] += wall - start_wall
+            times[1] += cpu - start_cpu
+        return wall, cpu
+
+    #####################
+
+    def start(self, stage):
+        """
+        Start a stage. The enclosing stage is paused until the stage is stopped.
+        Input: Name of the stage
+        """
+        wall, cpu = self.pause()
+        if stage in self.stages:
+            self.stages[stage][2] += 1
+        else:
+            self.stages[stage] = [0.0, 0.0, 1]
+        self.stack.append((stage, wall, cpu))
+
+    #####################
+
+    def stop(self):
+        """
+        Stop the active stage and continue the enclosing stage.
+        """
+        wall, cpu = self.pause()
+        self.stack.pop()
+        if self.stack:
+            stage, _, _ = self.stack.pop()
+            self.stack.append((stage, wall, cpu))
+
+    #####################
+
+    def wrap_iter(self, stage, iterable):
+        """
+        Count the time spent to get the next item of an iterable
+        (e.g. reading or processing the next sentence) as stage.
+        Input: Name of the stage and iterable
+        Output: Generator of the items
+        """
+        iterator = iter(iterable)
+        while True:
+            self.start(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stop()
+                return
+            self.stop()
+            yield item
+
+    #####################
+
+    def wrap(self, stage, func):
+        """
+        Input: Name of the stage and function
+        Output: Function that counts its run time as stage
+        """
+        def timed(*args):
+            self.start(stage)
+            try:
+                return func(*args)
+            finally:
+                self.stop()
+        return timed
+
+    #####################
+
+    def attach(self, finder, importer=None):
+        """
+        Time each feature function of the reference engine.
+        The other engines compute all features at once,
+        so only the whole feature stage is timed.
+        If the importer applies the processors while reading,
+        the time of each processor is recorded as its own stage.
+        Input: FeatureFinder (None = do not time the feature functions) and importer (optional)
+        """
+        if importer is not None and importer.pipeline:
+            importer.pipeline = Pipeline(importer.pipeline.processors, profiler=self)
+        if finder is not None and finder.engine == "reference":
+            finder.feature_functions = {feature : self.wrap("feature:" + func.__name__, func)
+                                        for feature, func in finder.get_feature_functions().items()}
+
+    #####################
+
+    def count_tokens(self, doc, sentences):
+        """
+        Count the tokens of a stream of sentences as doc.n_toks.
+        Input: Doc object and iterable of Sentence objects
+        Output: Generator of the sentences
+        """
+        doc.n_toks = 0
+        for sent in sentences:
+            doc.n_toks += len(sent.tokens)
+            yield sent
+
+    #####################
+
+    def add_file(self, filename, tokens, sentences, wall, cached=False):
+        """
+        Record the size and analysis time of a file.
+        Input: Filename, number of tokens (None if unknown) and sentences,
+               wall time and whether the results were taken from the cache
+        """
+        self.files[filename] = {"tokens" : tokens,
+                                "sentences" : sentences,
+                                "wall" : round(wall, 6),
+                                "tokens_per_second" : round(tokens / wall, 1) if tokens and wall else None,
+                                "cached" : cached}
+
+    #####################
+
+    def get_tokens(self):
+        return sum(f["tokens"] for f in self.files.values() if f["tokens"])
+
+    #####################
+
+    def get_throughput(self):
+        """
+        Output: Tokens per second since the profiler was created
+        """
+        wall = time.perf_counter() - self.wall
+        return self.get_tokens() / wall if wall else 0.0
+
+    #####################
+
+    def get_stages(self):
+        return {stage : {"wall" : round(wall, 6), "cpu" : round(cpu, 6), "calls" : calls}
+                for stage, (wall, cpu, calls) in self.stages.items()}
+
+    #####################
+
+    def merge(self, stages, files):
+        """
+        Add the stages and files recorded by another profiler (e.g. in a worker process).
+        Input: Dictionary of stages and dictionary of files as returned by get_stages and files
+        """
+        for stage, times in stages.items():
+            if stage in self.stages:
+                self.stages[stage][0] += times["wall"]
+                self.stages[stage][1] += times["cpu"]
+                self.stages[stage][2] += times["calls"]
+            else:
+                self.stages[stage] = [times["wall"], times["cpu"], times["calls"]]
+        self.files.update(files)
+
+    #####################
+
+    def report(self, **settings):
+        """
+        Input: Settings of the analysis to include in the report
+        Output: Dictionary with total time, throughput, stages and files
+        """
+        wall = time.perf_counter() - self.wall
+        tokens = self.get_tokens()
+        report = dict(settings)
+        report.update({"wall" : round(wall, 6),
+                       "cpu" : round(time.process_time() - self.cpu, 6),
+                       "tokens" : tokens,
+                       "tokens_per_second" : round(tokens / wall, 1) if wall else None,
+                       "stages" : self.get_stages(),
+                       "files" : self.files})
+        return report
+
+    #####################
+
+    def write(self, file, **settings):
+        """
+        Save the report as JSON.
+        Input: Filename and settings of the analysis
+        """
+        with open(file, mode="w", encoding="utf-8") as f:
+            json.dump(self.report(**settings), f, indent=2)
+
+############################
+
+NULL_PROFILER = NullProfiler()
+
+############################
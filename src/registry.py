@@ -0,0 +1,17 @@
+'''
+Module with the available importers and processors by name,
+used by the command line interface and the Python API.
+'''
+
+import importer, processor
+
+##############
+
+importers = {"conlluplus" : importer.CoNLLUPlusImporter,
+             "conll2000" : importer.CoNLL2000Importer,
+             "coast" : importer.BinaryImporter}
+
+processors = {"pronounlemmatizer" : processor.PronounLemmatizer, "bracketremover" : processor.BracketRemover,
+              "ellipsisremover" : processor.EllipsisRemover}
+
+##############
@@ -0,0 +1,428 @@
+'''
+Module to estimate the uncertainty of feature values and orality scores.
+Bootstrap: the sentences of each document are resampled with replacement
+and the features are computed for every replicate. The counts of each sentence
+are stored as arrays, so all replicates are computed with matrix products.
+The sentence lengths of the replicates are counted from the drawn sentences,
+so no histogram matrix of all sentences and lengths is needed.
+Permutation tests: the group labels of the documents are shuffled to test
+whether the feature values of two groups (e.g. oral and literal texts) differ.
+'''
+
+import os
+import zlib
+import warnings
+import writer
+from tagarrays import np, DocArrays, TagVocabulary, QUESTION, EXCLAMATION
+
+############################
+
+#Columns of the count arrays of the sentences
+COUNTS = ["words", "word_len", "coordInit", "subord", "nouns", "verbs", "lexical_items",
+          "PRON1st", "DEM", "DEMlong", "DEMshort", "question", "exclam", "INTERJ", "PTC"]
+
+############################
+
+class Resampler(object):
+
+    #Maximum number of values of the resampling matrix computed at once
+    block_size = 4194304
+
+    #Number of sentences converted to arrays at once when streaming
+    chunk_size = 10000
+
+    def __init__(self, finder, replicates=1000, confidence=0.95, seed=0):
+        """
+        Input: FeatureFinder, number of bootstrap replicates per document,
+               confidence level of the intervals and random seed
+        """
+        self.finder = finder
+        self.replicates = replicates
+        self.confidence = confidence
+        self.seed = seed
+        self.vocab = TagVocabulary()
+        self.tag_tables = dict()
+
+    ###############################
+
+    def get_tag_table(self, vocab):
+        """
+        Input: TagVocabulary
+        Output: Boolean array with the tag classification of each tag code
+        """
+        table = self.tag_tables.get(id(vocab))
+        if table is None or len(table) < len(vocab):
+            table = np.array([self.finder.classify_tag(tag) for tag in vocab.tags], dtype=bool)
+            self.tag_tables[id(vocab)] = table
+        return table
+
+    ###############################
+
+    def add_arrays(self, doc, arrays, vocab=None):
+        """
+        Compute the counts of each sentence and store them in the doc object.
+        The counts are the same as in FeatureFinder.get_features_arrays, but per sentence.
+        Input: Doc object, DocArrays object and TagVocabulary of the arrays
+        """
+        if vocab is None:
+            vocab = self.vocab
+        table = self.get_tag_table(vocab)[arrays.xpos]
+        punct, dollar, kon, sub, noun, verb, lex, pds, itj, ant = table.T
+        lemma = arrays.lemma
+
+        words = ~(punct | arrays.upos_punct)
+
+        #Coordinating conjunction only preceded by punctuation
+        #(index -1 of sentences without such a token selects the appended value)
+        first = arrays.sentence_first(~dollar)
+        coordInit = np.append(kon, False)[first]
+
+        #Sentence type from the last sentence-final punctuation
+        last = arrays.sentence_last(arrays.sent_type > 0)
+        types = np.append(arrays.sent_type, 0)[last]
+
+        DEMlong = pds & ((lemma == 3) | (lemma == 4))
+        DEMshort = pds & ((lemma == 5) | (lemma == 6))
+
+        counts = np.stack([arrays.sentence_sums(words),
+                           arrays.sentence_sums(np.where(words, arrays.length, 0)),
+                           coordInit,
+                           arrays.sentence_sums(sub),
+                           arrays.sentence_sums(noun),
+                           arrays.sentence_sums(verb),
+                           arrays.sentence_sums(lex),
+                           arrays.sentence_sums((lemma == 1) | (lemma == 2)),
+                           arrays.sentence_sums(pds),
+                           arrays.sentence_sums(DEMlong),
+                           arrays.sentence_sums(DEMshort),
+                           types == QUESTION,
+                           types == EXCLAMATION,
+                           arrays.sentence_sums(itj),
+                           arrays.sentence_sums(ant)], axis=1).astype(np.int64)
+
+        #Sentence and length of each word for the median word length
+        sentence = np.repeat(np.arange(arrays.n_sents), np.diff(arrays.offsets))
+
+        if not hasattr(doc, "sentence_counts"):
+            doc.sentence_counts = list()
+        n_sents = sum(len(part[0]) for part in doc.sentence_counts)
+        doc.sentence_counts.append((counts, sentence[words] + n_sents, arrays.length[words]))
+
+    ###############################
+
+    def add_sentences(self, doc, sentences):
+        """
+        Input: Doc object and list of Sentence objects
+        """
+        self.add_arrays(doc, DocArrays.from_sentences(sentences, self.vocab))
+
+    ###############################
+
+    def collect(self, doc, sentences):
+        """
+        Pass on a stream of sentences and store their counts in the doc object.
+        Input: Doc object and iterable of Sentence objects
+        Output: Generator of Sentence objects
+        """
+        chunk = []
+        for sent in sentences:
+            chunk.append(sent)
+            yield sent
+            if len(chunk) == self.chunk_size:
+                self.add_sentences(doc, chunk)
+                chunk = []
+        if chunk:
+            self.add_sentences(doc, chunk)
+
+    ###############################
+
+    def get_rng(self, filename):
+        """
+        The random numbers of each document only depend on the seed and the filename,
+        so the results do not depend on the order of the files or the number of processes.
+        """
+        return np.random.default_rng([self.seed, zlib.crc32(filename.encode("utf-8"))])
+
+    ###############################
+
+    def get_results(self, doc):
+        """
+        Resample the sentences of the document and compute the features of each replicate.
+        The counts of the sentences are removed from the doc object.
+        Input: Doc object with sentence counts
+        Output: Dictionary with the lower and upper bound of each feature
+                and the array of replicates (replicates x features) or None
+        """
+        parts = getattr(doc, "sentence_counts", None)
+        if parts is None:
+            return None
+        del doc.sentence_counts
+
+        counts = np.concatenate([part[0] for part in parts]).astype(np.float64)
+        n_sents = len(counts)
+        if n_sents == 0:
+            return None
+
+        #Length code of each sentence
+        sent_vals, sent_codes = np.unique(counts[:, 0], return_inverse=True)
+
+        #Histograms of word lengths of each sentence
+        #(the number of different word lengths is small)
+        word_sents = np.concatenate([part[1] for part in parts])
+        word_vals, word_codes = np.unique(np.concatenate([part[2] for part in parts]), return_inverse=True)
+        word_hist = np.bincount(word_sents * len(word_vals) + word_codes,
+                                minlength=n_sents * len(word_vals)).reshape(n_sents, len(word_vals)).astype(np.float64)
+
+        rng = self.get_rng(doc.filename)
+        block = max(1, self.block_size // n_sents)
+        replicates = list()
+        for start in range(0, self.replicates, block):
+            n = min(block, self.replicates - start)
+            #Number of times each sentence is drawn in each replicate
+            draws = rng.integers(0, n_sents, size=(n, n_sents))
+            weights = np.bincount((draws + (np.arange(n) * n_sents)[:, None]).ravel(),
+                                  minlength=n * n_sents).reshape(n, n_sents).astype(np.float64)
+            #Number of drawn sentences of each length in each replicate
+            sent_hist = np.bincount((sent_codes[draws] + (np.arange(n) * len(sent_vals))[:, None]).ravel(),
+                                    minlength=n * len(sent_vals)).reshape(n, len(sent_vals))
+            replicates.append(self.compute_stats(weights @ counts, n_sents,
+                                                 histogram_median(sent_hist, sent_vals),
+                                                 histogram_median(weights @ word_hist, word_vals)))
+        replicates = np.concatenate(replicates)
+
+        lower, upper = get_interval(replicates, self.confidence)
+        return {"lower" : dict(zip(self.finder.stats, lower.tolist())),
+                "upper" : dict(zip(self.finder.stats, upper.tolist())),
+                "replicates" : replicates}
+
+    ###############################
+
+    def compute_stats(self, sums, n_sents, med_sent, med_word):
+        """
+        Compute the features of all replicates like FeatureFinder.compute_stats.
+        Undefined values are NaN.
+        Input: Array of summed counts (replicates x counts), number of sentences
+               and arrays of the median sentence length and word length
+        Output: Array of feature values (replicates x features)
+        """
+        col = {name : sums[:, i] for i, name in enumerate(COUNTS)}
+        n_words = col["words"]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stats = {"mean_sent" : n_words / n_sents,
+                     "med_sent" : med_sent,
+                     "mean_word" : col["word_len"] / n_words,
+                     "med_word" : med_word,
+                     "subord" : col["subord"] / col["verbs"],
+                     "coordInit" : col["coordInit"] / n_sents,
+                     "question" : col["question"] / n_sents,
+                     "exclam" : col["exclam"] / n_sents,
+                     "V:N" : col["verbs"] / col["nouns"],
+                     "lexDens" : col["lexical_items"] / n_words,
+                     "PRON1st" : col["PRON1st"] / n_words,
+                     "DEM" : col["DEM"] / n_words,
+                     "DEMshort" : col["DEMshort"] / (col["DEMlong"] + col["DEMshort"]),
+                     "PTC" : col["PTC"] / n_words,
+                     "INTERJ" : col["INTERJ"] / n_words}
+
+        values = np.stack([stats[feat] for feat in self.finder.stats], axis=1)
+        values[~np.isfinite(values)] = np.nan
+        return values
+
+    ###############################
+
+    def get_scores(self, results, bootstrap):
+        """
+        Compute the orality score of each replicate with the same min and max values
+        as the scores of the documents and get the intervals of the scores.
+        Input: Dictionary of stats tables and dictionary of bootstrap results
+        Output: Dictionary of filename : (lower bound, upper bound)
+        """
+        ranges = self.finder.scaling or dict()
+        if any(not feat in ranges for feat in self.finder.stats):
+            ranges = dict(self.finder.get_ranges(results), **ranges)
+
+        scores = dict()
+        for filename, boot in bootstrap.items():
+            replicates = boot["replicates"]
+            score = np.zeros(len(replicates))
+            for feat, weight in self.finder.weights.items():
+                if not feat in self.finder.stats:
+                    continue
+                min_val, max_val = ranges[feat]
+                if max_val == min_val:
+                    continue
+                scaled = (replicates[:, self.finder.stats.index(feat)] - min_val) / (max_val - min_val)
+                score = score + np.nan_to_num(scaled) * weight
+            lower, upper = get_interval(score[:, None], self.confidence)
+            scores[filename] = (float(lower[0]), float(upper[0]))
+        return scores
+
+    ###############################
+
+    def output_results(self, results, bootstrap, outdir):
+        """
+        Write the values and bootstrap intervals of all features and orality scores
+        to results_bootstrap.
+        Input: Dictionary of stats tables, dictionary of bootstrap results and output folder
+        """
+        scores = self.get_scores(results, bootstrap)
+        scaled_results = self.finder.calculate_score(self.finder.scale_feature_values(results))
+
+        columns = ["file"]
+        for feat in self.finder.stats + ["orality_score"]:
+            columns += [feat, feat + "_lower", feat + "_upper"]
+
+        rows = dict()
+        for filename, boot in bootstrap.items():
+            row = {"file" : os.path.splitext(filename)[0]}
+            for feat in self.finder.stats:
+                row[feat] = results[filename][feat]
+                row[feat + "_lower"] = get_value(boot["lower"][feat])
+                row[feat + "_upper"] = get_value(boot["upper"][feat])
+            row["orality_score"] = scaled_results[filename]["orality_score"]
+            row["orality_score_lower"], row["orality_score_upper"] = scores[filename]
+            rows[filename] = row
+
+        write_rows(self.finder, rows, columns, outdir, "results_bootstrap")
+
+############################
+
+def histogram_median(histograms, values):
+    """
+    Compute the median of each histogram like FeatureFinder.histogram_median.
+    Input: Array of histograms (replicates x values) and sorted array of the values
+    Output: Array of medians (NaN for empty histograms)
+    """
+    n = histograms.sum(axis=1)
+    cumulative = np.cumsum(histograms, axis=1)
+    lower = np.argmax(cumulative > ((n - 1) // 2)[:, None], axis=1)
+    upper = np.argmax(cumulative > (n // 2)[:, None], axis=1)
+    return np.where(n > 0, (values[lower] + values[upper]) / 2, np.nan)
+
+############################
+
+def get_interval(replicates, confidence=0.95):
+    """
+    Input: Array of replicates (replicates x features) and confidence level
+    Output: Arrays of lower and upper percentile bounds (NaN if all values are undefined)
+    """
+    alpha = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, upper = np.nanpercentile(replicates, [alpha, 100 - alpha], axis=0)
+    return lower, upper
+
+############################
+
+def get_value(val):
+    """
+    Convert NaN to None for the result files.
+    """
+    if val != val:
+        return None
+    return val
+
+############################
+
+def permutation_test(values, groups, permutations=10000, seed=0):
+    """
+    Test the difference of the mean values of two groups of documents
+    by shuffling the group labels. Undefined values (NaN) are ignored.
+    Input: Array of values (documents x features), array of group labels
+           with two different labels, number of permutations and random seed
+    Output: List of (n, mean) for both groups, array of differences (first - second group)
+            and array of two-sided p-values
+    """
+    labels = np.unique(groups)
+    first = (groups == labels[0]).astype(np.float64)
+
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    valid = valid.astype(np.float64)
+    total, n_total = filled.sum(axis=0), valid.sum(axis=0)
+
+    def get_difference(members):
+        #Difference of means for each row of group memberships
+        sums, n = members @ filled, members @ valid
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return sums / n - (total - sums) / (n_total - n)
+
+    observed = get_difference(first[None, :])[0]
+
+    rng = np.random.default_rng(seed)
+    extreme = np.zeros(values.shape[1])
+    block = max(1, Resampler.block_size // len(groups))
+    for start in range(0, permutations, block):
+        n = min(block, permutations - start)
+        shuffled = rng.permuted(np.tile(first, (n, 1)), axis=1)
+        differences = get_difference(shuffled)
+        #Tolerance for differences that are equal up to rounding
+        extreme += (np.abs(differences) >= np.abs(observed) - 1e-12).sum(axis=0)
+
+    p_values = (extreme + 1) / (permutations + 1)
+    p_values[np.isnan(observed)] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = [(first @ valid, (first @ filled) / (first @ valid)),
+                 (n_total - first @ valid, (total - first @ filled) / (n_total - first @ valid))]
+
+    return labels, means, observed, p_values
+
+############################
+
+def output_permutation_test(finder, results, group, outdir, permutations=10000, seed=0):
+    """
+    Test the differences of all features and the orality score between two groups
+    and write the results to results_permutation.
+    Input: FeatureFinder, dictionary of stats tables,
+           name of the column with the groups, output folder,
+           number of permutations and random seed
+    Output: True if the test could be done, False otherwise.
+    """
+    if any(not group in stats_table for stats_table in results.values()):
+        print("ERROR: Column {0} is not in the results. Permutation tests are skipped.".format(group))
+        return False
+
+    #Same order of documents as in the result files
+    keys = sorted(results)
+    groups = np.array([str(results[key][group]) for key in keys])
+    if len(np.unique(groups)) != 2:
+        print("ERROR: Permutation tests require exactly two groups in column {0}, found {1}.".format(group, len(np.unique(groups))))
+        return False
+
+    #Original feature values and orality scores
+    scaled_results = finder.calculate_score(finder.scale_feature_values(results))
+    features = finder.stats + ["orality_score"]
+    values = np.array([[np.nan if results[key][feat] is None else results[key][feat] for feat in finder.stats]
+                       + [scaled_results[key]["orality_score"]] for key in keys],
+                      dtype=np.float64).reshape(len(keys), len(features))
+
+    labels, means, differences, p_values = permutation_test(values, groups, permutations, seed)
+
+    columns = ["feature", "group_1", "group_2", "n_1", "n_2", "mean_1", "mean_2", "difference", "p_value", "permutations"]
+    rows = dict()
+    for j, feat in enumerate(features):
+        rows[j] = {"feature" : feat,
+                   "group_1" : str(labels[0]), "group_2" : str(labels[1]),
+                   "n_1" : int(means[0][0][j]), "n_2" : int(means[1][0][j]),
+                   "mean_1" : get_value(float(means[0][1][j])), "mean_2" : get_value(float(means[1][1][j])),
+                   "difference" : get_value(float(differences[j])),
+                   "p_value" : get_value(float(p_values[j])),
+                   "permutations" : permutations}
+
+    write_rows(finder, rows, columns, outdir, "results_permutation")
+    return True
+
+############################
+
+def write_rows(finder, rows, columns, outdir, name):
+    """
+    Write rows in the output format of the FeatureFinder without scaling them.
+    Input: FeatureFinder, dictionary of rows, list of columns, output folder and name of the output file
+    """
+    numeric = finder.get_numeric_columns(rows, columns)
+    with writer.get_writer(finder.output_format, outdir + "/" + name, columns, numeric) as outfile:
+        outfile.write_rows(row for _, row in sorted(rows.items()))
+
+############################
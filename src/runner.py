@@ -0,0 +1,483 @@
+'''
+Module to run the analysis of input files,
+either one after another or spread across worker processes.
+'''
+
+import os
+import time
+import threading
+from queue import Queue, Empty, Full
+from concurrent.futures import ProcessPoolExecutor
+from corpus import Doc
+from profiler import Profiler, NULL_PROFILER
+from processor import Memo, Pipeline
+import inputs
+
+############################
+
+def file_exists(file, verbose=True):
+    """
+    Input: Filename (including path) or archive member
+           and whether to print an error message
+    Output: True if the file exists, False otherwise.
+    """
+    try:
+        if not os.path.isfile(inputs.split_path(file)[0]):
+            raise FileNotFoundError
+
+    #If file does not exist, skip it.
+    except FileNotFoundError:
+        if verbose:
+            print("ERROR: File %s not found." % (file))
+        return False
+
+    return inputs.exists(file, verbose)
+
+############################
+
+def get_columns(columns, processors):
+    """
+    Input: List of columns needed by the features and list of processors
+    Output: Set of columns that have to be imported
+    """
+    columns = set(columns)
+    for p in processors:
+        columns.update(p.columns)
+    return columns
+
+############################
+
+def setup_importer(importer, processors, columns, memo_size=0):
+    """
+    Prepare the importer for the analysis: only the needed columns are imported,
+    processors keep their results for repeated word forms (if memo_size > 0)
+    and all processors are applied in one pass while the tokens are read.
+    Input: Importer, list of processors in order of application,
+           list of columns needed by the features and size of the memos
+    Output: List of processors with a new memo
+    """
+    #Only import the columns needed by the features and processors
+    importer.columns = get_columns(columns, processors)
+
+    #Keep results of processors for repeated word forms
+    memo_processors = list()
+    if memo_size > 0:
+        for p in processors:
+            if hasattr(p, "normalize") and p.memo is None:
+                p.memo = Memo(memo_size)
+                memo_processors.append(p)
+
+    #Apply all processors in one pass while the tokens are read
+    if processors:
+        importer.pipeline = Pipeline(processors)
+
+    return memo_processors
+
+############################
+
+def analyze_file(file, importer, processors, finder, stream=False, cache=None, segmenter=None, profiler=NULL_PROFILER,
+                 data=None, sampler=None):
+    """
+    Import and process a single file and compute its features and statistics.
+    In stream mode, sentences are analyzed as they are read
+    and the returned doc does not contain any sentences.
+    If a cache is given, results of unchanged files are taken from the cache.
+    If a segmenter is given, the results of the segments are stored as segment_results
+    in the doc. Segment results are not cached.
+    If the importer has a pipeline, the processors are applied by the importer.
+    If a profiler is given, the time of each stage and the number of tokens are recorded.
+    If the content of the file has been read already, it is passed as data.
+    If a resampler is given, the bootstrap results are stored as bootstrap in the doc.
+    Bootstrap results are not cached.
+    Input: Filename (including path), importer, list of processors, FeatureFinder, stream mode,
+           FeatureCache, Segmenter, Profiler, file content as bytes (optional) and Resampler
+    Output: Doc object with feature and stats table
+            or None if the file cannot be imported or does not contain any words
+    """
+    #Skip non-existing files
+    if data is None and not file_exists(file, importer.verbose):
+        return None
+
+    if segmenter is not None or sampler is not None:
+        cache = None
+
+    if profiler.enabled:
+        start = time.perf_counter()
+
+    #Get results from cache
+    if cache is not None:
+        profiler.start("cache")
+        key = cache.get_key(file, importer, processors, data)
+        entry = cache.get(key)
+        profiler.stop()
+        if entry is not None:
+            doc = Doc(inputs.get_filename(file))
+            doc.n_sents = entry["n_sents"]
+            doc.feat_table = entry["feat_table"]
+            doc.stats_table = entry["stats_table"]
+            if profiler.enabled:
+                profiler.add_file(doc.filename, None, doc.n_sents, time.perf_counter() - start, cached=True)
+            return doc
+
+    #Binary files can be analyzed directly from the stored arrays
+    #if no processors have to be applied
+    if finder.engine == "numpy" and not processors and segmenter is None \
+        and hasattr(importer, "read_arrays"):
+        profiler.start("import")
+        doc, arrays = importer.read_arrays(file, finder.vocab, data)
+        profiler.stop()
+
+        #Skip files that could not be imported
+        if doc is None:
+            return None
+
+        profiler.start("features")
+        doc.feat_table = finder.get_features_arrays(arrays)
+        doc.n_sents = arrays.n_sents
+        doc.n_toks = arrays.n_toks
+        if sampler is not None:
+            sampler.add_arrays(doc, arrays, finder.vocab)
+        profiler.stop()
+
+    elif stream:
+        profiler.start("import")
+        doc, sentences = importer.stream_file(file, data)
+        profiler.stop()
+
+        #Skip files that could not be imported
+        if doc is None:
+            return None
+
+        #Time needed for the next sentence is counted for the stage that produces it
+        sentences = profiler.wrap_iter("import", sentences)
+
+        #Processors that are not applied by the importer
+        if importer.pipeline is None:
+            for p in processors:
+                sentences = profiler.wrap_iter("processor:" + type(p).__name__, p.process_sentences(sentences))
+        sentences = profiler.count_tokens(doc, sentences)
+        if sampler is not None:
+            sentences = sampler.collect(doc, sentences)
+
+        profiler.start("features")
+        if segmenter is not None:
+            segmenter.find_features(doc, sentences)
+        else:
+            finder.find_features_stream(doc, sentences)
+        profiler.stop()
+
+    else:
+        profiler.start("import")
+        doc = importer.import_file(file, data)
+        profiler.stop()
+
+        #Skip files that could not be imported
+        if doc is None:
+            return None
+
+        #Processors that are not applied by the importer
+        if importer.pipeline is None:
+            for p in processors:
+                profiler.start("processor:" + type(p).__name__)
+                doc = p.process(doc)
+                profiler.stop()
+
+        profiler.start("features")
+        if segmenter is not None:
+            segmenter.find_features(doc, doc.sentences)
+        else:
+            finder.find_features(doc)
+        if sampler is not None:
+            sampler.add_sentences(doc, doc.sentences)
+        profiler.stop()
+
+        if profiler.enabled:
+            doc.n_toks = sum(len(sent.tokens) for sent in doc.sentences)
+
+    #Skip files without words
+    if not finder.has_words(doc):
+        if importer.verbose:
+            print("WARNING: {0} does not contain any words and is skipped.".format(file))
+        return None
+
+    profiler.start("compute_stats")
+    doc = finder.compute_stats(doc)
+
+    if segmenter is not None:
+        doc.segment_results = segmenter.get_results(doc)
+        del doc.segments
+    profiler.stop()
+
+    if sampler is not None:
+        profiler.start("bootstrap")
+        doc.bootstrap = sampler.get_results(doc)
+        profiler.stop()
+
+    if cache is not None:
+        profiler.start("cache")
+        cache.put(key, doc)
+        profiler.stop()
+
+    if profiler.enabled:
+        profiler.add_file(doc.filename, doc.n_toks, doc.n_sents, time.perf_counter() - start)
+
+    return doc
+
+############################
+
+def get_batches(files, batch_size):
+    """
+    Split the list of files into batches of about batch_size bytes.
+    Each batch contains at least one file and files keep their order.
+    Input: List of filenames and batch size in bytes
+    Output: List of lists of filenames
+    """
+    batches = []
+    batch = []
+    size = 0
+
+    for file in files:
+        try:
+            size += inputs.get_size(file)
+        except OSError:
+            pass
+        batch.append(file)
+
+        if size >= batch_size:
+            batches.append(batch)
+            batch = []
+            size = 0
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+############################
+#Pipelined execution
+############################
+
+#Marks the end of a queue
+_DONE = object()
+
+def put_item(queue, item, stop):
+    """
+    Put an item into a bounded queue. Wait while the queue is full,
+    unless the pipeline is stopped.
+    Output: True if the item was added, False if the pipeline was stopped
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+############################
+
+def get_item(queue, stop):
+    """
+    Get the next item from a queue. Wait while the queue is empty,
+    unless the pipeline is stopped.
+    Output: Item or _DONE if the pipeline was stopped
+    """
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            continue
+    return _DONE
+
+############################
+
+def read_files(files, queue, stop):
+    """
+    Reader stage: read the content of the files in advance.
+    Files that cannot be read are passed on without content.
+    Input: List of filenames, output queue and stop event
+    """
+    for file in files:
+        try:
+            data = inputs.read_bytes(file)
+        except (OSError, EOFError, ImportError):
+            data = None
+        if not put_item(queue, (file, data), stop):
+            return
+    put_item(queue, _DONE, stop)
+
+############################
+
+def compute_files(in_queue, out_queue, stop, args, sampler=None):
+    """
+    Compute stage: analyze the files from the reader stage.
+    Errors are passed on to the output queue.
+    Input: Input and output queue, stop event, arguments of analyze_file
+           (importer, processors, finder, stream, cache, segmenter, profiler) and Resampler
+    """
+    try:
+        while True:
+            item = get_item(in_queue, stop)
+            if item is _DONE:
+                break
+            file, data = item
+            doc = analyze_file(file, *args, data=data, sampler=sampler)
+            if not put_item(out_queue, (file, doc), stop):
+                return
+    except BaseException as e:
+        put_item(out_queue, e, stop)
+        return
+    put_item(out_queue, _DONE, stop)
+
+############################
+
+def analyze_pipelined(files, importer, processors, finder, stream=False, cache=None, segmenter=None,
+                      profiler=NULL_PROFILER, prefetch=4, sampler=None):
+    """
+    Analyze files in three stages that run at the same time:
+    a reader thread reads the next files, a compute thread analyzes them
+    and the caller handles the results (e.g. writes them).
+    The stages are connected by queues of at most prefetch files,
+    so that only a limited number of files is kept in memory.
+    Reading files overlaps with the analysis, which hides slow disks or network drives.
+    Input: List of filenames, importer, list of processors, FeatureFinder, stream mode,
+           FeatureCache, Segmenter, Profiler, maximum number of files per queue and Resampler
+    Output: Generator of (filename, Doc object or None) pairs in input order
+    """
+    read_queue = Queue(maxsize=max(1, prefetch))
+    result_queue = Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    threads = [threading.Thread(target=read_files, args=(files, read_queue, stop), daemon=True),
+               threading.Thread(target=compute_files, daemon=True,
+                                args=(read_queue, result_queue, stop,
+                                      (importer, processors, finder, stream, cache, segmenter, profiler), sampler))]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = get_item(result_queue, stop)
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+############################
+#Worker processes
+############################
+
+_worker = dict()
+
+def get_memo_processors(importer, processors):
+    """
+    Input: Importer and list of processors
+    Output: List of the processors that are applied (by the importer pipeline or afterwards)
+            and have a memo
+    """
+    if importer.pipeline is not None:
+        processors = importer.pipeline.processors
+    return [p for p in processors if p.memo is not None]
+
+############################
+
+def init_worker(importer, processors, finder, stream, cache, segmenter, profile, collect_memos, sampler=None):
+    """
+    Store the components once per worker process
+    so that they are not sent again with every batch.
+    """
+    _worker["importer"] = importer
+    _worker["processors"] = processors
+    _worker["finder"] = finder
+    _worker["stream"] = stream
+    _worker["cache"] = cache
+    _worker["segmenter"] = segmenter
+    _worker["sampler"] = sampler
+    _worker["profile"] = profile
+
+    #Collect new memo entries to send them back to the main process
+    _worker["memo_processors"] = get_memo_processors(importer, processors)
+    if collect_memos:
+        for p in _worker["memo_processors"]:
+            p.memo.added = dict()
+
+############################
+
+def analyze_batch(files):
+    """
+    Analyze a batch of files in a worker process.
+    Input: List of filenames
+    Output: List of (filename, stats_table, segment_results, bootstrap) tuples
+            and dictionary with cache hits and misses, profile (stages and files)
+            and memo hits, misses and new entries of the batch
+    """
+    cache = _worker["cache"]
+    if cache is not None:
+        cache.hits, cache.misses = 0, 0
+
+    for p in _worker["memo_processors"]:
+        p.memo.hits, p.memo.misses = 0, 0
+
+    if _worker["profile"]:
+        profiler = Profiler()
+        profiler.attach(_worker["finder"], _worker["importer"])
+    else:
+        profiler = NULL_PROFILER
+
+    results = []
+    for file in files:
+        doc = analyze_file(file, _worker["importer"], _worker["processors"], _worker["finder"],
+                           _worker["stream"], cache, _worker["segmenter"], profiler, sampler=_worker["sampler"])
+        if doc is not None:
+            results.append((doc.filename, doc.stats_table, getattr(doc, "segment_results", None),
+                            getattr(doc, "bootstrap", None)))
+
+    counts = dict()
+    if cache is not None:
+        counts["cache"] = (cache.hits, cache.misses)
+    if profiler.enabled:
+        counts["profile"] = (profiler.get_stages(), profiler.files)
+    counts["memos"] = {type(p).__name__ : (p.memo.hits, p.memo.misses, p.memo.pop_added() if p.memo.added is not None else {})
+                       for p in _worker["memo_processors"]}
+
+    return results, counts
+
+############################
+
+def analyze_parallel(batches, importer, processors, finder, jobs, stream=False, cache=None, segmenter=None,
+                     profiler=NULL_PROFILER, collect_memos=False, sampler=None):
+    """
+    Analyze batches of files with a pool of worker processes.
+    Only the stats tables (of documents and segments) and bootstrap results are sent back to the main process.
+    Cache hits and misses, profiles and memo hits and misses of the workers
+    are added to the given cache, profiler and processors.
+    If collect_memos is True, new memo entries of the workers are added to the memos of the processors.
+    Input: List of batches, importer, list of processors, FeatureFinder, number of processes,
+           stream mode, FeatureCache, Segmenter, Profiler, whether to collect memo entries
+           and Resampler
+    Output: Generator of (batch, results) pairs in input order
+    """
+    memo_processors = {type(p).__name__ : p for p in get_memo_processors(importer, processors)}
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(importer, processors, finder, stream, cache, segmenter,
+                                       profiler.enabled, collect_memos, sampler)) as executor:
+        for batch, (results, counts) in zip(batches, executor.map(analyze_batch, batches)):
+            if "cache" in counts:
+                cache.hits += counts["cache"][0]
+                cache.misses += counts["cache"][1]
+            if "profile" in counts:
+                profiler.merge(*counts["profile"])
+            for name, (hits, misses, added) in counts["memos"].items():
+                memo = memo_processors[name].memo
+                memo.hits += hits
+                memo.misses += misses
+                memo.update(added)
+            yield batch, results
+
+############################
@@ -0,0 +1,204 @@
+'''
+Module to compute features for segments of a document,
+either for sliding windows of sentences or words or
+for the values of a structural column like page.
+'''
+
+import os
+from collections import deque
+from corpus import Doc
+
+############################
+
+class Segmenter(object):
+
+    units = ["sentences", "words"]
+
+    #Meta columns of the segment results
+    columns = ["file", "segment", "start", "end"]
+
+    ###############################
+
+    def __init__(self, finder, size=0, stride=0, unit="sentences", column=None):
+        """
+        Input: FeatureFinder, window size and stride (in sentences or words),
+               unit of size and stride, or column to segment by its values
+        """
+        self.finder = finder
+        self.size = size
+        self.stride = stride if stride > 0 else size
+        self.unit = unit
+        self.column = column
+
+    ###############################
+
+    def find_features(self, doc, sentences):
+        """
+        Compute the features of the whole document and of its segments in one pass.
+        The feature table of the document and the list of segments are stored in the doc object.
+        Each segment is a Doc object with feature table, number of sentences and
+        the numbers of the first and last sentence (starting at 1).
+        Input: Doc object and iterable of Sentence objects
+        Output: Doc object
+        """
+        doc.feat_table = dict()
+        doc.n_sents = 0
+        doc.segments = list()
+
+        if self.column:
+            segments = self.get_column_segments(doc)
+        else:
+            segments = self.get_windows(doc)
+        next(segments)
+
+        for sent in self.finder.iter_features(sentences):
+            self.finder.add_feat_table(doc.feat_table, sent.feat_table)
+            doc.n_sents += 1
+            segments.send(sent)
+
+        segments.close()
+
+        return doc
+
+    ###############################
+
+    def get_size(self, sent):
+        """
+        Return the size of a sentence in the window unit.
+        """
+        if self.unit == "words":
+            return sum(length * count for length, count in sent.feat_table["sent_len_no_punct"].items())
+        return 1
+
+    ###############################
+
+    def make_segment(self, doc, feat_table, n_sents, start, end):
+        """
+        Create a segment of the document.
+        Input: Doc object, feature table, number of sentences, number of first and last sentence
+        Output: Doc object
+        """
+        segment = Doc(doc.filename)
+        segment.feat_table = dict()
+        self.finder.add_feat_table(segment.feat_table, feat_table)
+        segment.n_sents = n_sents
+        segment.start = start
+        segment.end = end
+        return segment
+
+    ###############################
+
+    def get_windows(self, doc):
+        """
+        Coroutine that receives the sentences of the document with their feature tables
+        and adds a segment to the doc for every window.
+        The counts of the window are updated when sentences enter or leave the window.
+        Windows consist of complete sentences: a window ends with the sentence that
+        reaches the window size and moves on by at least stride units.
+        If the document is smaller than one window, the whole document is one segment.
+        Input: Doc object
+        """
+        window = deque()
+        feat_table = dict()
+        size = 0
+        skip = 0
+        n_sent = 0
+
+        try:
+            while True:
+                sent = yield
+                n_sent += 1
+                sent_size = self.get_size(sent)
+
+                #Sentence between two windows (if stride > size)
+                if skip > 0:
+                    skip -= sent_size
+                    continue
+
+                window.append((n_sent, sent.feat_table, sent_size))
+                self.finder.add_feat_table(feat_table, sent.feat_table)
+                size += sent_size
+
+                while window and size >= self.size:
+                    doc.segments.append(self.make_segment(doc, feat_table, len(window),
+                                                          window[0][0], window[-1][0]))
+
+                    #Move window
+                    removed = 0
+                    while window and removed < self.stride:
+                        _, old_table, old_size = window.popleft()
+                        self.finder.subtract_feat_table(feat_table, old_table)
+                        size -= old_size
+                        removed += old_size
+                    skip = self.stride - removed
+
+        except GeneratorExit:
+            #Document is smaller than one window
+            if not doc.segments and window:
+                doc.segments.append(self.make_segment(doc, feat_table, len(window),
+                                                      window[0][0], window[-1][0]))
+
+    ###############################
+
+    def get_column_segments(self, doc):
+        """
+        Coroutine that receives the sentences of the document with their feature tables
+        and adds a segment to the doc for every sequence of sentences with the same value
+        in the segment column. The value of a sentence is the value of its first token.
+        Input: Doc object
+        """
+        feat_table = dict()
+        value = None
+        n_sents = 0
+        n_sent = 0
+
+        try:
+            while True:
+                sent = yield
+                n_sent += 1
+
+                if sent.tokens:
+                    sent_value = getattr(sent.tokens[0], self.column, "_")
+                else:
+                    sent_value = value
+
+                #New value = new segment
+                if n_sents and sent_value != value:
+                    segment = self.make_segment(doc, feat_table, n_sents, n_sent - n_sents, n_sent - 1)
+                    segment.value = value
+                    doc.segments.append(segment)
+                    feat_table = dict()
+                    n_sents = 0
+
+                value = sent_value
+                self.finder.add_feat_table(feat_table, sent.feat_table)
+                n_sents += 1
+
+        except GeneratorExit:
+            if n_sents:
+                segment = self.make_segment(doc, feat_table, n_sents, n_sent - n_sents + 1, n_sent)
+                segment.value = value
+                doc.segments.append(segment)
+
+    ###############################
+
+    def get_results(self, doc):
+        """
+        Compute the statistics of all segments of the document.
+        Segments without words are skipped.
+        Input: Doc object with segments
+        Output: Dictionary of (filename, segment number) : stats_table
+        """
+        results = dict()
+        for i, segment in enumerate(doc.segments, 1):
+            if not self.finder.has_words(segment):
+                continue
+            segment = self.finder.compute_stats(segment)
+            segment.stats_table["file"] = os.path.splitext(doc.filename)[0]
+            segment.stats_table["segment"] = getattr(segment, "value", i)
+            segment.stats_table["start"] = segment.start
+            segment.stats_table["end"] = segment.end
+            results[(doc.filename, i)] = segment.stats_table
+        return results
+
+############################
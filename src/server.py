@@ -0,0 +1,261 @@
+'''
+Module to score documents with a long-running server.
+Importer, processors and FeatureFinder are loaded once
+and documents are sent as CoNLL-U (Plus) text over HTTP,
+either on a local port or on a Unix socket.
+'''
+
+import os
+import stat
+import json
+import signal
+import socket
+import socketserver
+from urllib.parse import urlparse, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import runner
+
+############################
+
+class Scorer(object):
+
+    def __init__(self, importer, processors, finder):
+        """
+        Input: Importer, list of processors and FeatureFinder
+        """
+        self.importer = importer
+        self.processors = processors
+        self.finder = finder
+
+    #####################
+
+    def get_settings(self):
+        """
+        Output: Dictionary with importer, processors, features and weights
+        """
+        return {"importer" : type(self.importer).__name__,
+                "processors" : [type(p).__name__ for p in self.processors],
+                "engine" : self.finder.engine,
+                "features" : self.finder.stats,
+                "weights" : self.finder.weights}
+
+    #####################
+
+    def score(self, documents):
+        """
+        Compute the features of each document, scale them across the batch
+        and calculate the orality scores.
+        Documents that cannot be analyzed get an error message
+        and do not stop the analysis of the other documents.
+        Input: List of dictionaries with name and text of each document
+        Output: List of result dictionaries in the same order
+        """
+        results = dict()
+        entries = list()
+
+        for i, document in enumerate(documents):
+            name = str(document.get("name", "document_{0}".format(i)))
+            entry = {"name" : name}
+            entries.append(entry)
+
+            text = document.get("text", None)
+            if not isinstance(text, str):
+                entry["error"] = "Missing text."
+                continue
+
+            try:
+                doc = runner.analyze_file(name, self.importer, self.processors, self.finder,
+                                          data=text.encode("utf-8"))
+            except Exception as e:
+                entry["error"] = "Cannot analyze document: {0}".format(e)
+                continue
+
+            if doc is None:
+                entry["error"] = "Cannot import document or document does not contain any words."
+                continue
+
+            entry["sentences"] = doc.n_sents
+            entry["features"] = {feat : doc.stats_table[feat] for feat in self.finder.stats}
+            results[i] = doc.stats_table
+
+        #Scale within the batch and calculate the scores
+        scaled_results = self.finder.calculate_score(self.finder.scale_feature_values(results))
+        for i, stats_table in scaled_results.items():
+            entries[i]["scaled"] = {feat : stats_table[feat] for feat in self.finder.stats}
+            entries[i]["orality_score"] = stats_table["orality_score"]
+
+        return entries
+
+############################
+
+class ScoringHandler(BaseHTTPRequestHandler):
+
+    #Set by make_server
+    scorer = None
+
+    #Maximum size of a request body in bytes
+    max_size = 64 * 1024**2
+
+    #Seconds to wait for a client, so that a slow client cannot block the server
+    timeout = 30
+
+    #####################
+
+    def address_string(self):
+        #Clients of Unix sockets have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    #####################
+
+    def send_json(self, status, content):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #####################
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, dict(status="ok", **self.scorer.get_settings()))
+        else:
+            self.send_json(404, {"error" : "Unknown path. Use /health or /score."})
+
+    #####################
+
+    def do_POST(self):
+        """
+        Score one or more documents sent to /score.
+        JSON requests contain {"documents" : [{"name" : ..., "text" : ...}, ...]}
+        or a single {"name" : ..., "text" : ...}.
+        Other requests contain the text of a single document,
+        which can be named with ?name=...
+        """
+        url = urlparse(self.path)
+        if url.path != "/score":
+            self.send_json(404, {"error" : "Unknown path. Use /health or /score."})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_json(411, {"error" : "Missing Content-Length."})
+            return
+
+        if length < 0:
+            self.send_json(400, {"error" : "Invalid Content-Length."})
+            return
+
+        if length > self.max_size:
+            self.send_json(413, {"error" : "Request is larger than {0} bytes.".format(self.max_size)})
+            return
+
+        try:
+            body = self.rfile.read(length)
+        except TimeoutError:
+            self.send_json(408, {"error" : "Request timed out."})
+            return
+
+        if len(body) < length:
+            self.send_json(400, {"error" : "Request body is shorter than Content-Length."})
+            return
+
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            self.send_json(400, {"error" : "Request is not UTF-8 encoded."})
+            return
+
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                request = json.loads(text)
+            except ValueError as e:
+                self.send_json(400, {"error" : "Invalid JSON: {0}".format(e)})
+                return
+            if isinstance(request, dict) and "documents" in request:
+                documents = request["documents"]
+            else:
+                documents = [request]
+            if not isinstance(documents, list) or not all(isinstance(d, dict) for d in documents):
+                self.send_json(400, {"error" : "Documents must be objects with name and text."})
+                return
+        else:
+            name = parse_qs(url.query).get("name", ["document"])[0]
+            documents = [{"name" : name, "text" : text}]
+
+        if not documents:
+            self.send_json(400, {"error" : "No documents."})
+            return
+
+        try:
+            results = self.scorer.score(documents)
+        except Exception as e:
+            self.send_json(500, {"error" : "Cannot score documents: {0}".format(e)})
+            return
+
+        #Unprocessable if none of the documents could be analyzed
+        if all("error" in entry for entry in results):
+            self.send_json(422, {"results" : results})
+        else:
+            self.send_json(200, {"results" : results})
+
+############################
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+
+    def get_request(self):
+        request, _ = super().get_request()
+        #Clients of Unix sockets have no address
+        return request, ""
+
+############################
+
+def make_server(scorer, host="127.0.0.1", port=8080, socket_file=None, max_size=64*1024**2, timeout=30):
+    """
+    Create a server that handles one request at a time.
+    Input: Scorer, host and port or filename of a Unix socket,
+           maximum size of a request in bytes and timeout in seconds (0 = no timeout)
+    Output: Server object
+    """
+    handler = type("Handler", (ScoringHandler,), {"scorer" : scorer, "max_size" : max_size,
+                                                  "timeout" : timeout if timeout > 0 else None})
+
+    if socket_file is not None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("Unix sockets are not supported on this platform.")
+        #Remove socket of an earlier run
+        if os.path.exists(socket_file):
+            if not stat.S_ISSOCK(os.stat(socket_file).st_mode):
+                raise OSError("{0} exists and is not a socket.".format(socket_file))
+            os.unlink(socket_file)
+        return UnixHTTPServer(socket_file, handler)
+
+    return HTTPServer((host, port), handler)
+
+############################
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+############################
+
+def serve(server):
+    """
+    Handle requests until interrupted (Ctrl+C or SIGTERM).
+    Input: Server object
+    """
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(server, UnixHTTPServer) and os.path.exists(server.server_address):
+            os.unlink(server.server_address)
+
+############################
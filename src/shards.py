@@ -0,0 +1,182 @@
+'''
+Module to split an analysis into shards that run on different machines.
+Each shard analyzes a fixed subset of the input files and saves the original
+values of its documents (and segments) together with the min and max value
+of each feature. The merge command combines all shards and scales and scores
+the results as if all files had been analyzed at once.
+'''
+
+import os
+import json
+import zlib
+import inputs
+
+############################
+
+def get_shard_name(shard, n_shards):
+    return "shard_{0}_of_{1}".format(shard, n_shards)
+
+############################
+
+def in_shard(file, shard, n_shards):
+    """
+    Files are assigned to shards by a hash of their name,
+    so the assignment does not depend on the folder or order of the files.
+    Input: Filename (including path), number of the shard (1 to n_shards) and number of shards
+    Output: True if the file belongs to the shard, False otherwise.
+    """
+    return zlib.crc32(inputs.get_filename(file).encode("utf-8")) % n_shards == shard - 1
+
+############################
+
+def get_partial_ranges(results, stats):
+    """
+    Input: Dictionary of stats tables and list of features
+    Output: Dictionary of feature : [min value, max value] or None if there are no values
+    """
+    ranges = dict()
+    for feat in stats:
+        vals = [stats_table[feat] for stats_table in results.values() if not stats_table[feat] == None]
+        ranges[feat] = [min(vals), max(vals)] if vals else None
+    return ranges
+
+############################
+
+def merge_ranges(partial_ranges, stats):
+    """
+    Input: List of dictionaries of partial ranges and list of features
+    Output: Dictionary of feature : (min value, max value)
+    """
+    ranges = dict()
+    for feat in stats:
+        parts = [part[feat] for part in partial_ranges if part.get(feat) is not None]
+        if parts:
+            ranges[feat] = (min(part[0] for part in parts), max(part[1] for part in parts))
+        else:
+            ranges[feat] = (0, 0)
+    return ranges
+
+############################
+
+class ShardWriter(object):
+
+    def __init__(self, outdir, shard, n_shards):
+        """
+        Write the original values of each document of a shard as soon as it is analyzed.
+        Input: Output folder, number of the shard and number of shards
+        """
+        self.file = os.path.join(outdir, get_shard_name(shard, n_shards))
+        self.shard = shard
+        self.n_shards = n_shards
+        self.outfile = open(self.file + ".jsonl", mode="w", encoding="utf-8")
+
+    #####################
+
+    def write(self, key, stats_table, segment=False):
+        """
+        Input: Filename (or filename and segment number) and stats table
+               and whether the results belong to a segment
+        """
+        row = {"segment" : segment, "key" : key, "stats" : stats_table}
+        self.outfile.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.outfile.flush()
+
+    #####################
+
+    def write_segments(self, segment_results):
+        for key, stats_table in segment_results.items():
+            self.write(key, stats_table, segment=True)
+
+    #####################
+
+    def close(self, finder, results, segment_results, **settings):
+        """
+        Save the settings and min and max values of the shard.
+        The shard is complete when this file exists.
+        Input: FeatureFinder, dictionary of stats tables of documents and segments
+               and settings of the analysis
+        """
+        self.outfile.close()
+
+        summary = {"shard" : self.shard,
+                   "shards" : self.n_shards,
+                   "files" : len(results),
+                   "segments" : len(segment_results),
+                   "features" : finder.stats,
+                   "weights" : finder.weights,
+                   "scaling" : finder.scaling}
+        summary.update(settings)
+        summary["ranges"] = get_partial_ranges(results, finder.stats)
+        summary["segment_ranges"] = get_partial_ranges(segment_results, finder.stats)
+
+        with open(self.file + ".json", mode="w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+############################
+
+def find_shards(paths):
+    """
+    Input: List of shard folders or summary files (shard_i_of_N.json)
+    Output: List of summary files
+    """
+    files = list()
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.startswith("shard_") and f.endswith(".json"))
+        elif path.endswith(".json"):
+            files.append(path)
+    return files
+
+############################
+
+def read_shards(paths):
+    """
+    Read and check the summaries and results of all shards.
+    Input: List of shard folders or summary files
+    Output: Settings, dictionary of stats tables of documents and segments
+            and lists of partial ranges of documents and segments (or None if shards are missing)
+    """
+    summaries = dict()
+    for file in find_shards(paths):
+        try:
+            with open(file, mode="r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            print("ERROR: Cannot read shard {0}.".format(file))
+            return None
+        summary["file"] = os.path.splitext(file)[0] + ".jsonl"
+        summaries[summary["shard"]] = summary
+
+    if not summaries:
+        print("ERROR: No complete shards found.")
+        return None
+
+    settings = summaries[min(summaries)]
+    n_shards = settings["shards"]
+    missing = [str(i) for i in range(1, n_shards+1) if not i in summaries]
+    if missing:
+        print("ERROR: Shards {0} of {1} are missing or incomplete.".format(", ".join(missing), n_shards))
+        return None
+
+    for summary in summaries.values():
+        for key in ["shards", "features", "weights", "scaling", "reproduce_kajuk", "processors", "segment_columns"]:
+            if summary.get(key) != settings.get(key):
+                print("ERROR: Shard {0} was analyzed with other settings ({1}).".format(summary["shard"], key))
+                return None
+
+    results, segment_results = dict(), dict()
+    for i in sorted(summaries):
+        with open(summaries[i]["file"], mode="r", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if row["segment"]:
+                    segment_results[tuple(row["key"])] = row["stats"]
+                else:
+                    results[row["key"]] = row["stats"]
+
+    return settings, results, segment_results, \
+           [summaries[i]["ranges"] for i in sorted(summaries)], \
+           [summaries[i]["segment_ranges"] for i in sorted(summaries)]
+
+############################
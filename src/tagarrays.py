@@ -0,0 +1,222 @@
+'''
+Module to represent the annotations of a document as NumPy arrays.
+XPOS tags and lemmas are integer-coded, word forms are represented by their length
+and sentence boundaries are stored as offsets into the token arrays.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+############################
+
+#STTS tagset (Schiller et al. 1999)
+STTS = ["ADJA", "ADJD", "ADV", "APPR", "APPRART", "APPO", "APZR", "ART", "CARD", "FM", "ITJ",
+        "KOUI", "KOUS", "KON", "KOKOM", "NN", "NE", "PDS", "PDAT", "PIS", "PIAT", "PIDAT",
+        "PPER", "PPOSS", "PPOSAT", "PRELS", "PRELAT", "PRF", "PWS", "PWAT", "PWAV", "PAV", "PROAV",
+        "PTKZU", "PTKNEG", "PTKVZ", "PTKANT", "PTKA", "TRUNC", "VVFIN", "VVIMP", "VVINF", "VVIZU",
+        "VVPP", "VAFIN", "VAIMP", "VAINF", "VAPP", "VMFIN", "VMINF", "VMPP", "XY", "$,", "$.", "$(", "_"]
+
+#Lemmas that are relevant for the features, all other lemmas are coded as 0
+LEMMAS = {"ich" : 1, "wir" : 2, "dies" : 3, "diese" : 4, "der" : 5, "die" : 6}
+
+#Sentence types coded for tokens with XPOS $.
+NO_TYPE, QUESTION, EXCLAMATION, NORMAL = 0, 1, 2, 3
+
+############################
+
+class TagVocabulary(object):
+
+    def __init__(self, tags=STTS):
+        self.tags = list()
+        self.codes = dict()
+        for tag in tags:
+            self.encode(tag)
+
+    #####################
+
+    def __len__(self):
+        return len(self.tags)
+
+    #####################
+
+    def encode(self, tag):
+        """
+        Return the code of the tag.
+        Tags that are not in the vocabulary yet are added.
+        Input: Tag
+        Output: Integer code
+        """
+        code = self.codes.get(tag)
+        if code is None:
+            code = len(self.tags)
+            self.codes[tag] = code
+            self.tags.append(tag)
+        return code
+
+    #####################
+
+    def encode_all(self, tags):
+        """
+        Input: List of tags
+        Output: Array of integer codes
+        """
+        codes = self.codes
+        return np.array([codes[tag] if tag in codes else self.encode(tag) for tag in tags], dtype=np.int32)
+
+    #####################
+
+    def table(self, func):
+        """
+        Evaluate a condition for every tag of the vocabulary.
+        Indexing the result with an array of codes gives the value for each token.
+        Input: Function that takes a tag and returns True or False
+        Output: Boolean array with one value per tag
+        """
+        return np.array([func(tag) for tag in self.tags], dtype=bool)
+
+############################
+
+class DocArrays(object):
+
+    def __init__(self, xpos, lemma, length, upos_punct, sent_type, offsets):
+        self.xpos = xpos
+        self.lemma = lemma
+        self.length = length
+        self.upos_punct = upos_punct
+        self.sent_type = sent_type
+        self.offsets = offsets
+        self.n_toks = len(xpos)
+        self.n_sents = len(offsets) - 1
+
+    #####################
+
+    @classmethod
+    def from_sentences(cls, sentences, vocab):
+        """
+        Convert the relevant columns of the sentences into arrays.
+        Input: Iterable of Sentence objects and TagVocabulary for XPOS tags
+        Output: DocArrays object
+        """
+        tokens = list()
+        offsets = [0]
+        for sent in sentences:
+            tokens.extend(sent.tokens)
+            offsets.append(len(tokens))
+
+        xpos = [tok.XPOS for tok in tokens]
+        sent_type = [get_sentence_type(tok.FORM) if tag == "$." else NO_TYPE
+                     for tok, tag in zip(tokens, xpos)]
+
+        return cls(vocab.encode_all(xpos),
+                   np.array([LEMMAS.get(tok.LEMMA, 0) for tok in tokens], dtype=np.int8),
+                   np.array([len(tok.FORM) for tok in tokens], dtype=np.int32),
+                   np.array([getattr(tok, "UPOS", None) == "PUNCT" for tok in tokens], dtype=bool),
+                   np.array(sent_type, dtype=np.int8),
+                   np.array(offsets, dtype=np.int64))
+
+    #####################
+
+    @classmethod
+    def from_columns(cls, xpos, lemma, form, upos, offsets, vocab):
+        """
+        Convert integer-coded columns into arrays.
+        Each column is given as an array of codes and the list of strings of the codes,
+        so every string only has to be looked at once.
+        Missing columns (None) are treated like columns without relevant values.
+        Input: (codes, strings) for XPOS, LEMMA, FORM and UPOS, array of sentence offsets
+               and TagVocabulary for XPOS tags
+        Output: DocArrays object
+        """
+        xpos_codes, xpos_strings = xpos
+        form_codes, form_strings = form
+        n_toks = len(xpos_codes)
+
+        if lemma is None:
+            lemma = np.zeros(n_toks, dtype=np.int8)
+        else:
+            lemma = np.array([LEMMAS.get(s, 0) for s in lemma[1]], dtype=np.int8)[lemma[0]]
+
+        if upos is None:
+            upos_punct = np.zeros(n_toks, dtype=bool)
+        else:
+            upos_punct = np.array([s == "PUNCT" for s in upos[1]], dtype=bool)[upos[0]]
+
+        final = np.array([tag == "$." for tag in xpos_strings], dtype=bool)[xpos_codes]
+        types = np.array([get_sentence_type(s) for s in form_strings], dtype=np.int8)[form_codes]
+
+        return cls(vocab.encode_all(xpos_strings)[xpos_codes],
+                   lemma,
+                   np.array([len(s) for s in form_strings], dtype=np.int32)[form_codes],
+                   upos_punct,
+                   np.where(final, types, NO_TYPE).astype(np.int8),
+                   offsets)
+
+    #####################
+
+    def sentence_sums(self, values):
+        """
+        Add up the values of each sentence.
+        Input: Array with one value per token
+        Output: Array with one sum per sentence
+        """
+        lengths = np.diff(self.offsets)
+        nonempty = lengths > 0
+        sums = np.zeros(self.n_sents, dtype=np.int64)
+        if nonempty.any():
+            sums[nonempty] = np.add.reduceat(values.astype(np.int64), self.offsets[:-1][nonempty])
+        return sums
+
+    #####################
+
+    def sentence_first(self, mask):
+        """
+        Find the first token of each sentence for which mask is True.
+        Input: Boolean array with one value per token
+        Output: Array with one token index per sentence (-1 if there is none)
+        """
+        first = np.full(self.n_sents, -1, dtype=np.int64)
+        lengths = np.diff(self.offsets)
+        nonempty = lengths > 0
+        if nonempty.any():
+            positions = np.where(mask, np.arange(self.n_toks), self.n_toks)
+            firsts = np.minimum.reduceat(positions, self.offsets[:-1][nonempty])
+            firsts[firsts == self.n_toks] = -1
+            first[nonempty] = firsts
+        return first
+
+    #####################
+
+    def sentence_last(self, mask):
+        """
+        Find the last token of each sentence for which mask is True.
+        Input: Boolean array with one value per token
+        Output: Array with one token index per sentence (-1 if there is none)
+        """
+        last = np.full(self.n_sents, -1, dtype=np.int64)
+        lengths = np.diff(self.offsets)
+        nonempty = lengths > 0
+        if nonempty.any():
+            positions = np.where(mask, np.arange(self.n_toks), -1)
+            last[nonempty] = np.maximum.reduceat(positions, self.offsets[:-1][nonempty])
+        return last
+
+############################
+
+def get_sentence_type(form):
+    """
+    Determine the sentence type signalled by sentence-final punctuation.
+    Input: Word form of a token with XPOS $.
+    Output: Sentence type code
+    """
+    if "?" in form:
+        return QUESTION
+    elif "!" in form:
+        return EXCLAMATION
+    elif "." in form or ":" in form:
+        return NORMAL
+    else:
+        return NO_TYPE
+
+############################
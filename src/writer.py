@@ -0,0 +1,184 @@
+'''
+Module to write result tables row by row.
+Results can be written as tab-separated values (default),
+JSON Lines or Parquet (requires pyarrow).
+'''
+
+import os
+import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+############################
+
+class Writer(object):
+
+    #Extension of the output file
+    extension = ""
+
+    def __init__(self, file, columns, numeric=[], flush_rows=False):
+        """
+        Input: Filename without extension, list of columns,
+               list of columns with numeric values and whether
+               each row is written to disk immediately
+        """
+        self.file = file + self.extension
+        self.columns = list(columns)
+        self.numeric = set(numeric)
+        self.flush_rows = flush_rows
+
+    #####################
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    #####################
+
+    def flush(self):
+        pass
+
+    #####################
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+############################
+
+class TSVWriter(Writer):
+
+    extension = ".csv"
+
+    def __init__(self, file, columns, numeric=[], flush_rows=False):
+        """
+        Write rows as tab-separated values with a header line.
+        Rows are buffered and written in blocks unless flush_rows is True.
+        """
+        super().__init__(file, columns, numeric, flush_rows)
+        self.outfile = open(self.file, mode="w", encoding="utf-8", buffering=1024*1024)
+        self.outfile.write("\t".join(self.columns) + "\n")
+
+    def write_row(self, row):
+        self.outfile.write("\t".join([str(row[col]) for col in self.columns]) + "\n")
+        if self.flush_rows:
+            self.outfile.flush()
+
+    def flush(self):
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+############################
+
+class JSONLWriter(Writer):
+
+    extension = ".jsonl"
+
+    def __init__(self, file, columns, numeric=[], flush_rows=False):
+        """
+        Write each row as a JSON object on one line.
+        Missing values are written as null.
+        Rows are buffered and written in blocks unless flush_rows is True.
+        """
+        super().__init__(file, columns, numeric, flush_rows)
+        self.outfile = open(self.file, mode="w", encoding="utf-8", buffering=1024*1024)
+
+    def write_row(self, row):
+        self.outfile.write(json.dumps({col : row[col] for col in self.columns}, ensure_ascii=False) + "\n")
+        if self.flush_rows:
+            self.outfile.flush()
+
+    def flush(self):
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+############################
+
+class ParquetWriter(Writer):
+
+    extension = ".parquet"
+
+    #Number of rows per row group
+    group_size = 10000
+
+    def __init__(self, file, columns, numeric=[], flush_rows=False):
+        """
+        Write rows as Parquet file with one column per result column.
+        Numeric columns are stored as float64, all other columns as strings.
+        Rows are collected and written as row groups.
+        The file can only be read after it has been closed,
+        so get_writer does not use Parquet for rows that are written immediately.
+        """
+        super().__init__(file, columns, numeric, flush_rows)
+        self.schema = pyarrow.schema([(col, pyarrow.float64() if col in self.numeric else pyarrow.string())
+                                      for col in self.columns])
+        self.outfile = pyarrow.parquet.ParquetWriter(self.file, self.schema)
+        self.rows = list()
+
+    def write_row(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        data = dict()
+        for col in self.columns:
+            if col in self.numeric:
+                data[col] = [row[col] for row in self.rows]
+            else:
+                data[col] = [None if row[col] is None else str(row[col]) for row in self.rows]
+        self.outfile.write_table(pyarrow.table(data, schema=self.schema))
+        self.rows = list()
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+############################
+
+writers = {"tsv" : TSVWriter, "jsonl" : JSONLWriter, "parquet" : ParquetWriter}
+
+############################
+
+def get_format(name):
+    """
+    Input: Name of the output format
+    Output: Name of an available output format
+    """
+    if name == "parquet" and pyarrow is None:
+        print("WARNING: pyarrow is not installed. Writing tsv instead of parquet.")
+        return "tsv"
+    elif not name in writers:
+        print("WARNING: Output format {0} is not available. Writing tsv instead.".format(name))
+        return "tsv"
+    return name
+
+############################
+
+def get_writer(output_format, file, columns, numeric=[], flush_rows=False):
+    """
+    Input: Name of the output format, filename without extension,
+           list of columns, list of numeric columns
+           and whether each row is written to disk immediately
+    Output: Writer object
+    """
+    #Parquet files have no footer until they are closed,
+    #so rows that must be kept after a crash are written as JSON Lines
+    if flush_rows and output_format == "parquet":
+        print("WARNING: Parquet files can only be read after they are complete. Writing {0} as jsonl instead.".format(os.path.basename(file)))
+        output_format = "jsonl"
+    return writers[output_format](file, columns, numeric, flush_rows)
+
+############################